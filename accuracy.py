@@ -0,0 +1,180 @@
+import re
+import json
+import sqlite3
+import argparse
+import numpy as np
+
+# Reference-based accuracy: the final numeric answer of each model answer is compared with
+# the numeric value of the dataset's reference answer (e.g. the answer field of
+# orca-math-word-problems). Extraction is done once per answer, the comparison with a numeric
+# tolerance is vectorized over all the answers at once.
+
+_NUMBER = r'-?\d[\d,]*(?:\.\d+)?|-?\.\d+'
+_NUMBER_PATTERN = re.compile(rf'({_NUMBER})(?:\s*/\s*({_NUMBER}))?(\s*%)?')
+_BOXED_PATTERN = re.compile(r'\\boxed\{((?:[^{}]|\{[^{}]*\})*)\}')
+_FRACTION_PATTERN = re.compile(r'\\[dt]?frac\{([^{}]*)\}\{([^{}]*)\}')
+# Markers of the final answer. The explicit ones ("the answer is 42", "final answer: 42") are
+# followed by the answer; the looser ones ("so", "therefore", "thus") start the sentence of the
+# conclusion, whose result is after its last "=" or is its last number.
+_ANSWER_MARKER_PATTERN = re.compile(r'\bfinal answer|\banswer is|\banswer:|\bresult is', re.IGNORECASE)
+_CONCLUSION_MARKER_PATTERN = re.compile(r'\btherefore\b|\bthus\b|\bso\b', re.IGNORECASE)
+# End of a sentence: a period, ! or ? followed by a capital letter or the end of the text (not
+# the dot of 2.5 or i.e. 2.5), or a line break
+_SENTENCE_END_PATTERN = re.compile(r'[.!?](?=\s+[A-Z]|\s*$)|\n')
+
+
+def _to_number(match):
+    numerator = float(match.group(1).replace(',', ''))
+    if match.group(2):
+        denominator = float(match.group(2).replace(',', ''))
+        if denominator == 0:
+            return None
+        numerator /= denominator
+    return numerator
+
+
+def _last_number(text):
+    value = None
+    for match in _NUMBER_PATTERN.finditer(text):
+        try:
+            value = _to_number(match)
+        except ValueError:
+            continue
+    return value
+
+
+def _first_number(text):
+    for match in _NUMBER_PATTERN.finditer(text):
+        try:
+            return _to_number(match)
+        except ValueError:
+            continue
+    return None
+
+
+# Text from a marker to the end of its sentence
+def _sentence_after(text, marker):
+    end = _SENTENCE_END_PATTERN.search(text, marker.end())
+    return text[marker.end():end.start() if end else len(text)]
+
+
+# Result of a sentence: the number after its last "=" ("3 + 4 = 7"), or the number chosen by
+# fallback (the first one after an explicit marker, the last one after a looser one)
+def _sentence_result(sentence, fallback):
+    if '=' in sentence:
+        value = _first_number(sentence[sentence.rindex('=') + 1:])
+        if value is not None:
+            return value
+    return fallback(sentence)
+
+
+# Final numeric answer of a text, or None: the last \boxed{...} value, else the answer following
+# the last "answer is" / "final answer", else the result of the last sentence starting with
+# "so" / "therefore" / "thus", else the last number of the text.
+# Thousands separators, simple fractions (3/4, \frac{3}{4}) and percentages (as written) are handled.
+def extract_final_number(text):
+    if text is None:
+        return None
+    if not isinstance(text, str):
+        text = str(text)
+    text = _FRACTION_PATTERN.sub(lambda match: f"{match.group(1)}/{match.group(2)}", text)
+    boxed = _BOXED_PATTERN.findall(text)
+    if boxed:
+        value = _last_number(boxed[-1])
+        if value is not None:
+            return value
+    for pattern, fallback in ((_ANSWER_MARKER_PATTERN, _first_number), (_CONCLUSION_MARKER_PATTERN, _last_number)):
+        markers = list(pattern.finditer(text))
+        if markers:
+            value = _sentence_result(_sentence_after(text, markers[-1]), fallback)
+            if value is not None:
+                return value
+    return _last_number(text)
+
+
+# Vectorized comparison of the predicted and reference values (NaN for missing values, never correct)
+def score_answers(predicted, reference, rel_tol=1e-4, abs_tol=1e-6):
+    predicted = np.asarray(predicted, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    return np.isclose(predicted, reference, rtol=rel_tol, atol=abs_tol) & ~np.isnan(reference)
+
+
+# Create the accuracy table (called from the migrations)
+def initialize_accuracy_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS answer_accuracy (question_id INTEGER, model TEXT, predicted REAL, reference REAL, correct INTEGER, PRIMARY KEY(question_id, model), FOREIGN KEY(question_id) REFERENCES questions(id))''')
+
+
+# Score the stored answers of the questions that have a reference answer and store the results
+# in answer_accuracy. Returns {model: (correct, scored)}.
+def compute_accuracy(db_name="db_compare_models.db", models=None, question_ids=None, rel_tol=1e-4, abs_tol=1e-6):
+    conn = sqlite3.connect(db_name)
+    sql = '''SELECT answers.question_id, answers.model, answers.answer, questions.reference_answer
+        FROM answers JOIN questions ON questions.id = answers.question_id
+        WHERE questions.reference_answer IS NOT NULL'''
+    params = []
+    if models:
+        sql += f" AND answers.model IN ({', '.join('?' for _ in models)})"
+        params.extend(models)
+    if question_ids is not None:
+        question_ids = list(question_ids)
+        if not question_ids:
+            conn.close()
+            return {}
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS accuracy_questions (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM accuracy_questions")
+        conn.executemany("INSERT OR IGNORE INTO accuracy_questions (id) VALUES (?)", [(question_id,) for question_id in question_ids])
+        sql += " AND answers.question_id IN (SELECT id FROM accuracy_questions)"
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        conn.close()
+        return {}
+
+    references = {}
+    predicted = np.full(len(rows), np.nan)
+    reference = np.full(len(rows), np.nan)
+    for i, (question_id, model, answer, reference_answer) in enumerate(rows):
+        value = extract_final_number(json.loads(answer) if answer else None)
+        if value is not None:
+            predicted[i] = value
+        if question_id not in references:
+            references[question_id] = extract_final_number(reference_answer)
+        if references[question_id] is not None:
+            reference[i] = references[question_id]
+    correct = score_answers(predicted, reference, rel_tol, abs_tol)
+
+    def nullable(value):
+        return None if np.isnan(value) else float(value)
+
+    conn.executemany("INSERT OR REPLACE INTO answer_accuracy (question_id, model, predicted, reference, correct) VALUES (?, ?, ?, ?, ?)",
+                     [(question_id, model, nullable(predicted[i]), nullable(reference[i]), int(correct[i]))
+                      for i, (question_id, model, _, _) in enumerate(rows)])
+    conn.commit()
+    conn.close()
+
+    row_models = np.array([model for _, model, _, _ in rows])
+    scored = ~np.isnan(reference)
+    return {model: (int(correct[row_models == model].sum()), int(scored[row_models == model].sum()))
+            for model in dict.fromkeys(row_models.tolist())}
+
+
+def print_accuracy(results):
+    print("Reference accuracy:")
+    for model, (correct, scored) in results.items():
+        print(f"{model}: {correct}/{scored} ({100 * correct / scored:.1f}%)" if scored else f"{model}: no reference answer")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the stored answers against the reference answers of their questions.")
+    parser.add_argument("--db", default="db_compare_models.db", help="SQLite database (default: %(default)s)")
+    parser.add_argument("--models", help="Comma-separated models to score (default: all)")
+    parser.add_argument("--rel-tol", type=float, default=1e-4, help="Relative tolerance of the numeric comparison (default: %(default)s)")
+    parser.add_argument("--abs-tol", type=float, default=1e-6, help="Absolute tolerance of the numeric comparison (default: %(default)s)")
+    args = parser.parse_args()
+
+    models = [model.strip() for model in args.models.split(",")] if args.models else None
+    conn = sqlite3.connect(args.db)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(questions)")]
+    conn.close()
+    if "reference_answer" not in columns:
+        parser.exit(1, f"{args.db} has no reference answers, run run_model_comparison_analysis.py on a dataset first.\n")
+    print_accuracy(compute_accuracy(args.db, models, rel_tol=args.rel_tol, abs_tol=args.abs_tol))
@@ -0,0 +1,165 @@
+import math
+import sqlite3
+from collections import deque
+from itertools import combinations
+
+ELO_SCALE = 400 / math.log(10)
+ELO_BASE = 1000
+
+
+# Active sampling of judgments (Swiss-style): instead of judging every (question, pair, judge),
+# keep running Bradley-Terry estimates of the models and always pick the next judgments on the
+# pairs whose order is the most uncertain, until the confidence intervals settle.
+# - z is the confidence interval width in standard errors (1.96 for 95%)
+# - min_judgments judgments are always made before stopping
+# - the run stops when adjacent models in the ranking have separated confidence intervals, or
+#   when the widest confidence interval changed by less than stability_tol (relative) over the
+#   last stability_window judgments
+class ActiveJudgeSampler:
+    def __init__(self, models, judges, z=1.96, min_judgments=20, stability_window=50, stability_tol=0.02):
+        self.models = list(models)
+        self.judges = list(judges)
+        self.z = z
+        self.min_judgments = min_judgments
+        self.stability_window = stability_window
+        self.stability_tol = stability_tol
+        self.pairs = list(combinations(self.models, 2))
+        # wins[(a, b)] is the number of times a was preferred to b (ties count half for each)
+        self.wins = {(a, b): 0.0 for a in self.models for b in self.models if a != b}
+        self.judgments = 0
+        self.interval_history = deque(maxlen=stability_window + 1)
+        self._strengths = None
+        # Candidate judgments: {(judge, bot_a, bot_b): deque of question ids}
+        self._candidates = {}
+        self._picked = {}
+
+    # Add one judgment: winner is the preferred model, or None for a tie
+    def add_result(self, model_bot_a, model_bot_b, winner):
+        if (model_bot_a, model_bot_b) not in self.wins:
+            return
+        if winner == model_bot_a:
+            self.wins[(model_bot_a, model_bot_b)] += 1
+        elif winner == model_bot_b:
+            self.wins[(model_bot_b, model_bot_a)] += 1
+        else:
+            self.wins[(model_bot_a, model_bot_b)] += 0.5
+            self.wins[(model_bot_b, model_bot_a)] += 0.5
+        self.judgments += 1
+        self._strengths = None
+        self.interval_history.append(self.widest_interval())
+
+    # Seed the estimates with the judgments already stored in the comparisons table
+    def load_comparisons(self, db_name):
+        conn = sqlite3.connect(db_name)
+        placeholders = ", ".join("?" for _ in self.models)
+        rows = conn.execute(f"SELECT model_bot_a, model_bot_b, preferred_answer FROM comparisons WHERE model_bot_a IN ({placeholders}) AND model_bot_b IN ({placeholders})",
+                            self.models + self.models).fetchall()
+        conn.close()
+        for model_bot_a, model_bot_b, preferred_answer in rows:
+            self.add_result(model_bot_a, model_bot_b, preferred_answer)
+        return len(rows)
+
+    def _games(self, a, b):
+        return self.wins[(a, b)] + self.wins[(b, a)]
+
+    # Bradley-Terry strengths (log scale, mean 0) fitted with the MM algorithm.
+    # Half a win and half a loss between every pair act as a prior so that the fit always exists.
+    def strengths(self):
+        if self._strengths is not None:
+            return self._strengths
+        pi = {model: 1.0 for model in self.models}
+        for _ in range(200):
+            updated = {}
+            for i in self.models:
+                total_wins = sum(self.wins[(i, j)] + 0.5 for j in self.models if j != i)
+                denominator = sum((self._games(i, j) + 1) / (pi[i] + pi[j]) for j in self.models if j != i)
+                updated[i] = total_wins / denominator
+            mean_log = sum(math.log(value) for value in updated.values()) / len(updated)
+            updated = {model: value / math.exp(mean_log) for model, value in updated.items()}
+            converged = max(abs(updated[model] - pi[model]) for model in self.models) < 1e-9
+            pi = updated
+            if converged:
+                break
+        self._strengths = {model: math.log(value) for model, value in pi.items()}
+        return self._strengths
+
+    def _probability(self, strengths, a, b):
+        return 1 / (1 + math.exp(strengths[b] - strengths[a]))
+
+    # Standard error of each strength from the Fisher information of the fit
+    def standard_errors(self):
+        strengths = self.strengths()
+        errors = {}
+        for i in self.models:
+            information = 0.0
+            for j in self.models:
+                if j != i:
+                    p = self._probability(strengths, i, j)
+                    information += (self._games(i, j) + 1) * p * (1 - p)
+            errors[i] = 1 / math.sqrt(information)
+        return errors
+
+    # {model: (elo rating, confidence interval half-width)} sorted from best to worst
+    def ratings(self):
+        strengths = self.strengths()
+        errors = self.standard_errors()
+        ranked = sorted(self.models, key=lambda model: strengths[model], reverse=True)
+        return {model: (ELO_BASE + ELO_SCALE * strengths[model], ELO_SCALE * self.z * errors[model]) for model in ranked}
+
+    def widest_interval(self):
+        errors = self.standard_errors()
+        return max(errors.values()) * self.z
+
+    # Whether the ranking is settled (see the class comment)
+    def is_settled(self):
+        if self.judgments < self.min_judgments:
+            return False
+        strengths = self.strengths()
+        errors = self.standard_errors()
+        ranked = sorted(self.models, key=lambda model: strengths[model], reverse=True)
+        if all(strengths[a] - strengths[b] > self.z * math.sqrt(errors[a] ** 2 + errors[b] ** 2)
+               for a, b in zip(ranked, ranked[1:])):
+            return True
+        if len(self.interval_history) > self.stability_window:
+            oldest, newest = self.interval_history[0], self.interval_history[-1]
+            return abs(oldest - newest) <= self.stability_tol * oldest
+        return False
+
+    # Register a judgment that may be requested (the answers of both models exist)
+    def add_candidate(self, question_id, judge, model_bot_a, model_bot_b):
+        self._candidates.setdefault((judge, model_bot_a, model_bot_b), deque()).append(question_id)
+
+    def has_candidates(self):
+        return any(self._candidates.values())
+
+    # Pick the next k judgments as (question_id, judge, model_bot_a, model_bot_b).
+    # The pair with the largest expected information, p(1 - p) times the variance of the strength
+    # difference, is picked first; within a pair, the least used judge and presentation order are
+    # preferred so that judge and position biases stay balanced.
+    def next_judgments(self, k):
+        strengths = self.strengths()
+        errors = self.standard_errors()
+        variances = {model: errors[model] ** 2 for model in self.models}
+        picked = []
+        for _ in range(k):
+            best_pair, best_score = None, -1.0
+            for a, b in self.pairs:
+                if not any(self._candidates.get((judge, x, y)) for judge in self.judges for x, y in ((a, b), (b, a))):
+                    continue
+                p = self._probability(strengths, a, b)
+                score = p * (1 - p) * (variances[a] + variances[b])
+                if score > best_score:
+                    best_pair, best_score = (a, b), score
+            if best_pair is None:
+                break
+            a, b = best_pair
+            keys = [(judge, x, y) for judge in self.judges for x, y in ((a, b), (b, a)) if self._candidates.get((judge, x, y))]
+            key = min(keys, key=lambda key: self._picked.get(key, 0))
+            self._picked[key] = self._picked.get(key, 0) + 1
+            question_id = self._candidates[key].popleft()
+            picked.append((question_id,) + key)
+            # The pending judgment will reduce the variance of both models
+            p = self._probability(strengths, a, b)
+            for model in (a, b):
+                variances[model] = 1 / (1 / variances[model] + p * (1 - p))
+        return picked
@@ -0,0 +1,164 @@
+import sqlite3
+
+# Summary tables of the comparisons, kept up to date by triggers on the comparisons table so
+# that every row written by insert_comparisons (in the same transaction) updates them:
+# - comparison_summary: one row per (evaluator, bot A, bot B) with the number of judgments, the
+#   score totals, the preference counts and the score-based wins and ties, and the ties recorded
+#   without calling the judge because both answers were identical (no scores)
+# - question_model_scores: one row per (question, model) with the score total and judgments
+# The chart scripts read these tables only, so their cost does not depend on the number of
+# comparisons.
+SUMMARY_TABLES = ("comparison_summary", "question_model_scores")
+
+
+def _question_scores_upsert(question_id, model, score, sign):
+    return f'''INSERT INTO question_model_scores (question_id, model, score_total, judgments) VALUES ({question_id}, {model}, {sign}{score}, {sign}1)
+        ON CONFLICT(question_id, model) DO UPDATE SET score_total = score_total + excluded.score_total, judgments = judgments + excluded.judgments;'''
+
+
+def _summary_upsert(row, sign):
+    return f'''INSERT INTO comparison_summary (model_evaluating, model_bot_a, model_bot_b, judgments, score_a_total, score_b_total, preferred_a, preferred_b, score_wins_a, score_wins_b, score_ties)
+        VALUES ({row}.model_evaluating, {row}.model_bot_a, {row}.model_bot_b, {sign}1, {sign}{row}.score_a, {sign}{row}.score_b,
+                {sign}({row}.preferred_answer = {row}.model_bot_a), {sign}({row}.preferred_answer = {row}.model_bot_b),
+                {sign}({row}.score_a > {row}.score_b), {sign}({row}.score_a < {row}.score_b), {sign}({row}.score_a = {row}.score_b))
+        ON CONFLICT(model_evaluating, model_bot_a, model_bot_b) DO UPDATE SET
+            judgments = judgments + excluded.judgments, score_a_total = score_a_total + excluded.score_a_total, score_b_total = score_b_total + excluded.score_b_total,
+            preferred_a = preferred_a + excluded.preferred_a, preferred_b = preferred_b + excluded.preferred_b,
+            score_wins_a = score_wins_a + excluded.score_wins_a, score_wins_b = score_wins_b + excluded.score_wins_b, score_ties = score_ties + excluded.score_ties;'''
+
+
+def _identical_ties_upsert(row, sign):
+    return f'''INSERT INTO comparison_summary (model_evaluating, model_bot_a, model_bot_b, judgments, score_a_total, score_b_total, preferred_a, preferred_b, score_wins_a, score_wins_b, score_ties, identical_ties)
+        VALUES ({row}.model_evaluating, {row}.model_bot_a, {row}.model_bot_b, 0, 0, 0, 0, 0, 0, 0, 0, {sign}1)
+        ON CONFLICT(model_evaluating, model_bot_a, model_bot_b) DO UPDATE SET identical_ties = identical_ties + excluded.identical_ties;'''
+
+
+# Create the summary triggers: scored judgments update the totals, identical-answer ties
+# (no scores) only their counter
+def create_summary_triggers(c):
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS comparisons_summary_insert AFTER INSERT ON comparisons WHEN NEW.score_a IS NOT NULL BEGIN
+        {_summary_upsert("NEW", "")}
+        {_question_scores_upsert("NEW.question_id", "NEW.model_bot_a", "NEW.score_a", "")}
+        {_question_scores_upsert("NEW.question_id", "NEW.model_bot_b", "NEW.score_b", "")}
+    END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS comparisons_summary_delete AFTER DELETE ON comparisons WHEN OLD.score_a IS NOT NULL BEGIN
+        {_summary_upsert("OLD", "-")}
+        {_question_scores_upsert("OLD.question_id", "OLD.model_bot_a", "OLD.score_a", "-")}
+        {_question_scores_upsert("OLD.question_id", "OLD.model_bot_b", "OLD.score_b", "-")}
+    END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS comparisons_tie_insert AFTER INSERT ON comparisons WHEN NEW.score_a IS NULL BEGIN
+        {_identical_ties_upsert("NEW", "")}
+    END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS comparisons_tie_delete AFTER DELETE ON comparisons WHEN OLD.score_a IS NULL BEGIN
+        {_identical_ties_upsert("OLD", "-")}
+    END''')
+
+
+# Create the summary tables and their triggers (called from initialize_db).
+# When the tables are new, they are filled from the comparisons already stored.
+def initialize_summary_tables(c):
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    c.execute('''CREATE TABLE IF NOT EXISTS comparison_summary (model_evaluating TEXT, model_bot_a TEXT, model_bot_b TEXT, judgments INTEGER, score_a_total INTEGER, score_b_total INTEGER, preferred_a INTEGER, preferred_b INTEGER, score_wins_a INTEGER, score_wins_b INTEGER, score_ties INTEGER, identical_ties INTEGER DEFAULT 0, PRIMARY KEY(model_evaluating, model_bot_a, model_bot_b))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS question_model_scores (question_id INTEGER, model TEXT, score_total INTEGER, judgments INTEGER, PRIMARY KEY(question_id, model), FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    create_summary_triggers(c)
+    if not all(table in existing for table in SUMMARY_TABLES) and "comparisons" in existing:
+        rebuild_summary_tables(c)
+
+
+# Recompute the summary tables from the comparisons table with GROUP BY queries
+def rebuild_summary_tables(c):
+    c.execute("DELETE FROM comparison_summary")
+    c.execute("DELETE FROM question_model_scores")
+    c.execute('''INSERT INTO comparison_summary (model_evaluating, model_bot_a, model_bot_b, judgments, score_a_total, score_b_total, preferred_a, preferred_b, score_wins_a, score_wins_b, score_ties, identical_ties)
+        SELECT model_evaluating, model_bot_a, model_bot_b, COUNT(score_a), COALESCE(SUM(score_a), 0), COALESCE(SUM(score_b), 0),
+               SUM(score_a IS NOT NULL AND preferred_answer = model_bot_a), SUM(score_a IS NOT NULL AND preferred_answer = model_bot_b),
+               COALESCE(SUM(score_a > score_b), 0), COALESCE(SUM(score_a < score_b), 0), COALESCE(SUM(score_a = score_b), 0), SUM(score_a IS NULL)
+        FROM comparisons GROUP BY model_evaluating, model_bot_a, model_bot_b ORDER BY MIN(id)''')
+    c.execute('''INSERT INTO question_model_scores (question_id, model, score_total, judgments)
+        SELECT question_id, model, SUM(score), COUNT(*) FROM (
+            SELECT question_id, model_bot_a AS model, score_a AS score FROM comparisons WHERE score_a IS NOT NULL
+            UNION ALL
+            SELECT question_id, model_bot_b AS model, score_b AS score FROM comparisons WHERE score_a IS NOT NULL
+        ) GROUP BY question_id, model''')
+
+
+# Open a database for the charts, creating (and filling) the summary tables of an older database
+def connect_summaries(db_name="db_compare_models.db"):
+    conn = sqlite3.connect(db_name)
+    initialize_summary_tables(conn.cursor())
+    conn.commit()
+    return conn
+
+
+# Per (evaluator, bot A, bot B) rows of comparison_summary, in order of first appearance
+def pair_summaries(conn):
+    rows = conn.execute('''SELECT model_evaluating, model_bot_a, model_bot_b, judgments, score_a_total, score_b_total, preferred_a, preferred_b, score_wins_a, score_wins_b, score_ties, identical_ties
+        FROM comparison_summary WHERE judgments > 0 OR identical_ties > 0 ORDER BY rowid''').fetchall()
+    columns = ("model_evaluating", "model_bot_a", "model_bot_b", "judgments", "score_a_total", "score_b_total", "preferred_a", "preferred_b", "score_wins_a", "score_wins_b", "score_ties", "identical_ties")
+    return [dict(zip(columns, row)) for row in rows]
+
+
+# Models and evaluators in order of first appearance
+def models_and_evaluators(conn):
+    models = []
+    evaluators = []
+    for summary in pair_summaries(conn):
+        for model in (summary["model_bot_a"], summary["model_bot_b"]):
+            if model not in models:
+                models.append(model)
+        if summary["model_evaluating"] not in evaluators:
+            evaluators.append(summary["model_evaluating"])
+    return models, evaluators
+
+
+# {(evaluator, model): average score} over both presentation orders
+def evaluator_model_averages(conn):
+    rows = conn.execute('''SELECT model_evaluating, model, CAST(SUM(score_total) AS REAL) / SUM(judgments) FROM (
+            SELECT model_evaluating, model_bot_a AS model, score_a_total AS score_total, judgments FROM comparison_summary
+            UNION ALL
+            SELECT model_evaluating, model_bot_b AS model, score_b_total AS score_total, judgments FROM comparison_summary
+        ) GROUP BY model_evaluating, model HAVING SUM(judgments) > 0''').fetchall()
+    return {(model_evaluating, model): average for model_evaluating, model, average in rows}
+
+
+# {model: average score} over every evaluator and presentation order
+def model_averages(conn):
+    rows = conn.execute('''SELECT model, CAST(SUM(score_total) AS REAL) / SUM(judgments) FROM (
+            SELECT model_bot_a AS model, score_a_total AS score_total, judgments FROM comparison_summary
+            UNION ALL
+            SELECT model_bot_b AS model, score_b_total AS score_total, judgments FROM comparison_summary
+        ) GROUP BY model HAVING SUM(judgments) > 0''').fetchall()
+    return dict(rows)
+
+
+# {model: judgments won on scores, 'Ties': judgments with equal scores and identical answers}
+def score_preference_counts(conn):
+    counts = {"Ties": 0}
+    for summary in pair_summaries(conn):
+        counts[summary["model_bot_a"]] = counts.get(summary["model_bot_a"], 0) + summary["score_wins_a"]
+        counts[summary["model_bot_b"]] = counts.get(summary["model_bot_b"], 0) + summary["score_wins_b"]
+        counts["Ties"] += summary["score_ties"] + summary["identical_ties"]
+    return counts
+
+
+# {model: questions where the model has the best average score, 'Ties': questions where several
+# models share the best average score}
+def question_preference_counts(conn):
+    rows = conn.execute('''WITH averages AS (
+            SELECT question_id, model, CAST(score_total AS REAL) / judgments AS average FROM question_model_scores WHERE judgments > 0
+        ), best AS (
+            SELECT question_id, MAX(average) AS average FROM averages GROUP BY question_id
+        ), winners AS (
+            SELECT averages.question_id, COUNT(*) AS models, MIN(averages.model) AS model
+            FROM averages JOIN best ON averages.question_id = best.question_id AND averages.average = best.average
+            GROUP BY averages.question_id
+        )
+        SELECT CASE WHEN models > 1 THEN 'Ties' ELSE model END AS label, COUNT(*) FROM winners GROUP BY label''').fetchall()
+    return dict(rows)
+
+
+# Number of questions with at least one judgment, and number of judgments
+def totals(conn):
+    total_questions = conn.execute("SELECT COUNT(DISTINCT question_id) FROM question_model_scores WHERE judgments > 0").fetchone()[0]
+    total_judgments = conn.execute("SELECT COALESCE(SUM(judgments), 0) FROM comparison_summary").fetchone()[0]
+    return total_questions, total_judgments
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+from judgment_parser import anthropic_content_text
+
+# Terminal statuses of an OpenAI batch
+OPENAI_DONE_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+# OpenAI Batch API: the requests are uploaded as a JSONL file of /v1/chat/completions calls
+class OpenAIBatchProvider:
+    def __init__(self, client):
+        self.client = client
+
+    def write_line(self, batch_file, custom_id, request):
+        batch_file.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": request}) + "\n")
+
+    def submit(self, jsonl_path, custom_ids, requests):
+        with open(jsonl_path, "rb") as batch_file:
+            uploaded = self.client.files.create(file=batch_file, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.status, batch.status in OPENAI_DONE_STATUSES
+
+    # {custom_id: response text} for the succeeded requests
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        texts = {}
+        if not batch.output_file_id:
+            return texts
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200:
+                texts[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+        return texts
+
+
+# Anthropic Message Batches API: the requests are sent in the batch creation call,
+# the JSONL file is kept as a record of what was submitted
+class AnthropicBatchProvider:
+    def __init__(self, client):
+        self.client = client
+
+    def write_line(self, batch_file, custom_id, request):
+        batch_file.write(json.dumps({"custom_id": custom_id, "params": request}) + "\n")
+
+    def submit(self, jsonl_path, custom_ids, requests):
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": request} for custom_id, request in zip(custom_ids, requests)])
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return batch.processing_status, batch.processing_status == "ended"
+
+    def results(self, batch_id):
+        texts = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                texts[entry.custom_id] = anthropic_content_text(entry.result.message.content)
+        return texts
+
+
+# Runs a stage (all the answer calls, or all the comparison calls) as provider batch jobs:
+# the requests are written as JSONL files in work_dir, submitted per provider in chunks of
+# max_requests_per_batch, polled every poll_interval seconds, and their texts returned in
+# the order of the requests (None for failed requests).
+class BatchRunner:
+    def __init__(self, providers, work_dir="batch_jobs", poll_interval=60, max_requests_per_batch=10000):
+        self.providers = providers
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_requests_per_batch = max_requests_per_batch
+        self.batches_submitted = 0
+
+    # requests is a list of (provider name, request parameters)
+    def run_stage(self, stage, requests):
+        os.makedirs(self.work_dir, exist_ok=True)
+        run_tag = time.strftime("%Y%m%d-%H%M%S")
+        by_provider = {}
+        for index, (provider, request) in enumerate(requests):
+            by_provider.setdefault(provider, []).append((index, request))
+
+        # Submit every batch first so that all providers work in parallel
+        pending = []
+        for provider, indexed_requests in by_provider.items():
+            adapter = self.providers[provider]
+            for start in range(0, len(indexed_requests), self.max_requests_per_batch):
+                chunk = indexed_requests[start:start + self.max_requests_per_batch]
+                custom_ids = [f"{stage}-{index}" for index, _ in chunk]
+                chunk_requests = [request for _, request in chunk]
+                jsonl_path = os.path.join(self.work_dir, f"{run_tag}-{stage}-{provider}-{start // self.max_requests_per_batch}.jsonl")
+                with open(jsonl_path, "w", encoding="utf-8") as batch_file:
+                    for custom_id, request in zip(custom_ids, chunk_requests):
+                        adapter.write_line(batch_file, custom_id, request)
+                batch_id = adapter.submit(jsonl_path, custom_ids, chunk_requests)
+                self.batches_submitted += 1
+                print(f"Submitted {stage} batch {batch_id} to {provider} ({len(chunk)} requests, {jsonl_path})")
+                pending.append((provider, batch_id))
+
+        # Poll until every batch is done, then collect the texts
+        texts = {}
+        while pending:
+            still_pending = []
+            for provider, batch_id in pending:
+                status, done = self.providers[provider].status(batch_id)
+                if done:
+                    batch_texts = self.providers[provider].results(batch_id)
+                    print(f"Batch {batch_id} ({provider}) {status}: {len(batch_texts)} responses")
+                    texts.update(batch_texts)
+                else:
+                    still_pending.append((provider, batch_id))
+            pending = still_pending
+            if pending:
+                print(f"Waiting for {len(pending)} {stage} batches...")
+                time.sleep(self.poll_interval)
+        return [texts.get(f"{stage}-{index}") for index in range(len(requests))]
@@ -0,0 +1,397 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ("the", "answer", "is", "because", "we", "add", "each", "term", "then", "divide", "by", "total", "so", "result", "equals", "value")
+
+
+# Latency of a mock response, from a spec such as "fixed:0.2", "uniform:0.1,0.6",
+# "normal:0.5,0.1" or "lognormal:0.5,0.4" (the median and sigma of the underlying normal), in seconds
+class LatencyModel:
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, values = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {self.KINDS}")
+        self.kind = kind
+        self.values = [float(value) for value in values.split(",") if value.strip()] or [0.0]
+        self.spec = spec
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            low, high = self.values[0], self.values[-1]
+            return rng.uniform(low, high)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.values[0], self.values[1] if len(self.values) > 1 else 0.0))
+        median, sigma = self.values[0], self.values[1] if len(self.values) > 1 else 0.0
+        return rng.lognormvariate(0, sigma) * median if median > 0 else 0.0
+
+
+# Local server mimicking the OpenAI chat completions and Anthropic messages endpoints:
+# - POST /v1/chat/completions (OpenAI) and POST /v1/messages (Anthropic)
+# - each response is delayed by a sample of the latency model
+# - error_rate of the requests fail, half with 429 (with a short retry-after) and half with 500
+# - answers have about answer_chars characters; requests with a system prompt (or JSON mode /
+#   tools) are judge requests and get a JSON judgment with an explanation of about
+#   explanation_chars characters (a tool call when the request forces one); unparsable_rate of
+#   the judgments are unusable (truncated JSON, or a tool call without the scores)
+# - the batch APIs: POST /v1/files, POST /v1/batches, GET /v1/batches/{id} and
+#   GET /v1/files/{id}/content (OpenAI), POST /v1/messages/batches, GET /v1/messages/batches/{id}
+#   and GET /v1/messages/batches/{id}/results (Anthropic). A batch is reported in progress
+#   for its first pending_polls retrievals, then done; error_rate of its requests fail
+#   (error lines in the results) and its responses are not delayed
+class MockLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0,
+                 answer_chars=400, explanation_chars=600, seed=None, pending_polls=1, unparsable_rate=0.0):
+        self.latency = LatencyModel(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.answer_chars = answer_chars
+        self.explanation_chars = explanation_chars
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.requests_by_endpoint = {}
+        self.pending_polls = pending_polls
+        self.unparsable_rate = unparsable_rate
+        self.files = {}
+        self.batches = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def openai_base_url(self):
+        return f"http://{self._server.server_address[0]}:{self.port}/v1"
+
+    @property
+    def anthropic_base_url(self):
+        return f"http://{self._server.server_address[0]}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self):
+        with self._rng_lock:
+            self.requests = 0
+            self.errors = 0
+            self.requests_by_endpoint = {}
+
+    def stats(self):
+        with self._rng_lock:
+            return {"requests": self.requests, "errors": self.errors, "requests_by_endpoint": dict(self.requests_by_endpoint)}
+
+    # Draw the latency, the outcome and the text of one response
+    def _draw(self, endpoint):
+        with self._rng_lock:
+            self.requests += 1
+            self.requests_by_endpoint[endpoint] = self.requests_by_endpoint.get(endpoint, 0) + 1
+            delay = self.latency.sample(self.rng)
+            failure = None
+            if self.rng.random() < self.error_rate:
+                failure = 429 if self.rng.random() < 0.5 else 500
+                self.errors += 1
+            seed = self.rng.getrandbits(32)
+        return delay, failure, random.Random(seed)
+
+    def _text(self, rng, chars):
+        words = []
+        length = 0
+        while length < chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words) + "."
+
+    def _judgment(self, rng):
+        score_a, score_b = rng.randint(40, 100), rng.randint(40, 100)
+        return {
+            "explanation": self._text(rng, self.explanation_chars),
+            "score_a": score_a,
+            "score_b": score_b,
+            "better_answer": "A" if score_a >= score_b else "B",
+        }
+
+    # JSON text of a judgment, cut in the middle for unparsable_rate of them
+    def _judgment_text(self, rng):
+        text = json.dumps(self._judgment(rng))
+        return text[:len(text) // 2] if rng.random() < self.unparsable_rate else text
+
+    def _openai_response(self, request, rng):
+        messages = request.get("messages", [])
+        is_judgment = "response_format" in request or any(message.get("role") == "system" for message in messages)
+        content = self._judgment_text(rng) if is_judgment else self._text(rng, self.answer_chars)
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-mock{rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _anthropic_response(self, request, rng):
+        if request.get("tools"):
+            judgment = self._judgment(rng)
+            if rng.random() < self.unparsable_rate:
+                judgment = {"explanation": judgment["explanation"]}
+            content = [{"type": "tool_use", "id": f"toolu_mock{rng.getrandbits(32):08x}", "name": request["tools"][0]["name"], "input": judgment}]
+            output = json.dumps(content[0]["input"])
+        elif "system" in request:
+            output = self._judgment_text(rng)
+            content = [{"type": "text", "text": output}]
+        else:
+            output = self._text(rng, self.answer_chars)
+            content = [{"type": "text", "text": output}]
+        return {
+            "id": f"msg_mock{rng.getrandbits(32):08x}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "mock"),
+            "content": content,
+            "stop_reason": "tool_use" if request.get("tools") else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": sum(len(str(message.get("content", ""))) for message in request.get("messages", [])) // 4,
+                      "output_tokens": len(output) // 4},
+        }
+
+    def _new_id(self, prefix):
+        with self._rng_lock:
+            return f"{prefix}{self.rng.getrandbits(48):012x}"
+
+    # Stored file: its JSONL content and its OpenAI file object
+    def _store_file(self, content, filename, purpose):
+        file_id = self._new_id("file-mock")
+        self.files[file_id] = {
+            "content": content,
+            "object": {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                       "filename": filename, "purpose": purpose, "status": "processed"},
+        }
+        return self.files[file_id]["object"]
+
+    def _error_body(self, endpoint, failure):
+        if failure == 429:
+            if endpoint == "openai":
+                return {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}
+            return {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limit reached (mock)"}}
+        if endpoint == "openai":
+            return {"error": {"message": "Internal error (mock)", "type": "server_error"}}
+        return {"type": "error", "error": {"type": "api_error", "message": "Internal error (mock)"}}
+
+    # OpenAI batch of the /v1/chat/completions lines of an uploaded file: the succeeded
+    # requests go to the output file, the failed ones to the error file
+    def _create_openai_batch(self, request):
+        input_file = self.files.get(request.get("input_file_id"))
+        if input_file is None:
+            return None
+        output_lines, error_lines = [], []
+        for line in input_file["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            _, failure, rng = self._draw("openai_batch")
+            line_id = self._new_id("batch_req_mock")
+            if failure:
+                response = {"status_code": failure, "request_id": line_id, "body": self._error_body("openai", failure)}
+                error_lines.append(json.dumps({"id": line_id, "custom_id": entry["custom_id"], "response": response, "error": None}))
+            else:
+                response = {"status_code": 200, "request_id": line_id, "body": self._openai_response(entry["body"], rng)}
+                output_lines.append(json.dumps({"id": line_id, "custom_id": entry["custom_id"], "response": response, "error": None}))
+        batch_id = self._new_id("batch_mock")
+        output_file = self._store_file("\n".join(output_lines).encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+        error_file = self._store_file("\n".join(error_lines).encode("utf-8"), f"{batch_id}_error.jsonl", "batch_output") if error_lines else None
+        self.batches[batch_id] = {
+            "polls": 0,
+            "object": {
+                "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"), "errors": None,
+                "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window", "24h"),
+                "status": "in_progress", "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+                "request_counts": {"total": len(output_lines) + len(error_lines), "completed": len(output_lines), "failed": len(error_lines)},
+            },
+            "done": {"status": "completed", "output_file_id": output_file["id"], "error_file_id": error_file["id"] if error_file else None,
+                     "completed_at": int(time.time())},
+        }
+        return self.batches[batch_id]["object"]
+
+    # Anthropic message batch: one results line per request
+    def _create_anthropic_batch(self, request):
+        results = []
+        for entry in request.get("requests", []):
+            _, failure, rng = self._draw("anthropic_batch")
+            if failure:
+                result = {"type": "errored", "error": self._error_body("anthropic", failure)}
+            else:
+                result = {"type": "succeeded", "message": self._anthropic_response(entry["params"], rng)}
+            results.append({"custom_id": entry["custom_id"], "result": result})
+        batch_id = self._new_id("msgbatch_mock")
+        created_at = datetime.now(timezone.utc)
+        errored = sum(1 for entry in results if entry["result"]["type"] == "errored")
+        self.batches[batch_id] = {
+            "polls": 0,
+            "results": "\n".join(json.dumps(entry) for entry in results).encode("utf-8"),
+            "object": {
+                "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+                "request_counts": {"processing": len(results), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+                "created_at": created_at.isoformat(), "expires_at": (created_at + timedelta(hours=24)).isoformat(),
+                "ended_at": None, "archived_at": None, "cancel_initiated_at": None, "results_url": None,
+            },
+            "done": {"processing_status": "ended", "ended_at": created_at.isoformat(),
+                     "request_counts": {"processing": 0, "succeeded": len(results) - errored, "errored": errored, "canceled": 0, "expired": 0},
+                     "results_url": f"{self.anthropic_base_url}/v1/messages/batches/{batch_id}/results"},
+        }
+        return self.batches[batch_id]["object"]
+
+    # Batch object, in progress for its first pending_polls retrievals
+    def _retrieve_batch(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        with self._rng_lock:
+            batch["polls"] += 1
+            if batch["polls"] > self.pending_polls:
+                batch["object"].update(batch["done"])
+        return batch["object"]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self._send_bytes(status, data, "application/json", headers)
+
+            def _send_bytes(self, status, data, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self):
+                self._send(404, {"error": {"message": f"Unknown endpoint {self.path}", "type": "not_found_error"}})
+
+            # Multipart file upload of the OpenAI files API
+            def _upload_file(self, body):
+                message = BytesParser().parsebytes(
+                    f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("utf-8") + body)
+                fields = {}
+                for part in message.get_payload() if message.is_multipart() else []:
+                    fields[part.get_param("name", header="content-disposition")] = part
+                if "file" not in fields:
+                    self._send(400, {"error": {"message": "Missing file", "type": "invalid_request_error"}})
+                    return
+                purpose = fields["purpose"].get_payload(decode=True).decode("utf-8") if "purpose" in fields else "batch"
+                self._send(200, server._store_file(fields["file"].get_payload(decode=True), fields["file"].get_filename() or "upload.jsonl", purpose))
+
+            def do_GET(self):
+                parts = self.path.split("?", 1)[0].strip("/").split("/")
+                if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+                    batch = server._retrieve_batch(parts[2])
+                elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+                    batch = server._retrieve_batch(parts[3])
+                elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in server.files:
+                    self._send_bytes(200, server.files[parts[2]]["content"], "application/octet-stream")
+                    return
+                elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 5 and parts[4] == "results" and "results" in server.batches.get(parts[3], {}):
+                    self._send_bytes(200, server.batches[parts[3]]["results"], "application/binary")
+                    return
+                else:
+                    batch = None
+                if batch is None:
+                    self._not_found()
+                else:
+                    self._send(200, batch)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                path = self.path.split("?", 1)[0].rstrip("/")
+                if path.endswith("/files"):
+                    self._upload_file(body)
+                    return
+                try:
+                    request = json.loads(body or b"{}")
+                except json.JSONDecodeError:
+                    self._send(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                    return
+                if path.endswith("/messages/batches"):
+                    self._send(200, server._create_anthropic_batch(request))
+                    return
+                if path.endswith("/batches"):
+                    batch = server._create_openai_batch(request)
+                    if batch is None:
+                        self._send(404, {"error": {"message": "Unknown input file", "type": "invalid_request_error"}})
+                    else:
+                        self._send(200, batch)
+                    return
+                if path.endswith("/chat/completions"):
+                    endpoint = "openai"
+                elif path.endswith("/messages"):
+                    endpoint = "anthropic"
+                else:
+                    self._not_found()
+                    return
+
+                delay, failure, rng = server._draw(endpoint)
+                time.sleep(delay)
+                if failure == 429:
+                    self._send(429, server._error_body(endpoint, failure), {"retry-after-ms": "50"})
+                elif failure == 500:
+                    self._send(500, server._error_body(endpoint, failure))
+                elif endpoint == "openai":
+                    self._send(200, server._openai_response(request, rng))
+                else:
+                    self._send(200, server._anthropic_response(request, rng))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI and Anthropic APIs for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="Latency distribution (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of the requests failing with 429 or 500 (default: 0)")
+    parser.add_argument("--answer-chars", type=int, default=400, help="Approximate size of the answers (default: 400)")
+    parser.add_argument("--explanation-chars", type=int, default=600, help="Approximate size of the judgment explanations (default: 600)")
+    parser.add_argument("--seed", type=int, help="Random seed of the latencies, errors and texts")
+    parser.add_argument("--pending-polls", type=int, default=1, help="Retrievals for which a batch is reported in progress (default: 1)")
+    parser.add_argument("--unparsable-rate", type=float, default=0.0, help="Fraction of the judgments that cannot be parsed (default: 0)")
+    args = parser.parse_args()
+
+    mock = MockLLMServer(args.host, args.port, args.latency, args.error_rate, args.answer_chars, args.explanation_chars, args.seed,
+                         args.pending_polls, args.unparsable_rate)
+    print(f"Mock LLM server listening: OPENAI_BASE_URL={mock.openai_base_url} ANTHROPIC_BASE_URL={mock.anthropic_base_url}")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock._server.server_close()
@@ -0,0 +1,195 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from mock_llm_server import MockLLMServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from instrumentation import Metrics
+
+MAIN_SCRIPT = os.path.join(REPO_DIR, "run_model_comparison_analysis.py")
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+THROUGHPUT_PATTERN = re.compile(r"Throughput: ([\d.]+) questions/min")
+
+
+def parse_list(value, cast=int):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+# Local dataset of num_questions generated word problems (a folder with a train.jsonl split)
+def write_dataset(directory, num_questions):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "train.jsonl"), "w", encoding="utf-8") as dataset_file:
+        for i in range(num_questions):
+            question = f"A shop sells {i + 3} boxes of {2 * i + 5} apples each and {i + 1} loose apples. How many apples does it sell?"
+            dataset_file.write(json.dumps({"question": question, "answer": str((i + 3) * (2 * i + 5) + i + 1)}) + "\n")
+    return directory
+
+
+# Run the main script on the dataset against the mock server and collect the measurements
+def run_once(mock, dataset_dir, num_questions, engine, concurrency, timeout):
+    work_dir = tempfile.mkdtemp(prefix="benchmark-run-")
+    metrics_path = os.path.join(work_dir, "metrics.jsonl")
+    log_path = os.path.join(work_dir, "output.log")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "mock-openai-key",
+        "ANTHROPIC_API_KEY": "mock-anthropic-key",
+        "OPENAI_BASE_URL": mock.openai_base_url,
+        "ANTHROPIC_BASE_URL": mock.anthropic_base_url,
+        "PIPELINE_ENGINE": engine,
+        "MAX_CONCURRENT_REQUESTS": str(concurrency),
+        "OPENAI_MAX_CONCURRENT_REQUESTS": str(concurrency),
+        "ANTHROPIC_MAX_CONCURRENT_REQUESTS": str(concurrency),
+        # No client-side rate limits and no response cache: every call reaches the mock server
+        "OPENAI_REQUESTS_PER_MINUTE": "0",
+        "OPENAI_TOKENS_PER_MINUTE": "0",
+        "ANTHROPIC_REQUESTS_PER_MINUTE": "0",
+        "ANTHROPIC_TOKENS_PER_MINUTE": "0",
+        "RESPONSE_CACHE_MODE": "off",
+        "METRICS": "1",
+    })
+    mock.reset_counters()
+    started_at = time.monotonic()
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        process = subprocess.run(
+            [sys.executable, MAIN_SCRIPT, "--dataset", dataset_dir, "--field", "question",
+             "--num-questions", str(num_questions), "--metrics-jsonl", metrics_path],
+            cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, timeout=timeout)
+    wall_seconds = time.monotonic() - started_at
+    with open(log_path, encoding="utf-8", errors="replace") as log_file:
+        output = log_file.read()
+
+    result = {
+        "engine": engine,
+        "concurrency": concurrency,
+        "num_questions": num_questions,
+        "exit_code": process.returncode,
+        "wall_seconds": wall_seconds,
+    }
+    if process.returncode != 0:
+        print(output[-3000:])
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return result
+
+    # Throughput as measured by the scheduler (excludes the interpreter startup and imports)
+    match = THROUGHPUT_PATTERN.search(output)
+    questions_per_second = float(match.group(1)) / 60 if match else num_questions / wall_seconds
+    run_seconds = num_questions / questions_per_second if questions_per_second else wall_seconds
+    mock_stats = mock.stats()
+
+    conn = sqlite3.connect(os.path.join(work_dir, "db_compare_models.db"))
+    answers = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    comparisons = conn.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0]
+    conn.close()
+
+    # Per-stage latencies from the metrics of the run
+    metrics = Metrics(enabled=True)
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as metrics_file:
+            for line in metrics_file:
+                event = json.loads(line)
+                metrics.observe(event["stage"], event["seconds"])
+    stages = metrics.stage_summary()
+
+    result.update({
+        "run_seconds": run_seconds,
+        "questions_per_second": questions_per_second,
+        "calls_per_second": mock_stats["requests"] / run_seconds if run_seconds else 0.0,
+        "mock_requests": mock_stats["requests"],
+        "mock_errors": mock_stats["errors"],
+        "answers_stored": answers,
+        "comparisons_stored": comparisons,
+        "db_write": stages.get("db_write"),
+        "stages": stages,
+    })
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def result_key(result):
+    return (result["engine"], result["concurrency"], result["num_questions"])
+
+
+def print_results(results, previous=None):
+    previous_by_key = {result_key(result): result for result in (previous or {}).get("results", [])}
+    print(f"{'engine':<8}{'conc.':>6}{'questions':>10}{'q/s':>9}{'calls/s':>9}{'errors':>8}{'db p50 ms':>11}{'db p99 ms':>11}{'vs prev.':>10}")
+    for result in results:
+        if result["exit_code"] != 0:
+            print(f"{result['engine']:<8}{result['concurrency']:>6}{result['num_questions']:>10}  failed (exit code {result['exit_code']})")
+            continue
+        db_write = result["db_write"] or {"p50": 0.0, "p99": 0.0}
+        change = ""
+        before = previous_by_key.get(result_key(result))
+        if before and before.get("questions_per_second"):
+            change = f"{100 * (result['questions_per_second'] / before['questions_per_second'] - 1):+.1f}%"
+        print(f"{result['engine']:<8}{result['concurrency']:>6}{result['num_questions']:>10}{result['questions_per_second']:>9.2f}"
+              f"{result['calls_per_second']:>9.1f}{result['mock_errors']:>8}{db_write['p50'] * 1000:>11.2f}{db_write['p99'] * 1000:>11.2f}{change:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the full comparison pipeline against a local mock of the OpenAI and Anthropic APIs.")
+    parser.add_argument("--concurrency", default="4,16,64", help="Comma-separated numbers of API calls in flight (default: %(default)s)")
+    parser.add_argument("--sizes", default="20,100", help="Comma-separated numbers of questions (default: %(default)s)")
+    parser.add_argument("--engines", default="threads,async", help="Comma-separated pipeline engines (default: %(default)s)")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="Latency distribution of the mock server: fixed, uniform, normal or lognormal (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="Fraction of the mock requests failing with 429 or 500 (default: %(default)s)")
+    parser.add_argument("--answer-chars", type=int, default=400, help="Approximate size of the mock answers (default: %(default)s)")
+    parser.add_argument("--explanation-chars", type=int, default=600, help="Approximate size of the mock judgment explanations (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the mock server (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Maximum duration of one run in seconds (default: %(default)s)")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/benchmark-<time>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare the throughput with")
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)
+
+    mock = MockLLMServer(latency=args.latency, error_rate=args.error_rate, answer_chars=args.answer_chars,
+                         explanation_chars=args.explanation_chars, seed=args.seed).start()
+    data_dir = tempfile.mkdtemp(prefix="benchmark-data-")
+    results = []
+    try:
+        for num_questions in parse_list(args.sizes):
+            dataset_dir = write_dataset(os.path.join(data_dir, f"questions-{num_questions}"), num_questions)
+            for engine in parse_list(args.engines, str):
+                for concurrency in parse_list(args.concurrency):
+                    print(f"Running {num_questions} questions, {engine} engine, {concurrency} calls in flight...")
+                    results.append(run_once(mock, dataset_dir, num_questions, engine, concurrency, args.timeout))
+    finally:
+        mock.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "mock": {"latency": args.latency, "error_rate": args.error_rate, "answer_chars": args.answer_chars,
+                 "explanation_chars": args.explanation_chars, "seed": args.seed},
+        "results": results,
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print_results(results, previous)
+    print(f"Results written to {output_path}")
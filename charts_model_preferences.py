@@ -1,57 +1,59 @@
+import math
 import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import sqlite3
-
-# Connect to the database
-conn = sqlite3.connect('db_compare_models.db')
-# Fetch all rows from the new comparisons table
-query = "SELECT * FROM comparison_gpt4_claude3"
-comparisons_df = pd.read_sql_query(query, conn)
+from aggregates import connect_summaries, pair_summaries, models_and_evaluators, totals
+from model_registry import tournament_pairings
+
+# Connect to the database (the summary tables are created and filled for an older database)
+conn = connect_summaries('db_compare_models.db')
+# Preference counts of every (evaluator, bot A, bot B), aggregated in SQL as the comparisons are stored
+summaries = pair_summaries(conn)
+
+# Models and evaluators in order of appearance (GPT-4 and Claude3 for the original runs)
+models, evaluators = models_and_evaluators(conn)
+
+# Calculate the total number of questions
+total_questions, _ = totals(conn)
 conn.close()
 
-# Define a function to count preferences based on evaluation setup
-def count_preferences(df, evaluator, bot_a, bot_b):
-    # Filter based on evaluator and bot positions
-    filtered_df = df[(df['model_evaluating'] == evaluator) & 
-                     (df['model_bot_a'] == bot_a) & 
-                     (df['model_bot_b'] == bot_b)]
-    # Count the number of times each model is preferred
-    preferences_count = filtered_df['preferred_answer'].value_counts()
-    return [preferences_count.get('GPT-4', 0), preferences_count.get('Claude3', 0)]
-
-# Prepare data for the pie charts based on specific conditions
-conditions = [
-    ('GPT-4', 'GPT-4', 'Claude3'),
-    ('GPT-4', 'Claude3', 'GPT-4'),
-    ('Claude3', 'GPT-4', 'Claude3'),
-    ('Claude3', 'Claude3', 'GPT-4')
-]
+# Number of times each model is preferred, by evaluator and presentation order
+preferences = {(summary['model_evaluating'], summary['model_bot_a'], summary['model_bot_b']): [summary['preferred_a'], summary['preferred_b']]
+               for summary in summaries}
+
+# Prepare data for the pie charts: each evaluator with each ordered pair of models
+conditions = [condition for condition in tournament_pairings(models, evaluators)
+              if preferences.get(condition, [0, 0]) != [0, 0]]
 
 # Generate pie chart data based on conditions
-pie_data = [count_preferences(comparisons_df, *cond) for cond in conditions]
+pie_data = [preferences[cond] for cond in conditions]
 
 # Titles for the pie charts
-titles = [
-    "GPT-4 Evaluation:\nComparing GPT-4 vs. Claude3\nNumbers indicate GPT-4's preference\nbetween its own and Claude3's answers.",
-    "GPT-4 Evaluation:\nComparing Claude3 vs. GPT-4\nNumbers indicate GPT-4's preference\nbetween its own and Claude3's answers.",
-    "Claude3 Evaluation:\nComparing GPT-4 vs. Claude3\nNumbers indicate Claude3's preference\nbetween its own and GPT-4's answers.",
-    "Claude3 Evaluation:\nComparing Claude3 vs. GPT-4\nNumbers indicate Claude3's preference\nbetween its own and GPT-4's answers."
-]
-
-# Visualization with pie charts
-fig, axs = plt.subplots(1, 4, figsize=(24, 6))  # Adjust the subplot layout
+def chart_title(evaluator, bot_a, bot_b):
+    if evaluator in (bot_a, bot_b):
+        other = bot_b if evaluator == bot_a else bot_a
+        between = f"between its own and {other}'s answers."
+    else:
+        between = f"between {bot_a}'s and {bot_b}'s answers."
+    return f"{evaluator} Evaluation:\nComparing {bot_a} vs. {bot_b}\nNumbers indicate {evaluator}'s preference\n{between}"
+
+titles = [chart_title(*cond) for cond in conditions]
+
+# Visualization with pie charts, four per row
+ncols = min(4, max(1, len(conditions)))
+nrows = max(1, math.ceil(len(conditions) / ncols))
+fig, axs = plt.subplots(nrows, ncols, figsize=(6 * ncols, 6 * nrows), squeeze=False)  # Adjust the subplot layout
+axs = axs.flatten()
+colors = {model: color for model, color in zip(models, ['#a8c2ba', '#c2896f', '#8f9fc2', '#c2b76f', '#b48fc2', '#6fc2a0'] * len(models))}
 
 # Loop through each condition to create pie charts
-for ax, data, title in zip(axs, pie_data, titles):
-    ax.pie(data, labels=['GPT-4', 'Claude3'], autopct=lambda p: '{:.0f}\n({:.1f}%)'.format(p * sum(data) / 100, p) if p > 0 else '', startangle=90, colors=['#a8c2ba', '#c2896f'])
+for ax, data, title, (_, bot_a, bot_b) in zip(axs, pie_data, titles, conditions):
+    ax.pie(data, labels=[bot_a, bot_b], autopct=lambda p, data=data: '{:.0f}\n({:.1f}%)'.format(p * sum(data) / 100, p) if p > 0 else '', startangle=90, colors=[colors[bot_a], colors[bot_b]])
     ax.set_title(title)
-
-# Calculate the total number of questions
-total_questions = comparisons_df['question_id'].nunique()
+for ax in axs[len(conditions):]:
+    ax.axis('off')
 
 # Add a boxed title within the plot area
-fig.text(0.5, 0.90, f"Preference Evaluation between GPT-4 and Claude3: Each model blindly assesses answers from both, across a total of {total_questions} questions.",
+model_names = " and ".join(models) if len(models) <= 2 else ", ".join(models[:-1]) + f" and {models[-1]}"
+fig.text(0.5, 0.90 if nrows == 1 else 0.99, f"Preference Evaluation between {model_names}: Each model blindly assesses answers from {'both' if len(models) <= 2 else 'all'}, across a total of {total_questions} questions.",
          ha='center', va='top', fontsize=14, bbox=dict(facecolor='none', edgecolor='black', boxstyle='round,pad=1'))
 
 plt.tight_layout()
@@ -0,0 +1,479 @@
+import io
+import os
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from migrations import schema_version, SCHEMA_VERSION
+
+DEFAULT_DB = 'db_compare_models.db'
+SNAPSHOT_FORMATS = ('png', 'svg')
+COLORS = ['#a8c2ba', '#c2896f', '#8f9fc2', '#c2b76f', '#b48fc2', '#6fc2a0']
+
+
+def _timestamp(created_at):
+    try:
+        return datetime.fromisoformat(created_at).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+# Live statistics of the database written by a run, for the dashboard. Nothing is rescanned:
+# - the judgments start from comparison_summary (read with MAX(comparisons.id) in one read
+#   transaction), then each poll reads the comparisons with a larger id than the last one seen
+# - the calls are read from token_usage the same way, from the first row on the first poll
+# The running averages and preference counts are updated from the new rows only. The
+# throughput, latencies and error rates of the last window seconds come from the recent calls.
+class LiveStats:
+    def __init__(self, db_path=DEFAULT_DB, window=300, stall_seconds=120, chunk_size=5000):
+        self.db_path = db_path
+        self.window = window
+        self.stall_seconds = stall_seconds
+        self.chunk_size = chunk_size
+        self.conn = None
+        self.last_comparison_id = 0
+        self.last_usage_id = 0
+        self.pairs = {}  # (evaluator, bot A, bot B) -> [judgments, score A total, score B total, preferred A, preferred B, identical ties]
+        self.calls = {}  # (model, stage) -> [API calls, errors, cached, input tokens, output tokens, last call time or None]
+        self.recent = deque()  # (time, model, stage, output tokens, seconds, error) of the API calls of the window
+        self.last_error = {}  # model -> (time, error) of its latest failed call
+        self.first_call_at = None
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if not os.path.exists(self.db_path):
+            raise ValueError(f"Database {self.db_path} not found: start run_model_comparison_analysis.py first.")
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        version = schema_version(conn)
+        if version < SCHEMA_VERSION:
+            conn.close()
+            raise ValueError(f"Database {self.db_path} is at schema version {version}, expected {SCHEMA_VERSION}: "
+                             f"run run_model_comparison_analysis.py once on it to migrate it.")
+        return conn
+
+    # Summary counts and the id they include, read in one transaction so that no judgment is
+    # counted twice or missed
+    def _load_summary(self):
+        self.conn.execute("BEGIN")
+        try:
+            rows = self.conn.execute('''SELECT model_evaluating, model_bot_a, model_bot_b, judgments, score_a_total, score_b_total, preferred_a, preferred_b, identical_ties
+                FROM comparison_summary ORDER BY rowid''').fetchall()
+            self.last_comparison_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM comparisons").fetchone()[0]
+        finally:
+            self.conn.commit()
+        for evaluator, bot_a, bot_b, *counts in rows:
+            self.pairs[(evaluator, bot_a, bot_b)] = [value or 0 for value in counts]
+
+    def _tail(self, sql, last_id):
+        while True:
+            rows = self.conn.execute(sql, (last_id, self.chunk_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+            if len(rows) < self.chunk_size:
+                return
+
+    def _add_comparisons(self, rows):
+        for _, evaluator, bot_a, bot_b, preferred_answer, score_a, score_b in rows:
+            pair = self.pairs.setdefault((evaluator, bot_a, bot_b), [0, 0, 0, 0, 0, 0])
+            if score_a is None:
+                pair[5] += 1
+                continue
+            pair[0] += 1
+            pair[1] += score_a
+            pair[2] += score_b
+            pair[3] += preferred_answer == bot_a
+            pair[4] += preferred_answer == bot_b
+        self.last_comparison_id = rows[-1][0]
+
+    def _add_calls(self, rows, now):
+        for _, model, stage, input_tokens, output_tokens, seconds, cached, created_at, error in rows:
+            counts = self.calls.setdefault((model, stage), [0, 0, 0, 0, 0, None])
+            called_at = _timestamp(created_at)
+            if cached:
+                counts[2] += 1
+                continue
+            counts[0] += 1
+            counts[1] += error is not None
+            counts[3] += input_tokens or 0
+            counts[4] += output_tokens or 0
+            if called_at is None:
+                continue
+            counts[5] = max(counts[5] or called_at, called_at)
+            if self.first_call_at is None or called_at < self.first_call_at:
+                self.first_call_at = called_at
+            if error is not None:
+                self.last_error[model] = (called_at, error)
+            if called_at >= now - self.window:
+                self.recent.append((called_at, model, stage, output_tokens or 0, seconds, error))
+        self.last_usage_id = rows[-1][0]
+
+    # Read the rows added since the previous poll. Returns the number of new rows.
+    def poll(self):
+        now = time.time()
+        new_rows = 0
+        with self._lock:
+            if self.conn is None:
+                self.conn = self._connect()
+                self._load_summary()
+            for rows in self._tail('''SELECT id, model_evaluating, model_bot_a, model_bot_b, preferred_answer, score_a, score_b
+                    FROM comparisons WHERE id > ? ORDER BY id LIMIT ?''', self.last_comparison_id):
+                self._add_comparisons(rows)
+                new_rows += len(rows)
+            for rows in self._tail('''SELECT id, model, stage, input_tokens, output_tokens, seconds, cached, created_at, error
+                    FROM token_usage WHERE id > ? ORDER BY id LIMIT ?''', self.last_usage_id):
+                self._add_calls(rows, now)
+                new_rows += len(rows)
+            while self.recent and self.recent[0][0] < now - self.window:
+                self.recent.popleft()
+            self.updated_at = now
+        return new_rows
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    # Current statistics as a JSON-serializable dict
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            pairs = {key: list(values) for key, values in self.pairs.items()}
+            calls = {key: list(values) for key, values in self.calls.items()}
+            recent = [call for call in self.recent if call[0] >= now - self.window]
+            first_call_at = self.first_call_at
+            last_error = dict(self.last_error)
+            last_ids = {"comparisons": self.last_comparison_id, "token_usage": self.last_usage_id}
+            updated_at = self.updated_at
+
+        # Running averages, by evaluator and over all the evaluators
+        model_scores = {}
+        evaluator_scores = {}
+        judges = {}
+        preferences = []
+        for (evaluator, bot_a, bot_b), (judgments, score_a_total, score_b_total, preferred_a, preferred_b, identical_ties) in pairs.items():
+            for model, score_total in ((bot_a, score_a_total), (bot_b, score_b_total)):
+                for scores in (model_scores.setdefault(model, [0, 0]), evaluator_scores.setdefault((evaluator, model), [0, 0])):
+                    scores[0] += score_total
+                    scores[1] += judgments
+            judge = judges.setdefault(evaluator, [0, 0, 0, 0])
+            judge[0] += judgments
+            judge[1] += score_a_total + score_b_total
+            judge[2] += preferred_a
+            judge[3] += identical_ties
+            if judgments or identical_ties:
+                preferences.append({"evaluator": evaluator, "model_bot_a": bot_a, "model_bot_b": bot_b,
+                                    "preferred_a": preferred_a, "preferred_b": preferred_b, "identical_ties": identical_ties})
+
+        # Throughput of the window: over the time since the first call when the run is younger
+        span = max(1.0, min(self.window, now - first_call_at)) if first_call_at is not None else float(self.window)
+        windows = {}
+        for _, model, stage, output_tokens, seconds, error in recent:
+            window = windows.setdefault((model, stage), [0, 0, 0, 0.0, 0])
+            window[0] += 1
+            window[1] += error is not None
+            window[2] += output_tokens
+            if seconds is not None:
+                window[3] += seconds
+                window[4] += 1
+        call_rows = []
+        for (model, stage), (api_calls, errors, cached, input_tokens, output_tokens, last_call_at) in calls.items():
+            window_calls, window_errors, window_tokens, window_seconds, timed_calls = windows.get((model, stage), [0, 0, 0, 0.0, 0])
+            idle = None if last_call_at is None else now - last_call_at
+            call_rows.append({
+                "model": model, "stage": stage, "calls": api_calls, "cached": cached, "errors": errors,
+                "error_rate": errors / api_calls if api_calls else None,
+                "input_tokens": input_tokens, "output_tokens": output_tokens,
+                "calls_per_minute": 60 * window_calls / span,
+                "output_tokens_per_second": window_tokens / span,
+                "window_error_rate": window_errors / window_calls if window_calls else None,
+                "average_seconds": window_seconds / timed_calls if timed_calls else None,
+                "seconds_since_last_call": idle,
+                "stalled": idle is not None and idle > self.stall_seconds,
+                "last_error": last_error.get(model, (None, None))[1],
+            })
+
+        return {
+            "db": self.db_path,
+            "updated_at": None if updated_at is None else datetime.fromtimestamp(updated_at, timezone.utc).isoformat(),
+            "window_seconds": self.window,
+            "last_ids": last_ids,
+            "judgments": sum(judge[0] for judge in judges.values()),
+            "identical_ties": sum(judge[3] for judge in judges.values()),
+            "model_averages": [{"model": model, "average": total / count, "judgments": count}
+                               for model, (total, count) in model_scores.items() if count],
+            "evaluator_averages": [{"evaluator": evaluator, "model": model, "average": total / count, "judgments": count}
+                                   for (evaluator, model), (total, count) in evaluator_scores.items() if count],
+            # A judge that always prefers answer A, or gives the same score to everything, stands out here
+            "judges": [{"evaluator": evaluator, "judgments": count, "average_score": total / (2 * count) if count else None,
+                        "preferred_a_share": preferred_a / count if count else None, "identical_ties": identical_ties}
+                       for evaluator, (count, total, preferred_a, identical_ties) in judges.items()],
+            "preferences": preferences,
+            "calls": call_rows,
+            "calls_per_minute": sum(row["calls_per_minute"] for row in call_rows),
+        }
+
+
+# Render the statistics as one figure (running averages, call rates and error rates, and the
+# preference pies), as PNG or SVG bytes. The figure is built without pyplot, so it needs no
+# display and can be drawn from any thread.
+def render_snapshot(stats, fmt='png'):
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unsupported snapshot format '{fmt}', expected one of {SNAPSHOT_FORMATS}")
+    try:
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise RuntimeError("Snapshots need matplotlib (pip install matplotlib).")
+
+    preferences = stats["preferences"]
+    ncols = max(2, min(4, len(preferences)))
+    pie_rows = math.ceil(len(preferences) / ncols)
+    fig = Figure(figsize=(5 * ncols, 5 * (1 + pie_rows)))
+    grid = fig.add_gridspec(1 + pie_rows, ncols)
+    models = [row["model"] for row in stats["model_averages"]]
+    colors = {model: COLORS[i % len(COLORS)] for i, model in enumerate(models)}
+
+    # Running average score of each model, by evaluator and overall
+    ax = fig.add_subplot(grid[0, :ncols // 2])
+    evaluators = []
+    for row in stats["evaluator_averages"]:
+        if row["evaluator"] not in evaluators:
+            evaluators.append(row["evaluator"])
+    labels = [f"{evaluator} Evaluation" for evaluator in evaluators] + ["Total Evaluation"]
+    averages = {(row["evaluator"], row["model"]): row["average"] for row in stats["evaluator_averages"]}
+    averages.update({("Total", row["model"]): row["average"] for row in stats["model_averages"]})
+    width = 0.7 / max(1, len(models))
+    for i, model in enumerate(models):
+        offset = (i - (len(models) - 1) / 2) * width
+        values = [averages.get((evaluator, model), float('nan')) for evaluator in evaluators + ["Total"]]
+        ax.bar([x + offset for x in range(len(labels))], values, width, label=model, color=colors[model])
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=30, ha='right')
+    ax.set_ylabel('Average Scores')
+    ax.set_title(f"Running average scores ({stats['judgments']} judgments, {stats['identical_ties']} identical-answer ties)")
+    if models:
+        ax.legend()
+
+    # Calls per minute of each model and stage over the window, with their error rates
+    ax = fig.add_subplot(grid[0, ncols // 2:])
+    calls = stats["calls"]
+    names = [f"{row['model']}\n{row['stage']}" for row in calls]
+    ax.bar(range(len(calls)), [row["calls_per_minute"] for row in calls],
+           color=['#c26f6f' if row["stalled"] else '#8f9fc2' for row in calls])
+    for i, row in enumerate(calls):
+        error_rate = row["window_error_rate"]
+        ax.annotate(f"{row['calls_per_minute']:.1f}/min\nerrors {'n/a' if error_rate is None else f'{error_rate:.0%}'}",
+                    xy=(i, row["calls_per_minute"]), xytext=(0, 3), textcoords="offset points", ha='center', va='bottom')
+    ax.set_xticks(range(len(calls)))
+    ax.set_xticklabels(names)
+    ax.set_ylim(0, 1.25 * max([row["calls_per_minute"] for row in calls] + [1]))
+    ax.set_ylabel('Calls per minute')
+    ax.set_title(f"Throughput over the last {stats['window_seconds'] // 60} min (red: no call for a while)")
+
+    # Preference pies: each evaluator with each ordered pair of models
+    for index, row in enumerate(preferences):
+        ax = fig.add_subplot(grid[1 + index // ncols, index % ncols])
+        data = [row["preferred_a"], row["preferred_b"], row["identical_ties"]]
+        pie_labels = [row["model_bot_a"], row["model_bot_b"], "Identical"]
+        pie_colors = [colors.get(row["model_bot_a"], COLORS[0]), colors.get(row["model_bot_b"], COLORS[1]), '#dddddd']
+        kept = [i for i, value in enumerate(data) if value]
+        ax.pie([data[i] for i in kept], labels=[pie_labels[i] for i in kept], colors=[pie_colors[i] for i in kept], startangle=90,
+               autopct=lambda p, total=sum(data): '{:.0f}\n({:.1f}%)'.format(p * total / 100, p) if p > 0 else '')
+        ax.set_title(f"{row['evaluator']} Evaluation:\n{row['model_bot_a']} vs. {row['model_bot_b']}")
+
+    fig.suptitle(f"{stats['db']} at {stats['updated_at']}")
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+# Poll the database and write one snapshot file (format from the extension)
+def write_snapshot(live_stats, path):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    data = render_snapshot(live_stats.snapshot(), fmt)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(data)
+    return path
+
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Model comparison dashboard</title>
+<style>
+body { font-family: sans-serif; margin: 1.5em; }
+table { border-collapse: collapse; margin-bottom: 1.5em; }
+th, td { border: 1px solid #ccc; padding: 0.25em 0.6em; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+.stalled { background: #f6d5d5; }
+.pies { display: flex; flex-wrap: wrap; gap: 1.5em; }
+.pie { width: 120px; height: 120px; border-radius: 50%; margin: 0.5em auto; }
+.pies div { text-align: center; font-size: 0.9em; }
+</style></head>
+<body>
+<h2>Model comparison dashboard</h2>
+<p id="status">Loading...</p>
+<p>Snapshot: <a href="/snapshot.png">PNG</a> | <a href="/snapshot.svg">SVG</a></p>
+<h3>Running averages</h3><table id="averages"></table>
+<h3>Judges</h3><table id="judges"></table>
+<h3>Calls</h3><table id="calls"></table>
+<h3>Preferences</h3><div class="pies" id="pies"></div>
+<script>
+const colors = ["#a8c2ba", "#c2896f", "#dddddd"];
+const number = (value, digits = 1) => value === null ? "n/a" : value.toFixed(digits);
+const percent = value => value === null ? "n/a" : (100 * value).toFixed(1) + "%";
+// The values (model names, error messages) are set as text, never parsed as HTML
+function element(tag, text, className) {
+  const node = document.createElement(tag);
+  if (text !== undefined && text !== null) node.textContent = text;
+  if (className) node.className = className;
+  return node;
+}
+function table(id, headers, rows, rowClass) {
+  const header = element("tr");
+  headers.forEach(h => header.appendChild(element("th", h)));
+  const lines = rows.map(row => {
+    const line = element("tr", null, rowClass ? rowClass(row) : "");
+    row.cells.forEach(c => line.appendChild(element("td", c)));
+    return line;
+  });
+  document.getElementById(id).replaceChildren(header, ...lines);
+}
+async function refresh() {
+  try {
+    const stats = await (await fetch("/stats.json")).json();
+    document.getElementById("status").textContent =
+      `${stats.db}: ${stats.judgments} judgments, ${stats.identical_ties} identical-answer ties, ` +
+      `${number(stats.calls_per_minute)} calls/min, updated ${stats.updated_at}`;
+    table("averages", ["Evaluator", "Model", "Average score", "Judgments"],
+      stats.evaluator_averages.concat(stats.model_averages.map(r => Object.assign({evaluator: "Total"}, r)))
+        .map(r => ({cells: [r.evaluator, r.model, number(r.average, 2), r.judgments]})));
+    table("judges", ["Judge", "Judgments", "Average score", "Prefers answer A", "Identical-answer ties"],
+      stats.judges.map(r => ({cells: [r.evaluator, r.judgments, number(r.average_score, 2), percent(r.preferred_a_share), r.identical_ties]})));
+    table("calls", ["Model", "Stage", "Calls", "Cached", "Errors", "Error rate", `Calls/min (${stats.window_seconds / 60} min)`,
+                    "Window error rate", "Output tokens/s", "Avg latency (s)", "Last call (s ago)", "Last error"],
+      stats.calls.map(r => ({stalled: r.stalled, cells: [r.model, r.stage, r.calls, r.cached, r.errors, percent(r.error_rate),
+        number(r.calls_per_minute), percent(r.window_error_rate), number(r.output_tokens_per_second), number(r.average_seconds, 2),
+        number(r.seconds_since_last_call, 0), r.last_error || ""]})), row => row.stalled ? "stalled" : "");
+    document.getElementById("pies").replaceChildren(...stats.preferences.map(r => {
+      const total = r.preferred_a + r.preferred_b + r.identical_ties || 1;
+      const a = 360 * r.preferred_a / total, b = a + 360 * r.preferred_b / total;
+      const pie = element("div", null, "pie");
+      pie.style.background = `conic-gradient(${colors[0]} 0 ${a}deg, ${colors[1]} ${a}deg ${b}deg, ${colors[2]} ${b}deg 360deg)`;
+      const box = element("div");
+      box.append(element("div", `${r.evaluator} Evaluation`), element("div", `${r.model_bot_a} vs. ${r.model_bot_b}`), pie,
+        element("div", `${r.model_bot_a}: ${r.preferred_a}, ${r.model_bot_b}: ${r.preferred_b}, identical: ${r.identical_ties}`));
+      return box;
+    }));
+  } catch (error) {
+    document.getElementById("status").textContent = "Dashboard unreachable: " + error;
+  }
+}
+refresh();
+setInterval(refresh, REFRESH_MS);
+</script></body></html>
+'''
+
+
+# HTTP handler of the dashboard: the page, the statistics as JSON and the snapshots
+# (each snapshot is also written to the snapshot directory)
+class DashboardHandler(BaseHTTPRequestHandler):
+    live_stats = None
+    refresh_seconds = 5
+    snapshot_dir = 'charts_images'
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/":
+            page = PAGE.replace("REFRESH_MS", str(int(self.refresh_seconds * 1000)))
+            self._send(200, "text/html; charset=utf-8", page.encode("utf-8"))
+        elif path == "/stats.json":
+            self._send(200, "application/json", json.dumps(self.live_stats.snapshot()).encode("utf-8"))
+        elif path in ("/snapshot.png", "/snapshot.svg"):
+            fmt = path.rsplit(".", 1)[1]
+            try:
+                data = render_snapshot(self.live_stats.snapshot(), fmt)
+            except RuntimeError as e:
+                self._send(500, "text/plain", str(e).encode("utf-8"))
+                return
+            name = f"dashboard-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            with open(os.path.join(self.snapshot_dir, name), 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            self._send(200, "image/png" if fmt == "png" else "image/svg+xml", data)
+        else:
+            self._send(404, "text/plain", b"Not found")
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Poll the database every interval seconds until stop is set
+def poll_forever(live_stats, interval, stop):
+    while not stop.wait(interval):
+        try:
+            live_stats.poll()
+        except sqlite3.Error as e:
+            print(f"Failed to read {live_stats.db_path}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live dashboard of a run (running averages, preferences, throughput and error rates), read from the database as the run writes it.")
+    parser.add_argument("--db", default=os.getenv('COMPARE_MODELS_DB', DEFAULT_DB), help="SQLite database (default: COMPARE_MODELS_DB or %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8050, help="Port to listen on (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between two reads of the database and two page refreshes (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=300, help="Seconds of recent calls used for the throughput and error rates (default: %(default)s)")
+    parser.add_argument("--stall-seconds", type=int, default=120, help="Flag a model without any call for this many seconds (default: %(default)s)")
+    parser.add_argument("--snapshot-dir", default="charts_images", help="Directory of the snapshots requested from the page (default: %(default)s)")
+    parser.add_argument("--snapshot", action="append", help="Write a snapshot to this .png or .svg file and exit, without starting the server (repeatable)")
+    args = parser.parse_args()
+
+    live_stats = LiveStats(args.db, window=args.window, stall_seconds=args.stall_seconds)
+    try:
+        live_stats.poll()
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.snapshot:
+        for path in args.snapshot:
+            if os.path.splitext(path)[1].lstrip('.').lower() not in SNAPSHOT_FORMATS:
+                parser.error(f"Snapshot files must end with .png or .svg: {path}")
+            try:
+                print(f"Snapshot written to {write_snapshot(live_stats, path)}")
+            except RuntimeError as e:
+                parser.error(str(e))
+        live_stats.close()
+    else:
+        DashboardHandler.live_stats = live_stats
+        DashboardHandler.refresh_seconds = args.interval
+        DashboardHandler.snapshot_dir = args.snapshot_dir
+        stop = threading.Event()
+        threading.Thread(target=poll_forever, args=(live_stats, args.interval, stop), daemon=True).start()
+        server = ThreadingHTTPServer((args.host, args.port), DashboardHandler)
+        print(f"Dashboard of {args.db} on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+            live_stats.close()
@@ -0,0 +1,70 @@
+from functools import lru_cache
+from datasets import load_dataset, load_dataset_builder
+
+DEFAULT_DATASET = "microsoft/orca-math-word-problems-200k"
+
+
+# Cheap existence check: only the dataset metadata is resolved, no data is downloaded.
+# The result is cached for the lifetime of the process.
+@lru_cache(maxsize=128)
+def dataset_exists(dataset_name, split="train"):
+    if not dataset_name:
+        return False
+    try:
+        builder = load_dataset_builder(dataset_name)
+        splits = builder.info.splits
+        # Some datasets only know their splits once downloaded
+        return not splits or split in splits
+    except Exception:
+        return False
+
+
+# Iterate over (row_index, row) of a dataset split without loading the whole split.
+# - offset / limit select the rows [offset, offset + limit) of the split (or of the shuffled split)
+# - shuffle_seed shuffles the split with a fixed seed, so the same seed gives the same rows
+# - num_shards / shard_index keep only the rows of one worker (row_index % num_shards == shard_index)
+# - streaming=True reads the rows as they are needed (constant memory); streaming=False
+#   downloads and caches the dataset, then reads only the requested slice
+# row_index is the position of the row in the (shuffled) split, so it is stable between runs
+# using the same options.
+def iter_dataset_rows(dataset_name=DEFAULT_DATASET, split="train", offset=0, limit=None,
+                      shuffle_seed=None, num_shards=1, shard_index=0, streaming=True, shuffle_buffer_size=10000):
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be between 0 and {num_shards - 1}, got {shard_index}")
+    if streaming:
+        rows = load_dataset(dataset_name, split=split, streaming=True)
+        if shuffle_seed is not None:
+            rows = rows.shuffle(seed=shuffle_seed, buffer_size=shuffle_buffer_size)
+        if offset:
+            rows = rows.skip(offset)
+        if limit is not None:
+            rows = rows.take(limit)
+    elif shuffle_seed is None:
+        # Split slicing: only the requested rows are read from the cached dataset
+        end = "" if limit is None else offset + limit
+        rows = load_dataset(dataset_name, split=f"{split}[{offset}:{end}]")
+    else:
+        # Shuffling needs the whole split, but only the index mapping is shuffled in memory
+        rows = load_dataset(dataset_name, split=split).shuffle(seed=shuffle_seed)
+        end = len(rows) if limit is None else min(len(rows), offset + limit)
+        rows = rows.select(range(offset, end))
+
+    for position, row in enumerate(rows):
+        row_index = offset + position
+        if row_index % num_shards == shard_index:
+            yield row_index, row
+
+
+# Iterate over (row_index, question) for the given field, see iter_dataset_rows for the options
+def iter_dataset_questions(dataset_name=DEFAULT_DATASET, question_field="question", **options):
+    for row_index, row in iter_dataset_rows(dataset_name, **options):
+        yield row_index, row[question_field]
+
+
+# Iterate over (row_index, question, reference answer) for the given fields. The reference
+# answer is None when the dataset has no answer_field column.
+def iter_dataset_examples(dataset_name=DEFAULT_DATASET, question_field="question", answer_field="answer", **options):
+    for row_index, row in iter_dataset_rows(dataset_name, **options):
+        reference_answer = row.get(answer_field) if answer_field else None
+        yield row_index, row[question_field], None if reference_answer is None else str(reference_answer)
+
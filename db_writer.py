@@ -0,0 +1,199 @@
+import time
+import queue
+import sqlite3
+import threading
+from instrumentation import metrics
+
+_FLUSH = object()
+_INSERT = object()
+_STOP = object()
+
+
+# Rows the writer could not store, raised by flush() and close() (failures is a list of
+# (sql, params, error)), or the writer thread stopped by an unexpected error
+class DatabaseWriteError(RuntimeError):
+    def __init__(self, message, failures=()):
+        super().__init__(message)
+        self.failures = list(failures)
+
+
+# Single writer for the SQLite database.
+# Producers (any thread) push rows with write(); one background thread owns the only
+# connection (WAL mode) and commits them in batches with executemany, either every
+# batch_size rows or every flush_interval seconds, whichever comes first.
+# insert() writes one row right away (after the rows queued before it) and returns its id, for
+# the rows other rows refer to (e.g. the question_id used by the answers and comparisons); the
+# id comes from SQLite, so it is unique even when another process writes to the same file.
+# When a batch fails, its rows are written again one at a time; the rows that still fail are
+# raised by the next flush() or close().
+class DatabaseWriter:
+    def __init__(self, db_name="db_compare_models.db", batch_size=200, flush_interval=1.0):
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._failures = []
+        self._failures_lock = threading.Lock()
+        self._fatal_error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def connect(db_name):
+        conn = sqlite3.connect(db_name, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Queue one row to be written
+    def write(self, sql, params):
+        if self._closed:
+            raise RuntimeError("DatabaseWriter is closed")
+        self._check_thread()
+        self._queue.put((sql, params))
+
+    # Write one row now, with the rows queued before it, and return its id
+    def insert(self, sql, params):
+        if self._closed:
+            raise RuntimeError("DatabaseWriter is closed")
+        result = {}
+        done = threading.Event()
+        self._queue.put((_INSERT, (sql, params, result, done)))
+        self._wait(done)
+        if "error" in result:
+            raise result["error"]
+        return result["id"]
+
+    # Block until every row queued so far has been committed. Raises DatabaseWriteError for the
+    # rows that could not be written since the previous flush.
+    def flush(self):
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        self._wait(done)
+        self._raise_failures()
+
+    # Commit the remaining rows and stop the writer thread (raises like flush)
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        if self._fatal_error is not None:
+            raise DatabaseWriteError(f"The writer of {self.db_name} stopped: {self._fatal_error}") from self._fatal_error
+        self._raise_failures()
+
+    # Wait for the writer thread to handle a request, failing fast if it has stopped
+    def _wait(self, done):
+        while not done.wait(0.5):
+            self._check_thread()
+
+    def _check_thread(self):
+        if self._fatal_error is not None:
+            raise DatabaseWriteError(f"The writer of {self.db_name} stopped: {self._fatal_error}") from self._fatal_error
+        if not self._thread.is_alive():
+            raise DatabaseWriteError(f"The writer of {self.db_name} is not running.")
+
+    def _raise_failures(self):
+        with self._failures_lock:
+            failures, self._failures = self._failures, []
+        if failures:
+            sql, params, error = failures[0]
+            raise DatabaseWriteError(f"Failed to write {len(failures)} rows to {self.db_name}, first: {error} ({sql} {params})", failures)
+
+    def _run(self):
+        try:
+            conn = self.connect(self.db_name)
+        except sqlite3.Error as e:
+            self._fatal_error = e
+            return
+        batch = []
+        waiting = []
+        deadline = None
+        stop = False
+        try:
+            while not stop:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                insert = None
+                try:
+                    sql, params = self._queue.get(timeout=timeout)
+                    if sql is _FLUSH:
+                        waiting.append(params)
+                    elif sql is _INSERT:
+                        insert = params
+                    elif sql is _STOP:
+                        stop = True
+                    else:
+                        batch.append((sql, params))
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                except queue.Empty:
+                    pass
+                if batch and (stop or waiting or insert or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._commit(conn, batch)
+                    batch = []
+                    deadline = None
+                if insert:
+                    self._insert(conn, *insert)
+                for done in waiting:
+                    done.set()
+                waiting = []
+        except BaseException as e:
+            self._fatal_error = e
+            raise
+        finally:
+            conn.close()
+
+    def _insert(self, conn, sql, params, result, done):
+        try:
+            with metrics.timer("db_write"):
+                result["id"] = conn.execute(sql, params).lastrowid
+                conn.commit()
+            self.rows_written += 1
+            self.commits += 1
+        except sqlite3.Error as e:
+            conn.rollback()
+            result["error"] = e
+        finally:
+            done.set()
+
+    def _commit(self, conn, batch):
+        metrics.set_gauge("db_writer_queue_depth", self._queue.qsize())
+        try:
+            # Group consecutive rows of the same statement so that insertion order is kept
+            with metrics.timer("db_write"):
+                start = 0
+                while start < len(batch):
+                    end = start
+                    while end < len(batch) and batch[end][0] == batch[start][0]:
+                        end += 1
+                    conn.executemany(batch[start][0], [params for _, params in batch[start:end]])
+                    start = end
+                conn.commit()
+            self.rows_written += len(batch)
+            self.commits += 1
+            metrics.increment("db_rows_written", len(batch))
+        except sqlite3.Error:
+            metrics.increment("db_write_errors")
+            conn.rollback()
+            self._commit_one_by_one(conn, batch)
+
+    # Write the rows of a failed batch one at a time, keeping the failures for flush() and close()
+    def _commit_one_by_one(self, conn, batch):
+        written = 0
+        for sql, params in batch:
+            try:
+                conn.execute(sql, params)
+                conn.commit()
+                written += 1
+            except sqlite3.Error as e:
+                conn.rollback()
+                metrics.increment("db_rows_failed")
+                with self._failures_lock:
+                    self._failures.append((sql, params, e))
+        self.rows_written += written
+        self.commits += written
+        metrics.increment("db_rows_written", written)
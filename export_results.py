@@ -0,0 +1,287 @@
+import os
+import csv
+import gzip
+import json
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_DB = 'db_compare_models.db'
+DEFAULT_TABLES = ['questions', 'answers', 'comparisons', 'comparison_gpt4_claude3']
+FORMATS = ('csv', 'jsonl', 'parquet')
+# Name of the file recording the last exported id of each table, for --incremental
+STATE_FILE = 'export_state.json'
+
+# Columns holding a model name, used by the model filter: a row is exported when all of them
+# hold selected models (a judgment when its judge and both answer models are selected)
+MODEL_COLUMNS = ('model', 'model_evaluating', 'model_bot_a', 'model_bot_b')
+
+
+# Streaming export of the result tables. Rows are read with fetchmany in chunks of
+# chunk_size and written as they are read, so the memory used does not depend on the size of
+# the tables. Each table is exported by its own worker with its own connection.
+# - filters restrict the rows: {"since_id": id, "since_run": run id, "dataset": name, "models": [names]}
+# - CSV and JSONL files can be gzip-compressed; Parquet files use the given codec (pyarrow needed)
+class TableExporter:
+    def __init__(self, db_path=DEFAULT_DB, output_dir='.', fmt='csv', chunk_size=10000, compression=None, filters=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}")
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.filters = filters or {}
+
+    def _columns(self, conn, table):
+        return [(row[1], (row[2] or '').upper()) for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+    # SELECT statement and parameters of a table with the filters that apply to its columns
+    def _query(self, table, column_names):
+        conditions = []
+        params = []
+        since_id = self.filters.get('since_id')
+        if since_id is not None and 'id' in column_names:
+            conditions.append("id > ?")
+            params.append(since_id)
+
+        # Questions of the selected runs (from a run id, or of a dataset)
+        question_conditions = []
+        if self.filters.get('since_run') is not None:
+            question_conditions.append("run_id >= ?")
+            params_runs = [self.filters['since_run']]
+        else:
+            params_runs = []
+        if self.filters.get('dataset'):
+            question_conditions.append("run_id IN (SELECT id FROM runs WHERE dataset = ?)")
+            params_runs.append(self.filters['dataset'])
+        if question_conditions:
+            selected_questions = "SELECT question_id FROM run_questions WHERE " + " AND ".join(question_conditions)
+            if table == 'questions':
+                conditions.append(f"id IN ({selected_questions})")
+                params.extend(params_runs)
+            elif 'question_id' in column_names:
+                conditions.append(f"question_id IN ({selected_questions})")
+                params.extend(params_runs)
+            elif 'run_id' in column_names:
+                conditions.append(" AND ".join(question_conditions))
+                params.extend(params_runs)
+            elif table == 'runs':
+                run_conditions = [condition.replace("run_id", "id") for condition in question_conditions]
+                conditions.append(" AND ".join(run_conditions))
+                params.extend(params_runs)
+
+        models = self.filters.get('models')
+        if models:
+            placeholders = ", ".join("?" for _ in models)
+            model_columns = [column for column in MODEL_COLUMNS if column in column_names]
+            if table == 'models':
+                model_columns = ['name']
+            if model_columns:
+                conditions.extend(f"{column} IN ({placeholders})" for column in model_columns)
+                params.extend(list(models) * len(model_columns))
+
+        sql = f'SELECT * FROM "{table}"'
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if 'id' in column_names:
+            sql += " ORDER BY id"
+        return sql, params
+
+    def _path(self, table, suffix=''):
+        extension = {'csv': 'csv', 'jsonl': 'jsonl', 'parquet': 'parquet'}[self.fmt]
+        if self.fmt != 'parquet' and self.compression == 'gzip':
+            extension += '.gz'
+        return os.path.join(self.output_dir, f"{table}{suffix}.{extension}")
+
+    def _open_text(self, path):
+        if self.compression == 'gzip':
+            return gzip.open(path, 'wt', newline='', encoding='utf-8')
+        return open(path, 'w', newline='', encoding='utf-8')
+
+    # Export one table. Returns (table, rows written, largest id exported or None, path).
+    def export_table(self, table, suffix=''):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            columns = self._columns(conn, table)
+            column_names = [name for name, _ in columns]
+            sql, params = self._query(table, column_names)
+            cursor = conn.execute(sql, params)
+            path = self._path(table, suffix)
+            id_index = column_names.index('id') if 'id' in column_names else None
+            writer = {'csv': self._write_csv, 'jsonl': self._write_jsonl, 'parquet': self._write_parquet}[self.fmt]
+            rows, max_id = writer(path, cursor, columns, id_index)
+            return table, rows, max_id, path
+        finally:
+            conn.close()
+
+    def _chunks(self, cursor):
+        while True:
+            chunk = cursor.fetchmany(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def _write_csv(self, path, cursor, columns, id_index):
+        rows, max_id = 0, None
+        with self._open_text(path) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([name for name, _ in columns])  # Write the column headers
+            for chunk in self._chunks(cursor):
+                writer.writerows(chunk)
+                rows += len(chunk)
+                if id_index is not None:
+                    max_id = chunk[-1][id_index]
+        return rows, max_id
+
+    def _write_jsonl(self, path, cursor, columns, id_index):
+        rows, max_id = 0, None
+        names = [name for name, _ in columns]
+        with self._open_text(path) as jsonl_file:
+            for chunk in self._chunks(cursor):
+                jsonl_file.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in chunk)
+                rows += len(chunk)
+                if id_index is not None:
+                    max_id = chunk[-1][id_index]
+        return rows, max_id
+
+    def _write_parquet(self, path, cursor, columns, id_index):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("The parquet format needs pyarrow (pip install pyarrow).")
+        rows, max_id = 0, None
+        schema = None
+        writer = None
+        try:
+            for chunk in self._chunks(cursor):
+                values = list(zip(*chunk))
+                if schema is None:
+                    schema = pa.schema([(name, self._arrow_type(pa, declared, column_values))
+                                        for (name, declared), column_values in zip(columns, values)])
+                    writer = pq.ParquetWriter(path, schema, compression=self.compression or 'zstd')
+                writer.write_table(pa.Table.from_arrays([pa.array(column_values, type=field.type) for column_values, field in zip(values, schema)], schema=schema))
+                rows += len(chunk)
+                if id_index is not None:
+                    max_id = chunk[-1][id_index]
+            if writer is None:
+                # Empty table: write the schema only
+                schema = pa.schema([(name, self._arrow_type(pa, declared, ())) for name, declared in columns])
+                pq.write_table(schema.empty_table(), path, compression=self.compression or 'zstd')
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, max_id
+
+    # Arrow type of a column from its declared SQLite type (or from its values for view columns)
+    @staticmethod
+    def _arrow_type(pa, declared, values):
+        if 'INT' in declared:
+            return pa.int64()
+        if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+            return pa.float64()
+        if declared == '':
+            sample = next((value for value in values if value is not None), None)
+            if isinstance(sample, int):
+                return pa.int64()
+            if isinstance(sample, float):
+                return pa.float64()
+        return pa.string()
+
+    # Export several tables in parallel. Returns {table: (rows, max id, path)}.
+    def export_tables(self, tables, workers=4, suffixes=None):
+        os.makedirs(self.output_dir, exist_ok=True)
+        suffixes = suffixes or {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(self.export_table, table, suffixes.get(table, '')) for table in tables]
+            results = {}
+            for future in futures:
+                table, rows, max_id, path = future.result()
+                results[table] = (rows, max_id, path)
+        return results
+
+
+# Every table and view of a database
+def list_tables(db_path):
+    conn = sqlite3.connect(db_path)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    conn.close()
+    return tables
+
+
+def load_export_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as state_file:
+        return json.load(state_file)
+
+
+def save_export_state(output_dir, state):
+    with open(os.path.join(output_dir, STATE_FILE), 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2)
+
+
+# Export tables with incremental support: with incremental=True, only the rows added since the
+# previous export to the same directory (tables with an id column) are written, to files named
+# <table>.since-<id>.<ext>. Returns {table: (rows, max id, path)}.
+def export_results(db_path=DEFAULT_DB, tables=None, output_dir='.', fmt='csv', chunk_size=10000, compression=None,
+                   workers=4, filters=None, incremental=False):
+    tables = tables or DEFAULT_TABLES
+    filters = dict(filters or {})
+    state = load_export_state(output_dir) if incremental else {}
+    results = {}
+    # Tables exported from a different id are exported by separate exporters
+    groups = {}
+    for table in tables:
+        since_id = state.get(table, filters.get('since_id')) if incremental else filters.get('since_id')
+        groups.setdefault(since_id, []).append(table)
+    for since_id, group in groups.items():
+        group_filters = dict(filters, since_id=since_id)
+        exporter = TableExporter(db_path, output_dir, fmt, chunk_size, compression, group_filters)
+        suffixes = {table: f".since-{since_id}" for table in group} if since_id is not None else {}
+        results.update(exporter.export_tables(group, workers, suffixes))
+    if incremental:
+        for table, (rows, max_id, _) in results.items():
+            if max_id is not None:
+                state[table] = max_id
+        save_export_state(output_dir, state)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the result tables to CSV, JSONL or Parquet files, streaming the rows in chunks.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database (default: %(default)s)")
+    parser.add_argument("--tables", help=f"Comma-separated tables, or 'all' (default: {','.join(DEFAULT_TABLES)})")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="Output format (default: %(default)s)")
+    parser.add_argument("--output-dir", default=".", help="Output directory (default: current directory)")
+    parser.add_argument("--compression", help="gzip for CSV and JSONL; snappy, zstd (default), gzip or none for Parquet")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows read and written at a time (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="Tables exported in parallel (default: %(default)s)")
+    parser.add_argument("--since-id", type=int, help="Only export the rows with a larger id")
+    parser.add_argument("--since-run", type=int, help="Only export the questions (and their answers and judgments) of this run and the later ones")
+    parser.add_argument("--dataset", help="Only export the questions (and their answers and judgments) of the runs of this dataset")
+    parser.add_argument("--models", help="Comma-separated models: only export their answers and the judgments made by them on their answers")
+    parser.add_argument("--incremental", action="store_true", help=f"Only export the rows added since the previous export to the output directory (tracked in {STATE_FILE})")
+    args = parser.parse_args()
+
+    if args.tables == 'all':
+        tables = list_tables(args.db)
+    elif args.tables:
+        tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+    else:
+        tables = DEFAULT_TABLES
+    compression = args.compression
+    if args.format != 'parquet':
+        compression = None if compression == 'none' else compression
+        if compression not in (None, 'gzip'):
+            parser.error("CSV and JSONL files only support gzip compression.")
+    filters = {"since_id": args.since_id, "since_run": args.since_run, "dataset": args.dataset,
+               "models": [model.strip() for model in args.models.split(",")] if args.models else None}
+
+    results = export_results(args.db, tables, args.output_dir, args.format, args.chunk_size, compression,
+                             args.workers, filters, args.incremental)
+    for table in tables:
+        rows, max_id, path = results[table]
+        print(f"Data from table '{table}' has been written to {path} ({rows} rows{f', last id {max_id}' if max_id is not None else ''})")
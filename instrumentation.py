@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import random
+import threading
+
+
+# Context manager returned by Metrics.timer() when metrics are disabled
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started_at)
+        return False
+
+
+# Timers, counters and gauges for the hot path of a run.
+# Durations are kept per stage (a uniform sample of at most max_samples values per stage) for
+# the percentiles of the end-of-run summary; every observation can also be appended to a JSONL
+# file, and the current values written in the Prometheus text format.
+# When disabled, timer() returns a shared no-op context manager and the other methods return
+# immediately, so the instrumentation costs next to nothing.
+class Metrics:
+    def __init__(self, enabled=False, jsonl_path=None, max_samples=100000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.counters = {}
+        self.gauges = {}
+        self.gauge_peaks = {}
+        self._lock = threading.Lock()
+        self._jsonl_file = None
+        if enabled and jsonl_path:
+            self._jsonl_file = open(jsonl_path, 'a', encoding='utf-8')
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    # Record one duration (in seconds) for a stage
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            count = self.counts.get(stage, 0) + 1
+            self.counts[stage] = count
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            samples = self.samples.setdefault(stage, [])
+            if len(samples) < self.max_samples:
+                samples.append(seconds)
+            else:
+                # Reservoir sampling keeps a uniform sample of all the durations
+                index = random.randrange(count)
+                if index < self.max_samples:
+                    samples[index] = seconds
+            if self._jsonl_file:
+                self._jsonl_file.write(json.dumps({"time": time.time(), "stage": stage, "seconds": seconds}) + "\n")
+
+    def increment(self, counter, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def set_gauge(self, gauge, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[gauge] = value
+            if value > self.gauge_peaks.get(gauge, value - 1):
+                self.gauge_peaks[gauge] = value
+
+    # Time each item produced by an iterable (e.g. the rows read from a dataset)
+    def timed_iter(self, stage, iterable):
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - started_at)
+            yield item
+
+    @staticmethod
+    def _percentile(sorted_values, fraction):
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+        return sorted_values[index]
+
+    # {stage: {"count", "total", "mean", "p50", "p95", "p99", "max"}} in seconds
+    def stage_summary(self):
+        with self._lock:
+            summary = {}
+            for stage, samples in self.samples.items():
+                values = sorted(samples)
+                summary[stage] = {
+                    "count": self.counts[stage],
+                    "total": self.totals[stage],
+                    "mean": self.totals[stage] / self.counts[stage],
+                    "p50": self._percentile(values, 0.50),
+                    "p95": self._percentile(values, 0.95),
+                    "p99": self._percentile(values, 0.99),
+                    "max": values[-1],
+                }
+            return summary
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+        print("Stage timings (ms):")
+        print(f"{'stage':<20}{'count':>10}{'total (s)':>12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for stage, values in sorted(self.stage_summary().items()):
+            print(f"{stage:<20}{values['count']:>10}{values['total']:>12.2f}"
+                  f"{values['p50'] * 1000:>10.1f}{values['p95'] * 1000:>10.1f}{values['p99'] * 1000:>10.1f}{values['max'] * 1000:>10.1f}")
+        for counter, value in sorted(self.counters.items()):
+            print(f"{counter}: {value}")
+        for gauge, value in sorted(self.gauge_peaks.items()):
+            print(f"{gauge} (peak): {value}")
+
+    # Write the current metrics in the Prometheus text exposition format
+    def write_prometheus(self, path):
+        if not self.enabled:
+            return
+        lines = []
+        lines.append("# TYPE compare_models_stage_seconds summary")
+        for stage, values in sorted(self.stage_summary().items()):
+            for quantile in ("0.5", "0.95", "0.99"):
+                key = {"0.5": "p50", "0.95": "p95", "0.99": "p99"}[quantile]
+                lines.append(f'compare_models_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {values[key]}')
+            lines.append(f'compare_models_stage_seconds_sum{{stage="{stage}"}} {values["total"]}')
+            lines.append(f'compare_models_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        for counter, value in counters:
+            lines.append(f"# TYPE compare_models_{counter}_total counter")
+            lines.append(f"compare_models_{counter}_total {value}")
+        for gauge, value in gauges:
+            lines.append(f"# TYPE compare_models_{gauge} gauge")
+            lines.append(f"compare_models_{gauge} {value}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if self._jsonl_file:
+            self._jsonl_file.close()
+            self._jsonl_file = None
+
+    # Enable (or disable) the metrics after import, e.g. from the command line
+    def configure(self, enabled, jsonl_path=None):
+        self.close()
+        self.enabled = enabled
+        if enabled and jsonl_path:
+            self._jsonl_file = open(jsonl_path, 'a', encoding='utf-8')
+
+
+# Metrics shared by every module of a run, disabled unless METRICS=1 (or --metrics)
+metrics = Metrics(enabled=os.getenv('METRICS', '').strip().lower() in ('1', 'true', 'yes'),
+                  jsonl_path=os.getenv('METRICS_JSONL'))
@@ -0,0 +1,72 @@
+import json
+import hashlib
+import unicodedata
+from judgment_parser import Judgment
+
+# Deduplication of the judge calls. A judgment is identified by the hash of the normalized
+# question, answer A, answer B and judge (in this order: both presentation orders are asked on
+# purpose, to balance the position bias), stored in comparisons.judgment_key. Before a judge is
+# called, the judgments that need no call are settled:
+# - both answers identical: recorded as a tie without scores
+# - same key already judged, in this run or an earlier one: the judgment is reused
+# Pairs with a failed answer are not judged at all (the answer is fetched again with --resume).
+
+IDENTICAL_ANSWERS_EXPLANATION = "Both answers are identical: recorded as a tie without calling the judge."
+
+
+# Unicode-normalized text with collapsed whitespace
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def judgment_key(question, answer_a, answer_b, judge):
+    data = json.dumps([normalize_text(question), normalize_text(answer_a), normalize_text(answer_b), judge], ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# A failed answer call is stored as None; an empty reply is not worth judging either
+def is_failed_answer(answer):
+    return answer is None or not str(answer).strip()
+
+
+def answers_identical(answer_a, answer_b):
+    return normalize_text(answer_a) == normalize_text(answer_b)
+
+
+# Judgments already known by key: the ones recorded by this process, then the ones stored in the
+# database. lookup is a read connection; lookups only see committed rows.
+class JudgmentIndex:
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self._recorded = {}  # key -> (question_id, Judgment)
+        self._ties = set()  # (key, question_id) of the identical-answer ties recorded
+        self.reused = 0
+        self.ties = 0
+
+    def add(self, key, question_id, judgment):
+        if key is not None:
+            self._recorded[key] = (question_id, judgment)
+
+    def add_tie(self, key, question_id):
+        self._ties.add((key, question_id))
+
+    # True when the identical-answer tie with this key is already stored for the question
+    def has_tie(self, key, question_id):
+        if (key, question_id) in self._ties:
+            return True
+        row = self.lookup.execute("SELECT 1 FROM comparisons WHERE judgment_key = ? AND question_id = ? AND score_a IS NULL LIMIT 1",
+                                  (key, question_id)).fetchone()
+        return row is not None
+
+    # (question_id, Judgment) of a previous judgment with this key, or None
+    def find(self, key):
+        if key in self._recorded:
+            return self._recorded[key]
+        row = self.lookup.execute('''SELECT question_id, model_bot_a, preferred_answer, score_a, score_b, explanation FROM comparisons
+            WHERE judgment_key = ? AND score_a IS NOT NULL ORDER BY id DESC LIMIT 1''', (key,)).fetchone()
+        if row is None:
+            return None
+        question_id, model_bot_a, preferred_answer, score_a, score_b, explanation = row
+        found = (question_id, Judgment(explanation, score_a, score_b, 'A' if preferred_answer == model_bot_a else 'B'))
+        self._recorded[key] = found
+        return found
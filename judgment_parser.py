@@ -0,0 +1,186 @@
+import re
+import json
+
+JUDGMENT_FIELDS = ("explanation", "score_a", "score_b", "better_answer")
+
+# JSON schema of a judgment, used for the provider structured-output modes (tool input schema)
+JUDGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "explanation": {"type": "string", "description": "A detailed narrative explaining the reasoning behind the comparison."},
+        "score_a": {"type": "integer", "minimum": 0, "maximum": 100, "description": "Quality of answer A, between 0 and 100."},
+        "score_b": {"type": "integer", "minimum": 0, "maximum": 100, "description": "Quality of answer B, between 0 and 100."},
+        "better_answer": {"type": "string", "enum": ["A", "B"], "description": "The superior answer, 'A' or 'B'."},
+    },
+    "required": list(JUDGMENT_FIELDS),
+}
+
+# Name of the tool the Anthropic judges are asked to call with their judgment
+JUDGMENT_TOOL_NAME = "record_judgment"
+
+# A backslash escape: \uXXXX or one escaped character
+_ESCAPE_PATTERN = re.compile(r'\\(u[0-9a-fA-F]{4}|.)', re.DOTALL)
+_VALID_ESCAPES = set('"\\/bfnrt')
+# LaTeX commands starting like the \n, \r and \t escapes (see _repair_escapes)
+_LATEX_COMMANDS = frozenset((
+    'nabla', 'ne', 'neg', 'neq', 'newline', 'ngeq', 'ni', 'nleq', 'nmid', 'not', 'notin', 'nu',
+    'rangle', 'rbrace', 'rceil', 'rfloor', 'rho', 'right', 'rightarrow', 'rm',
+    'tan', 'tanh', 'tau', 'text', 'textbf', 'textit', 'textrm', 'tfrac', 'therefore', 'theta', 'tilde', 'times', 'to', 'top', 'triangle',
+))
+_LETTERS_PATTERN = re.compile(r'[A-Za-z]*')
+# Opening brace of a JSON object: a key or an empty object follows
+_OBJECT_START_PATTERN = re.compile(r'\{\s*["}]')
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+# 'A' or 'B' as the first word of better_answer, e.g. "B", "**A**", "Answer B", "A. It is clearer"
+_BETTER_ANSWER_PATTERN = re.compile(r'^\W*(?:answer\W+)?([AB])\b', re.IGNORECASE)
+
+
+class JudgmentParseError(ValueError):
+    pass
+
+
+# A validated judgment: the scores are integers between 0 and 100 and better_answer is 'A' or 'B'
+class Judgment:
+    def __init__(self, explanation, score_a, score_b, better_answer):
+        self.explanation = explanation
+        self.score_a = score_a
+        self.score_b = score_b
+        self.better_answer = better_answer
+
+    def __repr__(self):
+        return f"Judgment(score_a={self.score_a!r}, score_b={self.score_b!r}, better_answer={self.better_answer!r})"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in JUDGMENT_FIELDS}
+
+
+# Escape the backslashes that are not valid JSON escapes, leaving the valid ones untouched.
+# \b and \f followed by a letter are taken as LaTeX (\frac, \boxed), which models often leave
+# unescaped, rather than as backspace and form feed. \n, \r and \t are only taken as LaTeX when
+# they start a known command (\neq, \right, \times): "\nThe" is a newline.
+def _repair_escapes(json_str):
+    def repair(match):
+        escaped = match.group(1)
+        if escaped in 'bf':
+            latex = json_str[match.end():match.end() + 1].isalpha()
+        else:
+            latex = escaped in 'nrt' and escaped + _LETTERS_PATTERN.match(json_str, match.end()).group() in _LATEX_COMMANDS
+        if len(escaped) > 1 or (escaped in _VALID_ESCAPES and not latex):
+            return match.group(0)
+        return '\\\\' + escaped
+    return _ESCAPE_PATTERN.sub(repair, json_str)
+
+
+# Decode a JSON object, tolerating raw newlines inside strings and unescaped backslashes.
+# The escapes are repaired before decoding: \frac and \boxed are valid JSON (form feed and
+# backspace), so they would otherwise be decoded silently.
+def _decode_object(json_str):
+    value = json.loads(_repair_escapes(json_str), strict=False)
+    if not isinstance(value, dict):
+        raise json.JSONDecodeError("Not a JSON object", json_str, 0)
+    return value
+
+
+# Return the first balanced {...} object of a text that decodes as JSON and has the required keys,
+# scanning the text once (braces inside JSON strings are ignored). Surrounding prose and
+# markdown fences are skipped.
+def find_json_object(text, required_keys=()):
+    # Objects being scanned: (start, objects closed directly inside it)
+    open_objects = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"' and open_objects:
+            in_string = True
+        elif char == '{':
+            open_objects.append((i, []))
+        elif char == '}' and open_objects:
+            start, nested = open_objects.pop()
+            if open_objects:
+                open_objects[-1][1].append((start, i + 1, nested))
+                continue
+            value = _first_object(text, (start, i + 1, nested), required_keys)
+            if value is not None:
+                return value
+    return None
+
+
+# First object of a balanced group (start, end, nested groups) that decodes and has the required
+# keys. A group that is not JSON (e.g. a LaTeX group) is skipped and the groups nested in it are
+# tried instead, so each group is decoded at most once.
+def _first_object(text, group, required_keys):
+    groups = [group]
+    while groups:
+        start, end, nested = groups.pop()
+        if _OBJECT_START_PATTERN.match(text, start):
+            try:
+                value = _decode_object(text[start:end])
+                if all(key in value for key in required_keys):
+                    return value
+                continue
+            except json.JSONDecodeError:
+                pass
+        groups.extend(reversed(nested))
+    return None
+
+
+def _parse_score(value, field):
+    if isinstance(value, bool):
+        raise JudgmentParseError(f"Invalid {field}: {value!r}")
+    if isinstance(value, (int, float)):
+        score = value
+    else:
+        # Scores sent as strings, e.g. "85" or "85/100"
+        match = _NUMBER_PATTERN.search(str(value))
+        if not match:
+            raise JudgmentParseError(f"Invalid {field}: {value!r}")
+        score = float(match.group(0))
+    score = int(round(score))
+    if not 0 <= score <= 100:
+        raise JudgmentParseError(f"{field} out of range: {value!r}")
+    return score
+
+
+# Validate a decoded judgment and return it as a Judgment.
+# better_answer may be 'A', 'B', or a sentence starting with them; when it is missing or
+# unusable (e.g. "Both", "Tie") it is taken from the scores, unless they are equal.
+def validate_judgment(data):
+    missing = [field for field in ("score_a", "score_b") if field not in data]
+    if missing:
+        raise JudgmentParseError(f"Missing fields: {', '.join(missing)}")
+    score_a = _parse_score(data["score_a"], "score_a")
+    score_b = _parse_score(data["score_b"], "score_b")
+    match = _BETTER_ANSWER_PATTERN.match(str(data.get("better_answer", "")))
+    better_answer = match.group(1).upper() if match else None
+    if better_answer is None:
+        if score_a == score_b:
+            raise JudgmentParseError(f"Invalid better_answer: {data.get('better_answer')!r}")
+        better_answer = "A" if score_a > score_b else "B"
+    explanation = data.get("explanation")
+    explanation = "" if explanation is None else str(explanation)
+    return Judgment(explanation, score_a, score_b, better_answer)
+
+
+# Parse a judge response (plain JSON, JSON surrounded by text, or the input of the judgment tool)
+def parse_judgment(response):
+    if isinstance(response, dict):
+        return validate_judgment(response)
+    data = find_json_object(response or "", required_keys=("score_a", "score_b"))
+    if data is None:
+        raise JudgmentParseError("No JSON object found in the response")
+    return validate_judgment(data)
+
+
+# Text of an Anthropic message: the text blocks, or the JSON input of a tool call
+def anthropic_content_text(content):
+    for block in content:
+        if getattr(block, "type", "text") == "tool_use":
+            return json.dumps(block.input)
+    return "".join(block.text for block in content if getattr(block, "type", "text") == "text")
@@ -0,0 +1,160 @@
+import hashlib
+from aggregates import rebuild_summary_tables, create_summary_triggers
+from accuracy import initialize_accuracy_table
+from token_accounting import initialize_token_usage_table
+
+# Versioned schema migrations. The version of a database is stored in PRAGMA user_version;
+# apply_migrations runs the missing migrations in order, each one in its own transaction.
+# Add new migrations at the end of MIGRATIONS, never change the ones already released.
+
+
+# Content hash of a question, used to store each distinct question once
+def question_hash(question):
+    return hashlib.sha256(question.encode("utf-8")).hexdigest()
+
+
+# Indexes for the lookups by question (resume, answer replacement, judgments of a question) and
+# by evaluator and pair (summary rebuild, active sampling), covering the columns they read
+def _add_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_answers_question_model ON answers (question_id, model)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comparisons_question ON comparisons (question_id, model_evaluating, model_bot_a, model_bot_b)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comparisons_evaluator_pair ON comparisons (model_evaluating, model_bot_a, model_bot_b, preferred_answer, score_a, score_b)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comparisons_pair ON comparisons (model_bot_a, model_bot_b, preferred_answer)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_run_questions_question ON run_questions (question_id)")
+
+
+# Replace the comparison_gpt4_claude3 table, a second copy of the GPT-4 vs Claude3 judgments,
+# with a view over comparisons. Rows only present in the table are copied to comparisons first.
+def _wide_table_to_view(c):
+    kind = c.execute("SELECT type FROM sqlite_master WHERE name = 'comparison_gpt4_claude3'").fetchone()
+    if kind and kind[0] == "table":
+        c.execute('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
+            SELECT wide.question_id, wide.model_evaluating, wide.preferred_answer, wide.model_bot_a, wide.model_bot_b,
+                   CASE WHEN wide.model_bot_a = 'GPT-4' THEN wide.score_GPT4 ELSE wide.score_Claude3 END,
+                   CASE WHEN wide.model_bot_a = 'GPT-4' THEN wide.score_Claude3 ELSE wide.score_GPT4 END,
+                   wide.explanation
+            FROM comparison_gpt4_claude3 AS wide
+            WHERE NOT EXISTS (SELECT 1 FROM comparisons
+                              WHERE comparisons.question_id = wide.question_id AND comparisons.model_evaluating = wide.model_evaluating
+                                AND comparisons.model_bot_a = wide.model_bot_a AND comparisons.model_bot_b = wide.model_bot_b
+                                AND comparisons.explanation IS wide.explanation)
+            ORDER BY wide.id''')
+        c.execute("DROP TABLE comparison_gpt4_claude3")
+    c.execute('''CREATE VIEW IF NOT EXISTS comparison_gpt4_claude3 AS
+        SELECT id, question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b,
+               CASE WHEN model_bot_a = 'GPT-4' THEN score_a ELSE score_b END AS score_GPT4,
+               CASE WHEN model_bot_a = 'GPT-4' THEN score_b ELSE score_a END AS score_Claude3,
+               explanation
+        FROM comparisons
+        WHERE (model_bot_a = 'GPT-4' AND model_bot_b = 'Claude3') OR (model_bot_a = 'Claude3' AND model_bot_b = 'GPT-4')''')
+
+
+# Store each distinct question once: add questions.content_hash (unique) and merge the
+# duplicated questions into the first one. Their answers and judgments are moved to it; the
+# answers of the first question are kept (the surviving judgments were made on them), and the
+# earliest answer of the duplicates for the models it has none.
+def _dedupe_questions(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(questions)")]
+    if "content_hash" not in columns:
+        c.execute("ALTER TABLE questions ADD COLUMN content_hash TEXT")
+    rows = c.execute("SELECT id, question FROM questions WHERE content_hash IS NULL ORDER BY id").fetchall()
+    c.executemany("UPDATE questions SET content_hash = ? WHERE id = ?",
+                  [(question_hash(question or ""), question_id) for question_id, question in rows])
+
+    c.execute('''CREATE TEMP TABLE question_merges AS
+        SELECT questions.id AS old_id, kept.id AS new_id
+        FROM questions JOIN (SELECT content_hash, MIN(id) AS id FROM questions GROUP BY content_hash) AS kept
+          ON questions.content_hash = kept.content_hash
+        WHERE questions.id <> kept.id''')
+    merged = c.execute("SELECT COUNT(*) FROM question_merges").fetchone()[0]
+    if merged:
+        c.execute('''DELETE FROM answers WHERE question_id IN (SELECT old_id FROM question_merges)
+            AND EXISTS (SELECT 1 FROM answers AS kept JOIN question_merges ON kept.question_id = question_merges.new_id
+                        WHERE question_merges.old_id = answers.question_id AND kept.model = answers.model)''')
+        for table in ("answers", "comparisons", "run_questions"):
+            c.execute(f'''UPDATE {table} SET question_id = (SELECT new_id FROM question_merges WHERE old_id = {table}.question_id)
+                WHERE question_id IN (SELECT old_id FROM question_merges)''')
+        c.execute('''DELETE FROM answers WHERE id NOT IN (SELECT MIN(id) FROM answers GROUP BY question_id, model)''')
+        c.execute("DELETE FROM questions WHERE id IN (SELECT old_id FROM question_merges)")
+        # The per-question scores are keyed on the question ids that were just merged
+        rebuild_summary_tables(c)
+        print(f"Merged {merged} duplicated questions.")
+    c.execute("DROP TABLE question_merges")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_content_hash ON questions (content_hash)")
+
+
+# Reference answers of the dataset questions and the accuracy of the answers against them
+def _add_reference_answers(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(questions)")]
+    if "reference_answer" not in columns:
+        c.execute("ALTER TABLE questions ADD COLUMN reference_answer TEXT")
+    initialize_accuracy_table(c)
+
+
+# Tokens of each API call, measured locally
+def _add_token_usage(c):
+    initialize_token_usage_table(c)
+
+
+# Judgment keys used to reuse judgments (see judgment_dedup.py), and the identical-answer ties:
+# comparisons without scores, counted apart in the summaries. Judgments stored before this
+# version have no key and are not reused.
+def _add_judgment_keys(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(comparisons)")]
+    if "judgment_key" not in columns:
+        c.execute("ALTER TABLE comparisons ADD COLUMN judgment_key TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comparisons_judgment_key ON comparisons (judgment_key)")
+    columns = [row[1] for row in c.execute("PRAGMA table_info(comparison_summary)")]
+    if "identical_ties" not in columns:
+        c.execute("ALTER TABLE comparison_summary ADD COLUMN identical_ties INTEGER DEFAULT 0")
+    c.execute("DROP TRIGGER IF EXISTS comparisons_summary_insert")
+    c.execute("DROP TRIGGER IF EXISTS comparisons_summary_delete")
+    create_summary_triggers(c)
+
+
+# Error of the failed calls (exception, missing batch response or unparsable judgment), NULL for
+# the successful ones; read by the dashboard for the error rates
+def _add_usage_errors(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(token_usage)")]
+    if "error" not in columns:
+        c.execute("ALTER TABLE token_usage ADD COLUMN error TEXT")
+
+
+# (version, description, migration function taking a cursor)
+MIGRATIONS = [
+    (1, "add covering indexes", _add_indexes),
+    (2, "replace comparison_gpt4_claude3 with a view", _wide_table_to_view),
+    (3, "dedupe questions by content hash", _dedupe_questions),
+    (4, "add reference answers and answer accuracy", _add_reference_answers),
+    (5, "add token usage", _add_token_usage),
+    (6, "add judgment keys and identical-answer ties", _add_judgment_keys),
+    (7, "add the error of the failed calls to token usage", _add_usage_errors),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Bring a database to the latest schema version (called from initialize_db, after the tables
+# of the original schema are created). Returns the versions applied.
+def apply_migrations(conn):
+    applied = []
+    current = schema_version(conn)
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.commit()
+        conn.execute("BEGIN")
+        try:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied database migration {version}: {description}")
+        applied.append(version)
+    return applied
@@ -0,0 +1,72 @@
+import json
+from itertools import permutations
+
+SUPPORTED_PROVIDERS = ("openai", "anthropic")
+
+
+# A model that can answer questions and judge answers.
+# - name is the label stored in the database (answers.model, comparisons.model_bot_a, ...)
+# - provider selects the API client ('openai' or 'anthropic')
+# - model_id is the provider's model identifier
+# - params are extra request parameters (e.g. max_tokens, temperature)
+# - prices are the (input, output) prices in dollars per million tokens, used by the dry-run
+#   cost estimate (None when unknown)
+class ModelSpec:
+    def __init__(self, name, provider, model_id, params=None, prices=None):
+        if provider not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"Unsupported provider '{provider}' for model '{name}', expected one of {SUPPORTED_PROVIDERS}")
+        self.name = name
+        self.provider = provider
+        self.model_id = model_id
+        self.params = dict(params or {})
+        self.prices = tuple(prices) if prices else None
+
+    def __repr__(self):
+        return f"ModelSpec({self.name!r}, {self.provider!r}, {self.model_id!r}, {self.params!r})"
+
+
+# Registered models by name
+MODEL_REGISTRY = {}
+
+
+def register_model(name, provider, model_id, prices=None, **params):
+    MODEL_REGISTRY[name] = ModelSpec(name, provider, model_id, params, prices)
+    return MODEL_REGISTRY[name]
+
+
+# The two models compared since the beginning of the project
+register_model("GPT-4", "openai", "gpt-4-turbo-preview", prices=(10.0, 30.0))
+register_model("Claude3", "anthropic", "claude-3-opus-20240229", prices=(15.0, 75.0), max_tokens=1000)
+
+DEFAULT_MODELS = ["GPT-4", "Claude3"]
+
+
+# Register the models listed in a JSON file:
+# [{"name": "GPT-4o", "provider": "openai", "model_id": "gpt-4o", "params": {"temperature": 0}, "prices": [2.5, 10]}, ...]
+def load_models_file(path):
+    with open(path, 'r', encoding='utf-8') as models_file:
+        entries = json.load(models_file)
+    return [register_model(entry["name"], entry["provider"], entry["model_id"], entry.get("prices"), **entry.get("params", {})) for entry in entries]
+
+
+# Look up registered models by name
+def get_models(names):
+    unknown = [name for name in names if name not in MODEL_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)}. Registered models: {', '.join(MODEL_REGISTRY)}")
+    return [MODEL_REGISTRY[name] for name in names]
+
+
+# Parse a comma-separated list of registered model names (e.g. from the command line)
+def parse_model_names(value):
+    return [spec.name for spec in get_models([name.strip() for name in value.split(",") if name.strip()])]
+
+
+# Every judgment of an N-model tournament as (judge, model_bot_a, model_bot_b):
+# each judge sees every ordered pair of models, so both presentation orders are judged.
+# With the two default models this is the original four judgments per question.
+def tournament_pairings(model_names, judge_names=None):
+    judge_names = model_names if judge_names is None else judge_names
+    return [(judge, model_bot_a, model_bot_b)
+            for judge in judge_names
+            for model_bot_a, model_bot_b in permutations(model_names, 2)]
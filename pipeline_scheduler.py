@@ -0,0 +1,230 @@
+import time
+import heapq
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from instrumentation import metrics
+
+# Stages a question goes through. Judging tasks get a higher priority than answer
+# tasks so that questions already in flight are finished before new ones are started.
+STAGE_ANSWERS = 1
+STAGE_COMPARISONS = 0
+
+# Name of the timer of each stage's calls
+STAGE_TIMERS = {STAGE_ANSWERS: "answer_call", STAGE_COMPARISONS: "comparison_call"}
+
+
+# Keeps track of the work left for one question while it moves through the pipeline
+class QuestionState:
+    def __init__(self, index, question):
+        self.index = index
+        self.question = question
+        self.stage = STAGE_ANSWERS
+        self.tasks = []
+        self.results = []
+        self.remaining = 0
+        self.answers = None
+
+
+# Pipelined scheduler: answers for question N+1 are fetched while question N is being judged.
+# - max_workers is the global number of API calls in flight
+# - provider_limits maps a provider (by default the task 'type', e.g. 'GPT-4') to its own limit
+# - max_pending_questions bounds how many questions are started before older ones are finished
+# The callbacks (on_answers / on_comparisons) always run on the thread calling run(),
+# so they can safely write to the database.
+class PipelineScheduler:
+    def __init__(self, fetch_answer, fetch_comparison, max_workers=8, provider_limits=None,
+                 max_pending_questions=None, provider_of=None, report_every=10):
+        self.fetch_answer = fetch_answer
+        self.fetch_comparison = fetch_comparison
+        self.max_workers = max(1, int(max_workers))
+        self.provider_limits = {provider: max(1, int(limit)) for provider, limit in (provider_limits or {}).items()}
+        self.max_pending_questions = max_pending_questions or 2 * self.max_workers
+        self.provider_of = provider_of or (lambda task: task['type'])
+        self.report_every = report_every
+        self.questions_completed = 0
+        self.calls_completed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    # Number of questions fully processed (answered and judged) per minute
+    def questions_per_minute(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.questions_completed * 60 / elapsed if elapsed > 0 else 0.0
+
+    def _call(self, stage, task):
+        with metrics.timer(STAGE_TIMERS[stage]):
+            if stage == STAGE_ANSWERS:
+                return self.fetch_answer(task)
+            return self.fetch_comparison(task)
+
+    # Run every question through both stages.
+    # - on_answers(question, answer_tasks, answers) returns the list of comparison tasks for that question
+    # - on_comparisons(question, comparison_tasks, comparison_results) records the judgments
+    def run(self, questions, answer_tasks_for, on_answers, on_comparisons):
+        questions = iter(questions)
+        exhausted = False
+        next_index = 0
+        open_questions = 0
+        ready = []  # heap of (stage, question index, task index, state)
+        provider_in_flight = {}
+        in_flight = {}  # future -> (state, task index, provider)
+
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Start new questions while the pipeline has room for them
+                while not exhausted and open_questions < self.max_pending_questions:
+                    try:
+                        question = next(questions)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    state = QuestionState(next_index, question)
+                    next_index += 1
+                    open_questions += 1
+                    self._queue_stage(state, answer_tasks_for(question), ready)
+                    if not state.tasks and self._advance(state, on_answers, on_comparisons, ready):
+                        open_questions -= 1
+
+                # Dispatch ready tasks respecting the global and per-provider limits
+                deferred = []
+                while ready and len(in_flight) < self.max_workers:
+                    item = heapq.heappop(ready)
+                    stage, _, task_index, state = item
+                    task = state.tasks[task_index]
+                    provider = self.provider_of(task)
+                    limit = self.provider_limits.get(provider)
+                    if limit is not None and provider_in_flight.get(provider, 0) >= limit:
+                        deferred.append(item)
+                        continue
+                    provider_in_flight[provider] = provider_in_flight.get(provider, 0) + 1
+                    future = executor.submit(self._call, stage, task)
+                    in_flight[future] = (state, task_index, provider)
+                for item in deferred:
+                    heapq.heappush(ready, item)
+                metrics.set_gauge("scheduler_in_flight", len(in_flight))
+                metrics.set_gauge("scheduler_queue_depth", len(ready))
+                metrics.set_gauge("scheduler_open_questions", open_questions)
+
+                if not in_flight:
+                    if exhausted and not ready:
+                        break
+                    continue
+
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    state, task_index, provider = in_flight.pop(future)
+                    provider_in_flight[provider] -= 1
+                    state.results[task_index] = future.result()
+                    state.remaining -= 1
+                    self.calls_completed += 1
+                    if not state.remaining and self._advance(state, on_answers, on_comparisons, ready):
+                        open_questions -= 1
+        self.finished_at = time.monotonic()
+        return self.questions_completed
+
+    # Move a question to its next stage once all its tasks are done.
+    # Returns True when the question is fully processed.
+    def _advance(self, state, on_answers, on_comparisons, ready):
+        while True:
+            if state.stage == STAGE_COMPARISONS:
+                on_comparisons(state.question, state.tasks, state.results)
+                self._question_done()
+                return True
+            state.answers = state.results
+            state.stage = STAGE_COMPARISONS
+            self._queue_stage(state, on_answers(state.question, state.tasks, state.answers) or [], ready)
+            if state.tasks:
+                return False
+
+    def _queue_stage(self, state, tasks, ready):
+        state.tasks = list(tasks)
+        state.results = [None] * len(state.tasks)
+        state.remaining = len(state.tasks)
+        for task_index in range(len(state.tasks)):
+            heapq.heappush(ready, (state.stage, state.index, task_index, state))
+
+    def _question_done(self):
+        self.questions_completed += 1
+        if self.report_every and self.questions_completed % self.report_every == 0:
+            print(f"Processed {self.questions_completed} questions "
+                  f"({self.questions_per_minute():.1f} questions/min)")
+
+
+# asyncio version of PipelineScheduler: fetch_answer / fetch_comparison are coroutines,
+# so hundreds of requests can be in flight from one thread. The global and per-provider
+# limits are enforced with bounded semaphores. The callbacks are plain functions and run
+# on the event loop thread.
+class AsyncPipelineScheduler(PipelineScheduler):
+    def __init__(self, fetch_answer, fetch_comparison, max_workers=64, provider_limits=None,
+                 max_pending_questions=None, provider_of=None, report_every=10):
+        super().__init__(fetch_answer, fetch_comparison, max_workers=max_workers,
+                         provider_limits=provider_limits, max_pending_questions=max_pending_questions,
+                         provider_of=provider_of, report_every=report_every)
+        # Calls waiting for a semaphore and calls in flight, for the gauges
+        self._waiting = 0
+        self._in_flight = 0
+
+    def _call(self, stage, task):
+        if stage == STAGE_ANSWERS:
+            return self.fetch_answer(task)
+        return self.fetch_comparison(task)
+
+    async def _timed_call(self, stage, task):
+        self._waiting -= 1
+        self._in_flight += 1
+        metrics.set_gauge("scheduler_queue_depth", self._waiting)
+        metrics.set_gauge("scheduler_in_flight", self._in_flight)
+        try:
+            with metrics.timer(STAGE_TIMERS[stage]):
+                return await self._call(stage, task)
+        finally:
+            self._in_flight -= 1
+
+    async def _call_async(self, stage, task, semaphores):
+        provider_semaphore = semaphores.get(self.provider_of(task))
+        self._waiting += 1
+        metrics.set_gauge("scheduler_queue_depth", self._waiting)
+        async with semaphores[None]:
+            if provider_semaphore is None:
+                return await self._timed_call(stage, task)
+            async with provider_semaphore:
+                return await self._timed_call(stage, task)
+
+    async def _run_stage(self, stage, tasks, semaphores):
+        results = await asyncio.gather(*(self._call_async(stage, task, semaphores) for task in tasks))
+        self.calls_completed += len(tasks)
+        return list(results)
+
+    async def _process_question(self, question, answer_tasks_for, on_answers, on_comparisons, semaphores):
+        answer_tasks = list(answer_tasks_for(question))
+        answers = await self._run_stage(STAGE_ANSWERS, answer_tasks, semaphores)
+        comparison_tasks = list(on_answers(question, answer_tasks, answers) or [])
+        comparison_results = await self._run_stage(STAGE_COMPARISONS, comparison_tasks, semaphores)
+        on_comparisons(question, comparison_tasks, comparison_results)
+        self._question_done()
+
+    # Same contract as PipelineScheduler.run, to be awaited
+    async def run(self, questions, answer_tasks_for, on_answers, on_comparisons):
+        # Semaphores are created here so that they belong to the running event loop
+        semaphores = {None: asyncio.BoundedSemaphore(self.max_workers)}
+        for provider, limit in self.provider_limits.items():
+            semaphores[provider] = asyncio.BoundedSemaphore(limit)
+
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        pending = set()
+        for question in questions:
+            if len(pending) >= self.max_pending_questions:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    finished.result()
+            pending.add(asyncio.ensure_future(self._process_question(
+                question, answer_tasks_for, on_answers, on_comparisons, semaphores)))
+            metrics.set_gauge("scheduler_open_questions", len(pending))
+        await asyncio.gather(*pending)
+        self.finished_at = time.monotonic()
+        return self.questions_completed
@@ -0,0 +1,294 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server errors
+TRANSIENT_STATUS_CODES = {408, 409, 429}
+# SDK exceptions raised without a status code that are worth retrying
+TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+# Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens.
+# reserve() takes the tokens right away (the level may go negative) and returns how long the
+# caller has to wait before using them, so the same bucket works for threads and asyncio.
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount=1):
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    # Change the refill rate; when it is lowered, the tokens saved up are dropped so that the
+    # next calls are spaced at the new rate instead of bursting
+    def set_rate(self, rate_per_minute):
+        with self._lock:
+            self._refill()
+            if rate_per_minute < self.rate_per_second * 60:
+                self.tokens = min(self.tokens, 0)
+            self.rate_per_second = rate_per_minute / 60
+
+
+# Circuit breaker: after failure_threshold consecutive failures the provider is not called
+# for reset_timeout seconds, then a single trial call decides whether to close it again.
+# Calls made while it is open wait for the trial instead of failing.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    # Seconds to wait before calling the provider, 0 when the call can be made now
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._trial_in_progress:
+                # Wait for the outcome of the trial call
+                return min(1.0, self.reset_timeout) or 0.1
+            # Half-open: let one call through
+            self._trial_in_progress = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# Whether an API error is a rate limit: a 429, or any error telling how long to wait (Retry-After)
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429 or get_retry_after(error) is not None
+
+
+# Whether an API error is worth retrying (rate limit, timeout, connection or server error)
+def is_transient_error(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in TRANSIENT_STATUS_CODES or status_code >= 500
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+# Delay requested by the server in the Retry-After (or retry-after-ms) header, if any
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Rate limiting, retries and circuit breaking for one provider.
+# requests_per_minute / tokens_per_minute of None mean no limit.
+# Rate limit errors (429) adapt the request rate: each one halves it (starting from the observed
+# rate when no limit is set, never below min_requests_per_minute), and each success raises it
+# back by a twentieth of the original rate. Rate limits do not count toward the circuit breaker.
+class ProviderLimiter:
+    RATE_WINDOW_SECONDS = 60
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, max_retries=5,
+                 base_delay=1.0, max_delay=60.0, failure_threshold=5, reset_timeout=30.0, min_requests_per_minute=1.0):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_requests_per_minute = min_requests_per_minute
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retries = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self._call_times = deque()
+        self._rate_lock = threading.Lock()
+        self.set_limits(requests_per_minute, tokens_per_minute)
+
+    def set_limits(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute or None
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # Rate the adaptive request rate returns to (the limit, or the rate observed at the first 429)
+        self._target_rate = self.requests_per_minute
+
+    # Requests per minute made over the last RATE_WINDOW_SECONDS
+    def _observed_rate(self, now):
+        while self._call_times and now - self._call_times[0] > self.RATE_WINDOW_SECONDS:
+            self._call_times.popleft()
+        if not self._call_times:
+            return self.min_requests_per_minute
+        return len(self._call_times) * 60 / max(now - self._call_times[0], 1.0)
+
+    def _slow_down(self):
+        with self._rate_lock:
+            if self.request_bucket is None:
+                self._target_rate = self._observed_rate(time.monotonic())
+                rate = self._target_rate
+                self.request_bucket = TokenBucket(rate, capacity=1)
+            else:
+                rate = self.request_bucket.rate_per_second * 60
+            rate = max(self.min_requests_per_minute, rate / 2)
+            self.request_bucket.set_rate(rate)
+        print(f"{self.name}: rate limited, lowering the request rate to {rate:.1f}/min")
+
+    def _speed_up(self):
+        with self._rate_lock:
+            if self.request_bucket is None or self._target_rate is None:
+                return
+            rate = min(self._target_rate, self.request_bucket.rate_per_second * 60 + self._target_rate / 20)
+            if rate >= self._target_rate and self.requests_per_minute is None:
+                # Back to the rate of the first 429 without a configured limit: no limit again
+                self.request_bucket = None
+                self._target_rate = None
+            else:
+                self.request_bucket.set_rate(rate)
+
+    def _wait_time(self, estimated_tokens):
+        wait = 0.0
+        now = time.monotonic()
+        with self._rate_lock:
+            self._call_times.append(now)
+            self._observed_rate(now)
+        request_bucket = self.request_bucket
+        if request_bucket:
+            wait = max(wait, request_bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    # Full-jitter exponential backoff, or the server's Retry-After when it is given
+    def _retry_delay(self, error, attempt):
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    # Decide what to do after a failed call: returns the delay before the next attempt,
+    # or re-raises the error when it is not transient or the retries are exhausted.
+    # Only the errors of an unavailable provider (server errors, timeouts, connection errors)
+    # count toward the circuit breaker: a rejected request (bad request, authentication, unknown
+    # model) or a rate limit means the provider is up.
+    def _handle_failure(self, error, attempt):
+        if not is_transient_error(error):
+            self.breaker.record_success()
+            self.failures += 1
+            raise error
+        if is_rate_limit_error(error):
+            self.breaker.record_success()
+            self.rate_limited += 1
+            self._slow_down()
+        else:
+            self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            self.failures += 1
+            raise error
+        self.retries += 1
+        delay = self._retry_delay(error, attempt)
+        print(f"{self.name}: transient error ({error}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+
+    # Call fn() within the provider limits, retrying transient errors
+    def call(self, fn, estimated_tokens=1):
+        attempt = 0
+        while True:
+            open_for = self.breaker.before_call()
+            if open_for:
+                time.sleep(open_for)
+                continue
+            time.sleep(self._wait_time(estimated_tokens))
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._handle_failure(e, attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._speed_up()
+            return result
+
+    # Async version of call(): fn() returns an awaitable
+    async def call_async(self, fn, estimated_tokens=1):
+        attempt = 0
+        while True:
+            open_for = self.breaker.before_call()
+            if open_for:
+                await asyncio.sleep(open_for)
+                continue
+            await asyncio.sleep(self._wait_time(estimated_tokens))
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._handle_failure(e, attempt))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._speed_up()
+            return result
+
+
+def _get_number(name, default=None):
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        print(f"Invalid value for {name}. Using default value of {default}.")
+        return default
+
+
+# Build the limiter of a provider from the environment (.env file), e.g. for prefix OPENAI:
+# OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, and for every provider
+# API_MAX_RETRIES, CIRCUIT_BREAKER_THRESHOLD and CIRCUIT_BREAKER_RESET_SECONDS
+def create_provider_limiter(name, prefix):
+    return ProviderLimiter(
+        name,
+        requests_per_minute=_get_number(f"{prefix}_REQUESTS_PER_MINUTE"),
+        tokens_per_minute=_get_number(f"{prefix}_TOKENS_PER_MINUTE"),
+        max_retries=int(_get_number("API_MAX_RETRIES", 5)),
+        failure_threshold=int(_get_number("CIRCUIT_BREAKER_THRESHOLD", 5)),
+        reset_timeout=_get_number("CIRCUIT_BREAKER_RESET_SECONDS", 30.0),
+    )
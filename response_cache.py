@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_MODES = ('on', 'off', 'replay')
+
+
+# Raised in replay mode when a request has never been cached
+class CacheMissError(Exception):
+    pass
+
+
+# Content-addressed on-disk cache of raw API responses.
+# Entries are keyed on the hash of the full request (model, system prompt, prompt and
+# parameters) and stored as one JSON file each. When the cache grows above max_bytes the
+# least recently used entries are removed. In 'replay' mode the cache is read-only and a
+# miss raises CacheMissError instead of letting the API be called.
+class ResponseCache:
+    def __init__(self, cache_dir="response_cache", max_bytes=1024 * 1024 * 1024, mode='on'):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unsupported cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._lock = threading.Lock()
+        if mode != 'off':
+            self._load_index()
+
+    # Rebuild the LRU order from the files already on disk (oldest access first)
+    def _load_index(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                if file_name.endswith('.json'):
+                    stat = os.stat(os.path.join(root, file_name))
+                    found.append((stat.st_mtime, file_name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def make_key(request):
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    # Return the cached response for this request, or None on a miss
+    def get(self, request):
+        if self.mode == 'off':
+            return None
+        key = self.make_key(request)
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                response = json.load(cache_file)['response']
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            if self.mode == 'replay':
+                raise CacheMissError(f"No cached response for request {key} (replay mode)")
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        if self.mode == 'on':
+            # Refresh the access time used for the LRU order across runs
+            os.utime(path)
+        return response
+
+    # Store the response of a request (ignored in replay and off modes)
+    def put(self, request, response):
+        if self.mode != 'on' or response is None:
+            return
+        key = self.make_key(request)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"request": request, "response": response}, ensure_ascii=False)
+        # Write to a temporary file first so that a crash never leaves a truncated entry (the name
+        # is unique per process and thread, sharded runs share the cache directory)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+            cache_file.write(data)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    # Remove the cached response of a request, e.g. one that turned out to be unusable (only in
+    # 'on' mode, replay never changes the cache)
+    def discard(self, request):
+        if self.mode != 'on':
+            return
+        key = self.make_key(request)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        with self._lock:
+            self.total_bytes -= self._entries.pop(key, 0)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+            }
+
+
+# Build the cache from the environment (.env file):
+# RESPONSE_CACHE_MODE (on, off or replay), RESPONSE_CACHE_DIR and RESPONSE_CACHE_MAX_MB
+def create_response_cache():
+    mode = os.getenv('RESPONSE_CACHE_MODE', 'on').strip().lower()
+    cache_dir = os.getenv('RESPONSE_CACHE_DIR', 'response_cache')
+    try:
+        max_mb = float(os.getenv('RESPONSE_CACHE_MAX_MB', '1024'))
+    except ValueError:
+        print("Invalid value for RESPONSE_CACHE_MAX_MB. Using default value of 1024.")
+        max_mb = 1024
+    return ResponseCache(cache_dir, max_bytes=int(max_mb * 1024 * 1024), mode=mode)
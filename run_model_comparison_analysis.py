@@ -1,12 +1,29 @@
 import os
-import sqlite3
 import json 
-import re
-from concurrent.futures import ThreadPoolExecutor
-from openai import OpenAI
-from anthropic import Anthropic
+import time
+import sqlite3
+import asyncio
+import argparse
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic, AsyncAnthropic
 from dotenv import load_dotenv
-from datasets import load_dataset
+from dataset_loader import dataset_exists, iter_dataset_questions, iter_dataset_examples
+from pipeline_scheduler import PipelineScheduler, AsyncPipelineScheduler
+from response_cache import create_response_cache
+from db_writer import DatabaseWriter
+from rate_limiter import create_provider_limiter
+from aggregates import initialize_summary_tables
+from migrations import SCHEMA_VERSION, apply_migrations, question_hash, schema_version
+from accuracy import compute_accuracy, print_accuracy
+from token_accounting import (create_token_budget, get_tokenizer, request_input_tokens, record_usage, load_usage_history, RunEstimate,
+                              DEFAULT_ANSWER_TOKENS, DEFAULT_JUDGMENT_TOKENS, DEFAULT_SECONDS_PER_CALL, DEFAULT_OUTPUT_TOKENS_PER_SECOND)
+from run_tracking import initialize_run_tables, start_run, load_run_progress, record_run_question, record_stage, copy_stages, answer_stage, judge_stage
+from active_sampling import ActiveJudgeSampler
+from batch_mode import BatchRunner, OpenAIBatchProvider, AnthropicBatchProvider
+from instrumentation import metrics
+from judgment_dedup import IDENTICAL_ANSWERS_EXPLANATION, JudgmentIndex, judgment_key, is_failed_answer, answers_identical
+from judgment_parser import JUDGMENT_SCHEMA, JUDGMENT_TOOL_NAME, JudgmentParseError, parse_judgment, anthropic_content_text
+from model_registry import MODEL_REGISTRY, DEFAULT_MODELS, load_models_file, get_models, parse_model_names, tournament_pairings
 
 
 # Initialize environment variables
@@ -20,9 +37,42 @@ if not openai_api_key or not anthropic_api_key:
     raise ValueError("API keys for OpenAI and Anthropic are not set. Please provide them in the .env file.")
 
 
-# Initialize API clients
-clientOpenAI = OpenAI(api_key=openai_api_key)
-clientAnthropic = Anthropic(api_key=anthropic_api_key)
+# SQLite database of the results. Sharded runs give each worker its own file (see sharded_run.py).
+db_name = os.getenv('COMPARE_MODELS_DB', 'db_compare_models.db')
+
+# Optional base URLs, e.g. to point the clients at a local fake server
+openai_base_url = os.getenv('OPENAI_BASE_URL')
+anthropic_base_url = os.getenv('ANTHROPIC_BASE_URL')
+
+# Initialize API clients (retries are handled by the rate limiters below)
+clientOpenAI = OpenAI(api_key=openai_api_key, base_url=openai_base_url, max_retries=0)
+clientAnthropic = Anthropic(api_key=anthropic_api_key, base_url=anthropic_base_url, max_retries=0)
+# Async clients used by the asyncio engine
+clientOpenAIAsync = AsyncOpenAI(api_key=openai_api_key, base_url=openai_base_url, max_retries=0)
+clientAnthropicAsync = AsyncAnthropic(api_key=anthropic_api_key, base_url=anthropic_base_url, max_retries=0)
+
+# Per-provider rate limits (requests and tokens per minute), retries with backoff and circuit breakers
+rate_limiters = {
+    "openai": create_provider_limiter("OpenAI", "OPENAI"),
+    "anthropic": create_provider_limiter("Anthropic", "ANTHROPIC"),
+}
+
+# Ask the judges for structured output (OpenAI JSON mode, Anthropic tool call) instead of
+# JSON in free text. Set STRUCTURED_JUDGMENTS=0 for models that do not support it.
+structured_judgments = os.getenv('STRUCTURED_JUDGMENTS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+# Input and output token budgets of the calls (MAX_INPUT_TOKENS, MAX_ANSWER_TOKENS,
+# MAX_JUDGMENT_TOKENS and TRUNCATION_POLICY, see token_accounting.py)
+token_budget = create_token_budget()
+
+# On-disk cache of raw API responses, shared by the sync and async engines
+response_cache = create_response_cache()
+
+# Provider batch APIs, used with --batch-mode
+batch_runner = BatchRunner({
+    "openai": OpenAIBatchProvider(clientOpenAI),
+    "anthropic": AnthropicBatchProvider(clientAnthropic),
+})
 
 system_message_comparison = """
 Please respond exclusively in JSON format, adhering to the following structure:
@@ -38,287 +88,938 @@ All the fields are mandatory!
 """
 
 def is_dataset_name(input_text):
-    # Attempt to load the dataset with the provided name
-    try:
-        load_dataset(input_text, split='train[1:1]')
-        return True
-    except:
-        return False
-
-def get_questions(dataset_name="microsoft/orca-math-word-problems-200k", question_field="question", n=20):
-    # Load the dataset
-    dataset = load_dataset(dataset_name)
-    # Access the training split
-    train_data = dataset["train"]
-    # Yield the first n questions from the specified field
-    for i in range(n):
-        yield train_data[i][question_field]
+    # Check that a dataset with the provided name exists (metadata only, cached)
+    return dataset_exists(input_text)
+
+def get_questions(dataset_name="microsoft/orca-math-word-problems-200k", question_field="question", n=20, **options):
+    # Yield the first n questions from the specified field, streaming the rows instead of
+    # loading the whole training split (see dataset_loader.iter_dataset_rows for the options)
+    for _, question in metrics.timed_iter("dataset_fetch", iter_dataset_questions(dataset_name, question_field, limit=n, **options)):
+        yield question
 
 # Database initialization
 def initialize_db(db_name="db_compare_models.db"):
-    conn = sqlite3.connect(db_name)
+    conn = DatabaseWriter.connect(db_name)
+    create_tables(conn)
+    conn.close()
+
+# Tables of the original schema, then the migrations
+def create_tables(conn):
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS questions (id INTEGER PRIMARY KEY, question TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, question_id INTEGER, model TEXT, answer TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
     c.execute('''CREATE TABLE IF NOT EXISTS comparisons (id INTEGER PRIMARY KEY, question_id INTEGER, model_evaluating TEXT, preferred_answer TEXT, model_bot_a TEXT, model_bot_b TEXT, score_a INTEGER, score_b INTEGER, explanation TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS comparison_gpt4_claude3 (id INTEGER PRIMARY KEY, question_id INTEGER, model_evaluating TEXT, preferred_answer TEXT, model_bot_a TEXT, model_bot_b TEXT, score_GPT4 INTEGER, score_Claude3 INTEGER, explanation TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY, provider TEXT, model_id TEXT, params TEXT)''')
+    initialize_run_tables(c)
+    initialize_summary_tables(c)
     conn.commit()
-    conn.close()
+    # Indexes, the comparison_gpt4_claude3 view and the question content hashes (see migrations.py)
+    apply_migrations(conn)
+
+# Ids of the questions stored or found by this process, by content hash
+question_ids = {}
+
+# Id of the question with this content hash, stored by this process or found in the database
+def find_question(content_hash):
+    question_id = question_ids.get(content_hash)
+    if question_id is None:
+        row = question_lookup.execute("SELECT id FROM questions WHERE content_hash = ?", (content_hash,)).fetchone()
+        question_id = row[0] if row else None
+    return question_id
+
+# Insert a question (and the dataset's reference answer, if any) into database and return its id.
+# A question already stored (same content hash) is not inserted again, its id is returned.
+def insert_question(question, reference_answer=None):
+    content_hash = question_hash(question)
+    question_id = find_question(content_hash)
+    if question_id is None:
+        # The question is written right away: its id is used by the rows written in the background
+        try:
+            question_id = db_writer.insert("INSERT INTO questions (question, content_hash, reference_answer) VALUES (?, ?, ?)", (question, content_hash, reference_answer))
+        except sqlite3.IntegrityError:
+            # Stored in the meantime by another process writing to the same database
+            row = question_lookup.execute("SELECT id FROM questions WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row is None:
+                raise
+            question_id = row[0]
+    elif reference_answer is not None:
+        # Question stored without its reference answer (asked directly or by an older version)
+        db_writer.write("UPDATE questions SET reference_answer = ? WHERE id = ? AND reference_answer IS NULL", (reference_answer, question_id))
+    question_ids[content_hash] = question_id
+    return question_id
+
+# Insert the answer of one model into database, replacing a failed answer from a previous run
+def insert_answer(question_id, model, answer):
+    db_writer.write("DELETE FROM answers WHERE question_id = ? AND model = ?", (question_id, model))
+    db_writer.write("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", (question_id, model, json.dumps(answer)))
 
 # Insert question and answers into database
 def insert_question_and_answers(question, answer_gpt4, answer_claude3):
-    conn = sqlite3.connect("db_compare_models.db")
-    c = conn.cursor()
-    # Insert question
-    c.execute("INSERT INTO questions (question) VALUES (?)", (question,))
-    question_id = c.lastrowid
-    # Insert answers
-    c.execute("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", (question_id, "GPT-4", json.dumps(answer_gpt4)))
-    c.execute("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", (question_id, "Claude3", json.dumps(answer_claude3)))
-    conn.commit()
-    conn.close()
+    question_id = insert_question(question)
+    insert_answer(question_id, "GPT-4", answer_gpt4)
+    insert_answer(question_id, "Claude3", answer_claude3)
     return question_id
 
-# Insert comparison results into database
-def insert_comparisons(question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation):
-    # Determine scores for GPT-4 and Claude3
-    if model_bot_a == "GPT-4" and model_bot_b == "Claude3":
-        score_GPT4 = score_a
-        score_Claude3 = score_b
-    elif model_bot_a == "Claude3" and model_bot_b == "GPT-4":
-        score_GPT4 = score_b
-        score_Claude3 = score_a
-    else:
-        # This case should not occur, but it's handled for completeness
-        print("Error: Model names do not match expected 'GPT-4' or 'Claude3'.")
-        return
-    
-    conn = sqlite3.connect("db_compare_models.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation))
-    c.execute("INSERT INTO comparison_gpt4_claude3 (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_GPT4, score_Claude3, explanation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_GPT4, score_Claude3, explanation))
-    conn.commit()
-    conn.close()
+# Store the registered models used by a run
+def insert_models(models):
+    for spec in models:
+        db_writer.write("INSERT OR REPLACE INTO models (name, provider, model_id, params) VALUES (?, ?, ?, ?)", (spec.name, spec.provider, spec.model_id, json.dumps(spec.params)))
 
-# Function to get answer from GPT-4-turbo-preview with explanation and scores
-def get_gpt4_answer(prompt, system_prompt=None, reply_with_JSON=False):
+# Insert comparison results into database.
+# The GPT-4 vs Claude3 judgments are also visible in the comparison_gpt4_claude3 view.
+def insert_comparisons(question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key=None):
+    db_writer.write("INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key))
+
+# Build the request parameters for an OpenAI chat model
+def build_openai_request(spec, prompt, system_prompt=None, reply_with_JSON=False):
+    messages = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    request = {
+        "model": spec.model_id, 
+        **spec.params,
+        "messages": messages
+    }
+    if reply_with_JSON and structured_judgments:
+        # JSON mode: the reply is a single JSON object
+        request.setdefault("response_format", {"type": "json_object"})
+    max_output_tokens = token_budget.output_tokens(reply_with_JSON)
+    if max_output_tokens:
+        request["max_tokens"] = max_output_tokens
+    return request
+
+# Parse a judge response into a validated Judgment, or None when it cannot be used
+def parse_judge_response(response, parser_name):
     try:
-        messages = [{"role": "user", "content": prompt}]
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        ## CALL API
-        completion = clientOpenAI.chat.completions.create(
-            model="gpt-4-turbo-preview", 
-            messages=messages
-        )
-        response = completion.choices[0].message.content.strip()
-        
-        # Attempt to decode JSON
-        if reply_with_JSON:
-            # Find the first { and the last } in the response using regex
-            matches = re.search(r'{.*}', response, re.DOTALL)
-            if matches:
-                json_str = matches.group(0)  # Extract the matched JSON string
-                # Remove newline and carriage return characters
-                json_str = json_str.replace('\n', '').replace('\r', '')
-                # Escape backslashes before decoding
-                json_str = json_str.replace('\\', '\\\\')
-                try:
-                    response_json = json.loads(json_str)
-                    return response_json
-                except json.JSONDecodeError as e:
-                    print("Failed to decode JSON response in get_gpt4_answer.")
-                    print(e)
-                    print(f"get_gpt4_answer {repr(response)}")
-                    return None
-            else:
-                print("No JSON found in the response.")
-                return None
-        else:
-            return response
+        return parse_judgment(response)
+    except JudgmentParseError as e:
+        print(f"Failed to parse the judgment in {parser_name}: {e}")
+        print(f"{parser_name} {repr(response)}")
+        return None
+
+# Extract the answer (or the judgment) from an OpenAI response
+def parse_openai_response(response, reply_with_JSON=False):
+    if reply_with_JSON:
+        return parse_judge_response(response, "parse_openai_response")
+    return response
+
+def call_openai(request):
+    completion = clientOpenAI.chat.completions.create(**request)
+    return completion.choices[0].message.content.strip()
+
+async def call_openai_async(request):
+    completion = await clientOpenAIAsync.chat.completions.create(**request)
+    return completion.choices[0].message.content.strip()
+
+# Build the request parameters for an Anthropic model
+def build_anthropic_request(spec, prompt, system_prompt=None, reply_with_JSON=False):
+    message_data = {
+        "model": spec.model_id,
+        "max_tokens": 1000,
+        **spec.params,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    if system_prompt is not None:
+        message_data["system"] = system_prompt
+    if reply_with_JSON and structured_judgments:
+        # The judgment is returned as the input of a forced tool call, validated against its schema
+        message_data["tools"] = [{"name": JUDGMENT_TOOL_NAME, "description": "Record the comparison of answer A and answer B.", "input_schema": JUDGMENT_SCHEMA}]
+        message_data["tool_choice"] = {"type": "tool", "name": JUDGMENT_TOOL_NAME}
+    max_output_tokens = token_budget.output_tokens(reply_with_JSON)
+    if max_output_tokens:
+        message_data["max_tokens"] = max_output_tokens
+    return message_data
+
+# Extract the answer (or the judgment) from an Anthropic response
+def parse_anthropic_response(response, reply_with_JSON=False):
+    if reply_with_JSON:
+        return parse_judge_response(response, "parse_anthropic_response")
+    return response
+
+def call_anthropic(request):
+    completion = clientAnthropic.messages.create(**request)
+    return anthropic_content_text(completion.content)
+
+async def call_anthropic_async(request):
+    completion = await clientAnthropicAsync.messages.create(**request)
+    return anthropic_content_text(completion.content)
+
+# How to build, send and parse the requests of each provider
+PROVIDERS = {
+    "openai": {"build_request": build_openai_request, "parse_response": parse_openai_response, "call": call_openai, "call_async": call_openai_async},
+    "anthropic": {"build_request": build_anthropic_request, "parse_response": parse_anthropic_response, "call": call_anthropic, "call_async": call_anthropic_async},
+}
+
+# Provider of a task ({"type": model name, ...}), used for the per-provider concurrency limits
+def provider_of_task(task):
+    return MODEL_REGISTRY[task['type']].provider
+
+# Parse a response with the provider's parser, timing the JSON extraction of the judgments
+def parse_model_response(provider, response, reply_with_JSON=False):
+    if not reply_with_JSON:
+        return provider["parse_response"](response, reply_with_JSON)
+    with metrics.timer("json_extraction"):
+        result = provider["parse_response"](response, reply_with_JSON)
+    if result is None:
+        metrics.increment("json_extraction_failures")
+    return result
+
+# Cache the response of a call once it parsed. A response that does not parse (e.g. a truncated
+# judgment) is not cached, and is removed from the cache when it came from there, so that the
+# call is made again by the next run (--resume)
+def cache_parsed_response(request, response, result, cached):
+    if result is None:
+        if cached:
+            response_cache.discard(request)
+    elif not cached:
+        response_cache.put(request, response)
+
+# Fill the usage of a call (tokens measured locally, duration, cache hit)
+def measure_usage(usage, tokenizer, input_tokens, response, seconds=None, cached=False):
+    if usage is not None:
+        usage.update(input_tokens=input_tokens, output_tokens=tokenizer.count(response if isinstance(response, str) else json.dumps(response)),
+                     seconds=seconds, cached=cached)
+
+# Mark a failed call in its usage, so that it is recorded in token_usage with its error
+def record_call_error(usage, error):
+    if usage is not None:
+        usage["error"] = str(error) or type(error).__name__
+
+# Function to get the answer of any registered model, optionally as a JSON judgment.
+# The tokens of the call are measured into usage (a dict) when it is given.
+def get_model_answer(model_name, prompt, system_prompt=None, reply_with_JSON=False, usage=None):
+    try:
+        spec = MODEL_REGISTRY[model_name]
+        provider = PROVIDERS[spec.provider]
+        request = provider["build_request"](spec, prompt, system_prompt, reply_with_JSON)
+        tokenizer = get_tokenizer(spec.model_id)
+        input_tokens = request_input_tokens(request, tokenizer)
+        response = response_cache.get(request)
+        seconds = None
+        if response is None:
+            ## CALL API
+            started_at = time.monotonic()
+            with metrics.timer("api_request"):
+                response = rate_limiters[spec.provider].call(lambda: provider["call"](request), input_tokens + request.get("max_tokens", 1000))
+            seconds = time.monotonic() - started_at
+        measure_usage(usage, tokenizer, input_tokens, response, seconds, cached=seconds is None)
+        result = parse_model_response(provider, response, reply_with_JSON)
+        cache_parsed_response(request, response, result, cached=seconds is None)
+        return result
     except Exception as e:
+        metrics.increment("call_errors")
         print("Error:", e)
+        record_call_error(usage, e)
         return None
 
-
-# Function to get answer from Claude3 Opus with explanation and scores
-def get_claude3_answer(prompt, system_prompt=None, reply_with_JSON=False):
+# Async version of get_model_answer, using the async clients
+async def get_model_answer_async(model_name, prompt, system_prompt=None, reply_with_JSON=False, usage=None):
     try:
-        message_data = {
-            "model": "claude-3-opus-20240229",
-            "max_tokens": 1000,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        if system_prompt is not None:
-            message_data["system"] = system_prompt
-        ## CALL API
-        completion = clientAnthropic.messages.create(**message_data)
-        response = completion.content[0].text
-        if reply_with_JSON:
-            try:
-                # Remove newline and carriage return characters
-                response = response.replace('\n', '').replace('\r', '')
-                # Escape backslashes before decoding
-                response = response.replace('\\', '\\\\')
-                response_json = json.loads(response)
-                return response_json
-            except json.JSONDecodeError as e:
-                print("Failed to decode JSON response in get_claude3_answer.")
-                print(e) 
-                print(f"get_claude3_answer {repr(response)}")
-                return None
-        else:
-            return response
+        spec = MODEL_REGISTRY[model_name]
+        provider = PROVIDERS[spec.provider]
+        request = provider["build_request"](spec, prompt, system_prompt, reply_with_JSON)
+        tokenizer = get_tokenizer(spec.model_id)
+        input_tokens = request_input_tokens(request, tokenizer)
+        response = response_cache.get(request)
+        seconds = None
+        if response is None:
+            ## CALL API
+            started_at = time.monotonic()
+            with metrics.timer("api_request"):
+                response = await rate_limiters[spec.provider].call_async(lambda: provider["call_async"](request), input_tokens + request.get("max_tokens", 1000))
+            seconds = time.monotonic() - started_at
+        measure_usage(usage, tokenizer, input_tokens, response, seconds, cached=seconds is None)
+        result = parse_model_response(provider, response, reply_with_JSON)
+        cache_parsed_response(request, response, result, cached=seconds is None)
+        return result
     except Exception as e:
+        metrics.increment("call_errors")
         print("Error:", e)
+        record_call_error(usage, e)
         return None
 
+# Function to get answer from GPT-4-turbo-preview with explanation and scores
+def get_gpt4_answer(prompt, system_prompt=None, reply_with_JSON=False):
+    return get_model_answer("GPT-4", prompt, system_prompt, reply_with_JSON)
+
+# Function to get answer from Claude3 Opus with explanation and scores
+def get_claude3_answer(prompt, system_prompt=None, reply_with_JSON=False):
+    return get_model_answer("Claude3", prompt, system_prompt, reply_with_JSON)
+
+# Tasks above the input budget with TRUNCATION_POLICY=skip are not sent (their result is None)
+def over_budget(task):
+    if task.get("over_budget"):
+        print(f"Prompt for {task['type']} is above MAX_INPUT_TOKENS, skipping it.")
+        metrics.increment("budget_skips")
+        return True
+    return False
+
 def fetch_answers(question):
     # This function will be executed in a parallel manner for fetching answers
-    if question['type'] == 'GPT-4':
-        return get_gpt4_answer(question['prompt'])
-    elif question['type'] == 'Claude3':
-        return get_claude3_answer(question['prompt'])
-    else:
+    if question['type'] not in MODEL_REGISTRY:
         raise ValueError("Unsupported model type")
+    if over_budget(question):
+        return None
+    return get_model_answer(question['type'], question['prompt'], usage=question.setdefault('usage', {}))
     
 def fetch_comparisons(data):
     # This function will be executed in a parallel manner for fetching comparisons
-    if data['type'] == 'GPT-4':
-        return get_gpt4_answer(data['prompt'], system_prompt=system_message_comparison, reply_with_JSON=True)
-    elif data['type'] == 'Claude3':
-        return get_claude3_answer(data['prompt'], system_prompt=system_message_comparison, reply_with_JSON=True)
+    if data['type'] not in MODEL_REGISTRY:
+        raise ValueError("Unsupported model type")
+    if over_budget(data):
+        return None
+    return get_model_answer(data['type'], data['prompt'], system_prompt=system_message_comparison, reply_with_JSON=True, usage=data.setdefault('usage', {}))
+
+async def fetch_answers_async(question):
+    # Async version of fetch_answers, used by the asyncio engine
+    if question['type'] not in MODEL_REGISTRY:
+        raise ValueError("Unsupported model type")
+    if over_budget(question):
+        return None
+    return await get_model_answer_async(question['type'], question['prompt'], usage=question.setdefault('usage', {}))
+
+async def fetch_comparisons_async(data):
+    # Async version of fetch_comparisons, used by the asyncio engine
+    if data['type'] not in MODEL_REGISTRY:
+        raise ValueError("Unsupported model type")
+    if over_budget(data):
+        return None
+    return await get_model_answer_async(data['type'], data['prompt'], system_prompt=system_message_comparison, reply_with_JSON=True, usage=data.setdefault('usage', {}))
+
+# Answer tasks for one question (one per model not answered yet).
+# A question is a dict with "question", the "models" to compare and their "judges"; dataset runs
+# also carry "run_id", "row_index", and, when resuming, the "question_id", completed "stages"
+# and stored "answers" (by model).
+def build_answer_prompts(item):
+    if item.get("question_id") is None:
+        reuse_stored_answers(item)
+    answers = item.get("answers") or {}
+    return [build_answer_task(item["question"], model) for model in item["models"] if model not in answers]
+
+# A question already stored (asked by an earlier run) keeps its answers: only the models without
+# a stored answer are asked, so that the judgments of the stored answers stay valid and are
+# reused (see dedupe_judgments). The reused answers are recorded in the progress of the run.
+def reuse_stored_answers(item):
+    question_id = find_question(question_hash(item["question"]))
+    if question_id is None:
+        return
+    stored = {}
+    for model, answer in question_lookup.execute("SELECT model, answer FROM answers WHERE question_id = ?", (question_id,)).fetchall():
+        answer = json.loads(answer)
+        if model in item["models"] and not is_failed_answer(answer):
+            stored[model] = answer
+    item["question_id"] = question_id
+    item["answers"] = {**stored, **(item.get("answers") or {})}
+    if db_writer is None:
+        # Dry run: nothing is recorded
+        return
+    if item.get("reference_answer") is not None:
+        insert_question(item["question"], item["reference_answer"])
+    if item.get("run_id") is not None:
+        record_run_question(db_writer, item["run_id"], item["row_index"], question_id)
+        for model in stored:
+            record_stage(db_writer, item["run_id"], item["row_index"], answer_stage(model))
+
+# Answer task of one model, the question being truncated to the input budget if needed
+def build_answer_task(user_question, model):
+    prompt, truncated_tokens, skipped = token_budget.fit_prompt(user_question, get_tokenizer(MODEL_REGISTRY[model].model_id))
+    return {"type": model, "prompt": prompt, "usage": {"truncated_tokens": truncated_tokens}, "over_budget": skipped}
+
+# Prompt asking a judge to compare answer A and answer B
+def build_comparison_prompt(user_question, answer_a, answer_b):
+    return f"Question: {user_question}\n\nAnswer A: {answer_a}\n\nAnswer B: {answer_b}\n\nProvide a detailed comparison including an explanation, scores for each answer, and select the better answer."
+
+# Comparison tasks for one question: every judge compares every ordered pair of answers,
+# so each answer generated once is reused across all the pairings. Pairs with a failed answer
+# are not judged.
+def build_comparison_prompts(user_question, question_id, answers, models, judges):
+    return [
+        build_comparison_task(user_question, question_id, answers, judge, model_bot_a, model_bot_b)
+        for judge, model_bot_a, model_bot_b in tournament_pairings(models, judges)
+        if not is_failed_answer(answers.get(model_bot_a)) and not is_failed_answer(answers.get(model_bot_b))
+    ]
+
+# Comparison task of one judge for one ordered pair of answers
+# Above the input budget, the two answers are truncated (the question and instructions are kept).
+def build_comparison_task(user_question, question_id, answers, judge, model_bot_a, model_bot_b):
+    answer_a, answer_b, truncated_tokens, skipped = answers[model_bot_a], answers[model_bot_b], 0, False
+    if token_budget.max_input_tokens:
+        spec = MODEL_REGISTRY[judge]
+        tokenizer = get_tokenizer(spec.model_id)
+        # Everything but the answers: system prompt, question, instructions and tool definitions
+        fixed_tokens = request_input_tokens(PROVIDERS[spec.provider]["build_request"](spec, build_comparison_prompt(user_question, "", ""), system_message_comparison, True), tokenizer)
+        answer_a, answer_b, truncated_tokens, skipped = token_budget.fit_answers(answer_a, answer_b, tokenizer, fixed_tokens)
+    return {"type": judge, "prompt": build_comparison_prompt(user_question, answer_a, answer_b), "question_id": question_id, "model_bot_a": model_bot_a, "model_bot_b": model_bot_b,
+            "usage": {"truncated_tokens": truncated_tokens}, "over_budget": skipped,
+            "judgment_key": judgment_key(user_question, answers[model_bot_a], answers[model_bot_b], judge),
+            "identical": answers_identical(answers[model_bot_a], answers[model_bot_b])}
+
+# Settle the comparison tasks that need no judge call (see judgment_dedup.py): identical answers
+# are recorded as ties and judgments already made on the same question and answers are reused.
+# Returns the tasks still to be sent and the recorded judgments (see record_comparisons).
+def dedupe_judgments(item, tasks):
+    pending, settled, results = [], [], []
+    for task in tasks:
+        if task["identical"]:
+            judgment_index.ties += 1
+            task["stored"] = judgment_index.has_tie(task["judgment_key"], task["question_id"])
+            settled.append(task)
+            results.append(None)
+            continue
+        known = judgment_index.find(task["judgment_key"])
+        if known is None:
+            pending.append(task)
+            continue
+        judgment_index.reused += 1
+        question_id, judgment = known
+        # The judgment is already stored for this question, only the run progress is recorded
+        task["stored"] = question_id == task["question_id"]
+        settled.append(task)
+        results.append(judgment)
+    recorded = record_comparisons(item, settled, results) if settled else []
+    return pending, recorded
+
+# Comparison tasks of a question that were not completed in a previous run
+def pending_comparison_prompts(item, answers):
+    comparison_prompts = build_comparison_prompts(item["question"], item["question_id"], answers, item["models"], item["judges"])
+    completed_stages = item.get("stages", set())
+    return [prompt for prompt in comparison_prompts
+            if judge_stage(prompt['type'], prompt['model_bot_a'], prompt['model_bot_b']) not in completed_stages]
+
+# Store the answers of one question and return its comparison tasks
+def record_answers(item, answer_prompts, answers):
+    run_id = item.get("run_id")
+    if item.get("question_id") is None:
+        # Insert question into database
+        item["question_id"] = insert_question(item["question"], item.get("reference_answer"))
+        if run_id is not None:
+            record_run_question(db_writer, run_id, item["row_index"], item["question_id"])
+
+    all_answers = dict(item.get("answers") or {})
+    for answer_prompt, answer in zip(answer_prompts, answers):
+        model = answer_prompt["type"]
+        print(f"#####")
+        print(f"""Answer by {model}: 
+                {answer}""")
+        # Insert answer into database
+        insert_answer(item["question_id"], model, answer)
+        record_task_usage(item["question_id"], answer_prompt, "answer")
+        all_answers[model] = answer
+        # Failed answers are fetched again when the run is resumed
+        if run_id is not None and answer is not None:
+            record_stage(db_writer, run_id, item["row_index"], answer_stage(model))
+
+    if item.get("defer_judging"):
+        # Judgments are picked later by the active sampler
+        item["answers"] = all_answers
+        answered_items.append(item)
+        return []
+
+    # Prepare comparison prompts, skipping the judgments already done in a previous run
+    pending, _ = dedupe_judgments(item, pending_comparison_prompts(item, all_answers))
+    return pending
+
+# Rows of the run repeating the question of an earlier row: (row index, row index of the first
+# row, content hash). They are not answered or judged again, see record_repeated_rows.
+repeated_rows = []
+
+# Work items of a dataset run from (row_index, question, reference answer) triples. In a resumed
+# run, rows whose answers and judgments are all stored are skipped, and so are the rows
+# repeating the question of an earlier row.
+def build_run_items(questions, run_id, progress, models, judges, defer_judging=False):
+    first_rows = {}
+    for row_index, user_question, reference_answer in questions:
+        entry = progress.get(row_index, {})
+        content_hash = question_hash(user_question)
+        if content_hash in first_rows and not entry:
+            repeated_rows.append((row_index, first_rows[content_hash], content_hash))
+            continue
+        first_rows.setdefault(content_hash, row_index)
+        item = {
+            "question": user_question,
+            "reference_answer": reference_answer,
+            "models": models,
+            "judges": judges,
+            "run_id": run_id,
+            "row_index": row_index,
+            "question_id": entry.get("question_id"),
+            "stages": entry.get("stages", set()),
+            "answers": entry.get("answers"),
+            "defer_judging": defer_judging,
+        }
+        answers = item["answers"] or {}
+        if all(model in answers for model in models) and not pending_comparison_prompts(item, answers):
+            continue
+        yield item
+
+# Record the repeated rows of a run as done like their first row: same question, and a copy of
+# its stages (queued after them, so written once they are)
+def record_repeated_rows(run_id):
+    for row_index, first_row_index, content_hash in repeated_rows:
+        question_id = find_question(content_hash)
+        if question_id is not None:
+            record_run_question(db_writer, run_id, row_index, question_id)
+            copy_stages(db_writer, run_id, first_row_index, row_index)
+    if repeated_rows:
+        print(f"{len(repeated_rows)} repeated questions were not answered again.")
+
+# Store the tokens of the call made for a task, or its error (not for the tasks that were not sent)
+def record_task_usage(question_id, task, stage):
+    usage = task.get("usage") or {}
+    if "input_tokens" in usage or "error" in usage:
+        record_usage(db_writer, question_id, task["type"], stage, usage)
+
+# Questions answered with deferred judging (active sampling)
+answered_items = []
+
+# Score accumulators used for the averages displayed at the end of the run
+score_totals = {}
+score_counts = {}
+
+# Store and display the comparison results of one question.
+# Returns the recorded judgments as (model_evaluating, model_bot_a, model_bot_b, preferred_answer).
+def record_comparisons(item, comparison_prompts, comparison_results):
+    recorded = []
+    print("###")
+    print(f"comparison_result={comparison_results}")
+    print(" ")
+    for i, comparison_result in enumerate(comparison_results):
+        question_id = comparison_prompts[i]['question_id']
+        model_evaluating = comparison_prompts[i]['type']
+        model_bot_a = comparison_prompts[i]['model_bot_a']
+        model_bot_b = comparison_prompts[i]['model_bot_b']
+        usage = comparison_prompts[i].get('usage') or {}
+        if comparison_result is None and "input_tokens" in usage:
+            # The judge replied, but its judgment could not be used
+            usage.setdefault("error", "unparsable judgment")
+        record_task_usage(question_id, comparison_prompts[i], "judge")
+        key = comparison_prompts[i].get('judgment_key')
+        if comparison_prompts[i].get('identical'):
+            # Identical answers: a tie, without scores
+            preferred_answer, score_a, score_b, explanation = "Tie", None, None, IDENTICAL_ANSWERS_EXPLANATION
+            judgment_index.add_tie(key, question_id)
+        elif comparison_result is None:
+            # Skip failed judgments instead of crashing; they are requested again with --resume
+            print("####")
+            print("Comparison result is None, skipping this judgment.")
+            print(f"comparison_prompts[i]={comparison_prompts[i]}")
+            print(" ")
+            continue
+        else:
+            # Determine the preferred answer based on the comparison result (validated by the parser)
+            preferred_answer = model_bot_a if comparison_result.better_answer == 'A' else model_bot_b
+            explanation = comparison_result.explanation
+            score_a = comparison_result.score_a
+            score_b = comparison_result.score_b
+            judgment_index.add(key, question_id, comparison_result)
+
+        # Insert comparison results into the database
+        if not comparison_prompts[i].get('stored'):
+            insert_comparisons(question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, key)
+        if item.get("run_id") is not None:
+            record_stage(db_writer, item["run_id"], item["row_index"], judge_stage(model_evaluating, model_bot_a, model_bot_b))
+
+        # Print comparison results with explanations and scores
+        print(f"#####")
+        print(f"""Comparison result by {model_evaluating}: 
+Bot A {model_bot_a} (score {score_a}) vs Bot B {model_bot_b} (score {score_b})
+Preferred answer: {preferred_answer} with explanation: 
+        {explanation}""")
+        # Update score totals and counts based on the model being evaluated
+        for model, score in ((model_bot_a, score_a), (model_bot_b, score_b)):
+            if score is not None:
+                score_totals[model] = score_totals.get(model, 0) + score
+                score_counts[model] = score_counts.get(model, 0) + 1
+        recorded.append((model_evaluating, model_bot_a, model_bot_b, preferred_answer))
+    return recorded
+
+# Send a list of tasks through the provider batch APIs and parse the responses like the
+# synchronous path. Responses already in the response cache are not submitted again.
+def fetch_batch(stage, tasks, system_prompt=None, reply_with_JSON=False):
+    responses = [None] * len(tasks)
+    task_requests = [None] * len(tasks)
+    requests = []
+    submitted = []
+    for index, task in enumerate(tasks):
+        if over_budget(task):
+            continue
+        spec = MODEL_REGISTRY[task['type']]
+        request = PROVIDERS[spec.provider]["build_request"](spec, task['prompt'], system_prompt, reply_with_JSON)
+        task_requests[index] = request
+        response = response_cache.get(request)
+        if response is None:
+            requests.append((spec.provider, request))
+            submitted.append(index)
+        else:
+            responses[index] = response
+    if requests:
+        with metrics.timer(f"batch_{stage}"):
+            batch_responses = batch_runner.run_stage(stage, requests)
+        for index, response in zip(submitted, batch_responses):
+            responses[index] = response
+    results = []
+    batched = set(submitted)
+    for index, (task, request, response) in enumerate(zip(tasks, task_requests, responses)):
+        if request is None:
+            results.append(None)
+        elif response is None:
+            print(f"No batch response for {task['type']} ({stage}).")
+            record_call_error(task.setdefault('usage', {}), "no batch response")
+            results.append(None)
+        else:
+            tokenizer = get_tokenizer(MODEL_REGISTRY[task['type']].model_id)
+            measure_usage(task.setdefault('usage', {}), tokenizer, request_input_tokens(request, tokenizer), response, cached=index not in batched)
+            result = parse_model_response(PROVIDERS[MODEL_REGISTRY[task['type']].provider], response, reply_with_JSON)
+            cache_parsed_response(request, response, result, cached=index not in batched)
+            results.append(result)
+    return results
+
+# Run the whole evaluation with the provider batch APIs: one set of batch jobs for all the
+# answers, then one for all the comparisons. The results are stored like in the other modes.
+def run_batch_mode(questions):
+    items = list(questions)
+    item_answer_tasks = [build_answer_prompts(item) for item in items]
+    answers = iter(fetch_batch("answers", [task for tasks in item_answer_tasks for task in tasks]))
+
+    item_comparison_tasks = []
+    for item, tasks in zip(items, item_answer_tasks):
+        item_answers = [next(answers) for _ in tasks]
+        item_comparison_tasks.append(record_answers(item, tasks, item_answers))
+
+    comparison_results = iter(fetch_batch("comparisons", [task for tasks in item_comparison_tasks for task in tasks],
+                                          system_prompt=system_message_comparison, reply_with_JSON=True))
+    for item, tasks in zip(items, item_comparison_tasks):
+        if tasks:
+            record_comparisons(item, tasks, [next(comparison_results) for _ in tasks])
+
+# Judge the answered questions with active sampling instead of the full tournament:
+# judgments are requested in small batches on the most informative (question, pair, judge)
+# until the Bradley-Terry ratings of the models are settled.
+def run_active_judging(items, models, judges, batch_size):
+    # The sampler starts from the judgments already stored for these models
+    db_writer.flush()
+    sampler = ActiveJudgeSampler(models, judges)
+    seeded = sampler.load_comparisons(db_name)
+    items_by_question = {}
+    exhaustive = 0
+    for item in items:
+        items_by_question[item["question_id"]] = item
+        for judge, model_bot_a, model_bot_b in tournament_pairings(models, judges):
+            exhaustive += 1
+            if judge_stage(judge, model_bot_a, model_bot_b) in item.get("stages", set()):
+                continue
+            if not is_failed_answer(item["answers"].get(model_bot_a)) and not is_failed_answer(item["answers"].get(model_bot_b)):
+                sampler.add_candidate(item["question_id"], judge, model_bot_a, model_bot_b)
+
+    # Each batch goes through the scheduler like a question without answer tasks
+    def judgment_batches():
+        while sampler.has_candidates() and not sampler.is_settled():
+            picks = sampler.next_judgments(batch_size)
+            if not picks:
+                break
+            yield picks
+
+    def batch_comparison_tasks(picks, answer_prompts, answers):
+        tasks = []
+        for question_id, judge, model_bot_a, model_bot_b in picks:
+            item = items_by_question[question_id]
+            pending, recorded = dedupe_judgments(item, [build_comparison_task(item["question"], question_id, item["answers"], judge, model_bot_a, model_bot_b)])
+            tasks.extend(pending)
+            for _, recorded_a, recorded_b, preferred_answer in recorded:
+                sampler.add_result(recorded_a, recorded_b, preferred_answer)
+        return tasks
+
+    def record_batch(picks, comparison_prompts, comparison_results):
+        for comparison_prompt, comparison_result in zip(comparison_prompts, comparison_results):
+            item = items_by_question[comparison_prompt["question_id"]]
+            for _, model_bot_a, model_bot_b, preferred_answer in record_comparisons(item, [comparison_prompt], [comparison_result]):
+                sampler.add_result(model_bot_a, model_bot_b, preferred_answer)
+
+    judging_scheduler = create_scheduler()
+    # Only a couple of batches in flight so that each pick uses recent estimates
+    judging_scheduler.max_pending_questions = 2
+    judging_scheduler.report_every = 0
+    batches = judgment_batches()
+    if isinstance(judging_scheduler, AsyncPipelineScheduler):
+        asyncio.run(judging_scheduler.run(batches, lambda picks: [], batch_comparison_tasks, record_batch))
     else:
-        raise ValueError("Unsupported model type")    
-    
-# Initialize database
-initialize_db()
+        judging_scheduler.run(batches, lambda picks: [], batch_comparison_tasks, record_batch)
+
+    print("Active sampling ratings (Elo, 95% confidence interval):")
+    for model, (rating, interval) in sampler.ratings().items():
+        print(f"{model}: {rating:.0f} +/- {interval:.0f}")
+    print(f"Judgments: {sampler.judgments - seeded} requested ({seeded} already stored), out of {exhaustive} for exhaustive judging."
+          f" Ranking {'settled' if sampler.is_settled() else 'not settled (no candidates left)'}.")
+
+# Dry run: estimate the tokens, cost and duration of the calls of a run without sending them.
+# The prompts are built and measured like in a real run; the answer and judgment sizes and the
+# call durations are the averages of the calls recorded in token_usage, or defaults.
+def estimate_run(items, scheduler):
+    history = load_usage_history(question_lookup)
+    estimate = RunEstimate()
+
+    def expected_reply(model, stage, default_tokens, max_tokens):
+        output_tokens, seconds = history.get((model, stage), (None, None))
+        output_tokens = output_tokens or default_tokens
+        if max_tokens:
+            output_tokens = min(output_tokens, max_tokens)
+        if seconds is None:
+            seconds = DEFAULT_SECONDS_PER_CALL + output_tokens / DEFAULT_OUTPUT_TOKENS_PER_SECOND
+        return int(output_tokens), seconds
+
+    questions = 0
+    for item in items:
+        questions += 1
+        answer_tokens = {}
+        for task in build_answer_prompts(item):
+            spec = MODEL_REGISTRY[task["type"]]
+            request = PROVIDERS[spec.provider]["build_request"](spec, task["prompt"])
+            output_tokens, seconds = expected_reply(spec.name, "answer", DEFAULT_ANSWER_TOKENS, request.get("max_tokens"))
+            answer_tokens[spec.name] = output_tokens
+            if not task["over_budget"]:
+                estimate.add_call(spec.name, "answer", request_input_tokens(request, get_tokenizer(spec.model_id)), output_tokens, seconds, spec.prices)
+        stored = item.get("answers") or {}
+        for judge, model_bot_a, model_bot_b in tournament_pairings(item["models"], item["judges"]):
+            spec = MODEL_REGISTRY[judge]
+            if model_bot_a in stored and model_bot_b in stored:
+                # Both answers are stored: the judgments settled without a call are not counted
+                # (see dedupe_judgments and pending_comparison_prompts)
+                task = build_comparison_task(item["question"], item["question_id"], stored, judge, model_bot_a, model_bot_b)
+                if (task["identical"] or task["over_budget"] or judgment_index.find(task["judgment_key"]) is not None
+                        or judge_stage(judge, model_bot_a, model_bot_b) in item.get("stages", set())):
+                    continue
+                request = PROVIDERS[spec.provider]["build_request"](spec, task["prompt"], system_message_comparison, True)
+                input_tokens = request_input_tokens(request, get_tokenizer(spec.model_id))
+            else:
+                request = PROVIDERS[spec.provider]["build_request"](spec, build_comparison_prompt(item["question"], "", ""), system_message_comparison, True)
+                input_tokens = request_input_tokens(request, get_tokenizer(spec.model_id)) + answer_tokens.get(model_bot_a, 0) + answer_tokens.get(model_bot_b, 0)
+                if token_budget.max_input_tokens:
+                    if token_budget.policy == 'skip' and input_tokens > token_budget.max_input_tokens:
+                        continue
+                    input_tokens = min(input_tokens, token_budget.max_input_tokens)
+            output_tokens, seconds = expected_reply(judge, "judge", DEFAULT_JUDGMENT_TOKENS, request.get("max_tokens"))
+            estimate.add_call(judge, "judge", input_tokens, output_tokens, seconds, spec.prices)
+
+    limits = {}
+    for provider, limiter in rate_limiters.items():
+        in_flight = min(scheduler.provider_limits.get(provider) or scheduler.max_workers, scheduler.max_workers)
+        requests_per_minute = limiter.request_bucket.rate_per_second * 60 if limiter.request_bucket else None
+        tokens_per_minute = limiter.token_bucket.rate_per_second * 60 if limiter.token_bucket else None
+        limits[provider] = (in_flight, requests_per_minute, tokens_per_minute)
+    print(f"Dry run: {questions} questions, no API call was made. Tokenizer: {get_tokenizer(None).name}.")
+    estimate.print_summary(estimate.duration(lambda model: MODEL_REGISTRY[model].provider, limits))
+    if not history:
+        print(f"No call recorded yet: assuming {DEFAULT_ANSWER_TOKENS}-token answers and {DEFAULT_JUDGMENT_TOKENS}-token judgments.")
+
+# Read an integer setting from the environment (.env file)
+def get_int_setting(name, default):
+    value = os.getenv(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        print(f"Invalid value for {name}. Using default value of {default}.")
+        return default
+
+# Build the pipelined scheduler from the concurrency settings.
+# PIPELINE_ENGINE=async uses the asyncio engine instead of threads.
+def create_scheduler(engine=None):
+    engine = engine or os.getenv('PIPELINE_ENGINE', 'threads')
+    if engine == 'async':
+        return AsyncPipelineScheduler(
+            fetch_answers_async,
+            fetch_comparisons_async,
+            max_workers=get_int_setting('MAX_CONCURRENT_REQUESTS', 64),
+            provider_limits={
+                "openai": get_int_setting('OPENAI_MAX_CONCURRENT_REQUESTS', 32),
+                "anthropic": get_int_setting('ANTHROPIC_MAX_CONCURRENT_REQUESTS', 32),
+            },
+            provider_of=provider_of_task,
+        )
+    return PipelineScheduler(
+        fetch_answers,
+        fetch_comparisons,
+        max_workers=get_int_setting('MAX_CONCURRENT_REQUESTS', 8),
+        provider_limits={
+            "openai": get_int_setting('OPENAI_MAX_CONCURRENT_REQUESTS', 4),
+            "anthropic": get_int_setting('ANTHROPIC_MAX_CONCURRENT_REQUESTS', 4),
+        },
+        provider_of=provider_of_task,
+    )
+
+# Single long-lived connection writing the results in batches (WAL mode), None in a dry run
+db_writer = None
+
+# Read connection used to find the questions already stored (indexed content hash lookups)
+question_lookup = None
+
+# Judgments already made, by judgment key, reused instead of calling the judges again
+judgment_index = None
+
+# Open the database: created or migrated for a run. A dry run writes nothing: the database is
+# read through a read-only connection, or from a migrated in-memory copy when it does not exist
+# yet or has an older schema.
+def open_database(dry_run=False):
+    global db_writer, question_lookup, judgment_index
+    if dry_run:
+        question_lookup = open_read_only_database(db_name)
+    else:
+        initialize_db(db_name)
+        db_writer = DatabaseWriter(
+            db_name,
+            batch_size=get_int_setting('DB_BATCH_SIZE', 200),
+            flush_interval=get_int_setting('DB_FLUSH_INTERVAL_MS', 1000) / 1000,
+        )
+        question_lookup = sqlite3.connect(db_name, check_same_thread=False)
+    judgment_index = JudgmentIndex(question_lookup)
+
+def open_read_only_database(db_name):
+    if os.path.exists(db_name):
+        stored = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, check_same_thread=False)
+        if schema_version(stored) == SCHEMA_VERSION:
+            return stored
+    else:
+        stored = None
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    if stored is not None:
+        stored.backup(conn)
+        stored.close()
+    create_tables(conn)
+    return conn
 
 # Main script
 if __name__ == "__main__":
-    user_input = input("Enter a dataset name (for example microsoft/orca-math-word-problems-200k) or type your question directly: ").strip()
+    parser = argparse.ArgumentParser(description="Blind self-evaluation of GPT-4-turbo and Claude 3 Opus (or any registered models).")
+    parser.add_argument("--dataset", help="Dataset name (or a question). Asked interactively when omitted.")
+    parser.add_argument("--field", help="Name of the question field (default: question)")
+    parser.add_argument("--answer-field", default="answer", help="Name of the reference answer field, used to score the answers locally (default: %(default)s)")
+    parser.add_argument("--num-questions", type=int, help="Number of questions to process (default: 20)")
+    parser.add_argument("--resume", action="store_true", help="Continue the latest run of the same dataset and field, skipping completed work")
+    parser.add_argument("--offset", type=int, default=0, help="Index of the first dataset row to process (default: 0)")
+    parser.add_argument("--seed", type=int, help="Shuffle the dataset with this seed before selecting the rows")
+    parser.add_argument("--num-shards", type=int, default=1, help="Number of workers sharing the selected rows (default: 1)")
+    parser.add_argument("--shard-index", type=int, default=0, help="Index of this worker, between 0 and num-shards - 1 (default: 0)")
+    parser.add_argument("--no-streaming", action="store_true", help="Download and cache the dataset instead of streaming the rows")
+    parser.add_argument("--openai-rpm", type=float, help="OpenAI requests per minute (default: OPENAI_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--openai-tpm", type=float, help="OpenAI tokens per minute (default: OPENAI_TOKENS_PER_MINUTE)")
+    parser.add_argument("--anthropic-rpm", type=float, help="Anthropic requests per minute (default: ANTHROPIC_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--anthropic-tpm", type=float, help="Anthropic tokens per minute (default: ANTHROPIC_TOKENS_PER_MINUTE)")
+    parser.add_argument("--models-file", help="JSON file registering additional models (name, provider, model_id, params)")
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS), help="Comma-separated names of the models to compare (default: %(default)s)")
+    parser.add_argument("--judges", help="Comma-separated names of the judging models (default: the compared models)")
+    parser.add_argument("--active-sampling", action="store_true", help="Answer all the questions, then only request the most informative judgments until the ranking is settled")
+    parser.add_argument("--active-batch-size", type=int, default=8, help="Judgments requested at once with --active-sampling (default: 8)")
+    parser.add_argument("--batch-mode", action="store_true", help="Submit all the answer and comparison prompts as provider batch jobs instead of individual calls")
+    parser.add_argument("--batch-poll-seconds", type=float, default=60, help="Interval between two checks of the batch jobs (default: 60)")
+    parser.add_argument("--dry-run", action="store_true", help="Estimate the tokens, cost and duration of the run without calling the APIs")
+    parser.add_argument("--metrics", action="store_true", help="Time each stage and print p50/p95/p99 latencies at the end of the run (default: METRICS)")
+    parser.add_argument("--metrics-jsonl", help="Append every timed operation to this JSONL file (implies --metrics, default: METRICS_JSONL)")
+    parser.add_argument("--metrics-prometheus", help="Write the metrics to this file in the Prometheus text format at the end of the run (implies --metrics)")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_jsonl or args.metrics_prometheus:
+        metrics.configure(True, args.metrics_jsonl or os.getenv('METRICS_JSONL'))
+
+    if args.models_file:
+        load_models_file(args.models_file)
+    models = parse_model_names(args.models)
+    judges = parse_model_names(args.judges) if args.judges else models
+    if len(models) < 2:
+        parser.error("At least two models are needed for a comparison.")
+    if args.batch_mode and args.active_sampling:
+        parser.error("--batch-mode and --active-sampling cannot be used together.")
+    batch_runner.poll_interval = args.batch_poll_seconds
+    open_database(dry_run=args.dry_run)
+    if not args.dry_run:
+        insert_models(get_models(sorted(set(models) | set(judges))))
+
+    # Command line rate limits override the ones from the environment
+    if args.openai_rpm or args.openai_tpm:
+        rate_limiters["openai"].set_limits(args.openai_rpm or get_int_setting('OPENAI_REQUESTS_PER_MINUTE', 0),
+                                          args.openai_tpm or get_int_setting('OPENAI_TOKENS_PER_MINUTE', 0))
+    if args.anthropic_rpm or args.anthropic_tpm:
+        rate_limiters["anthropic"].set_limits(args.anthropic_rpm or get_int_setting('ANTHROPIC_REQUESTS_PER_MINUTE', 0),
+                                            args.anthropic_tpm or get_int_setting('ANTHROPIC_TOKENS_PER_MINUTE', 0))
+
+    user_input = args.dataset
+    if user_input is None:
+        user_input = input("Enter a dataset name (for example microsoft/orca-math-word-problems-200k) or type your question directly: ").strip()
     if is_dataset_name(user_input):
         # Prompt user for dataset name, question field name, and number of questions to process
         dataset_name = user_input
         if not dataset_name:
             dataset_name = "microsoft/orca-math-word-problems-200k"
 
-        question_field = input("Enter the name of the question field (default: question): ").strip()
+        question_field = args.field
+        if question_field is None:
+            question_field = input("Enter the name of the question field (default: question): ").strip()
         if not question_field:
             question_field = "question"
 
-        num_questions = input("Enter the number of questions to process (default: 20): ").strip()
-        try:
-            num_questions = int(num_questions) if num_questions else 20
-        except ValueError:
-            print("Invalid input for the number of questions. Using default value of 20.")
-            num_questions = 20
-        questions = get_questions(dataset_name, question_field, num_questions)
+        num_questions = args.num_questions
+        if num_questions is None:
+            num_questions = input("Enter the number of questions to process (default: 20): ").strip()
+            try:
+                num_questions = int(num_questions) if num_questions else 20
+            except ValueError:
+                print("Invalid input for the number of questions. Using default value of 20.")
+                num_questions = 20
+
+        # Track the run so that it can be resumed with --resume (a dry run estimates the whole run)
+        run_id = None if args.dry_run else start_run(db_name, dataset_name, question_field, num_questions, resume=args.resume, created_at=os.getenv('RUN_CREATED_AT'))
+        progress = {} if args.dry_run else load_run_progress(db_name, run_id)
+        if progress:
+            print(f"Resuming run {run_id}: {len(progress)} questions already started.")
+        # Rows are streamed (or sliced) so startup time and memory do not depend on the dataset size.
+        # Use the same --offset/--seed/--num-shards/--shard-index options when resuming a run.
+        dataset_questions = metrics.timed_iter("dataset_fetch", iter_dataset_examples(
+            dataset_name, question_field, args.answer_field, offset=args.offset, limit=num_questions, shuffle_seed=args.seed,
+            num_shards=args.num_shards, shard_index=args.shard_index, streaming=not args.no_streaming))
+        questions = build_run_items(dataset_questions, run_id, progress, models, judges, defer_judging=args.active_sampling)
     else:
         # User provided a direct question
-        questions = [user_input]
-            
-    for user_question in questions:
-        # Process each question as before
-        question_prompts = [
-            {"type": "GPT-4", "prompt": user_question},
-            {"type": "Claude3", "prompt": user_question}
-        ]
-
-        # Parallel fetching of answers
-        with ThreadPoolExecutor() as executor:
-            answers = list(executor.map(fetch_answers, question_prompts))
-
-        answer_gpt4 = answers[0]
-        answer_claude3 = answers[1]
-        print(f"#####")
-        print(f"""Answer by GPT-4: 
-                {answer_gpt4}""")
-        print(f"#####")
-        print(f"""Answer by Claude3: 
-                {answer_claude3}""")
-
-        # Insert question and answers into database
-        question_id = insert_question_and_answers(user_question, answer_gpt4, answer_claude3)
-
-        # Prepare and evaluate comparison prompts
-        comparison_prompt_first_gpt4 = f"Question: {user_question}\n\nAnswer A: {answer_gpt4}\n\nAnswer B: {answer_claude3}\n\nProvide a detailed comparison including an explanation, scores for each answer, and select the better answer."
-        comparison_prompt_first_claude3 = f"Question: {user_question}\n\nAnswer A: {answer_claude3}\n\nAnswer B: {answer_gpt4}\n\nProvide a detailed comparison including an explanation, scores for each answer, and select the better answer."
-        
-        comparison_prompts = [
-            {"type": "GPT-4", "prompt": comparison_prompt_first_gpt4, "question_id": question_id, "model_bot_a": "GPT-4", "model_bot_b": "Claude3"},
-            {"type": "GPT-4", "prompt": comparison_prompt_first_claude3, "question_id": question_id, "model_bot_a": "Claude3", "model_bot_b": "GPT-4"},
-            {"type": "Claude3", "prompt": comparison_prompt_first_gpt4, "question_id": question_id, "model_bot_a": "GPT-4", "model_bot_b": "Claude3"},
-            {"type": "Claude3", "prompt": comparison_prompt_first_claude3, "question_id": question_id, "model_bot_a": "Claude3", "model_bot_b": "GPT-4"},
-        ]
-        
-        # Parallel fetching of comparisons
-        with ThreadPoolExecutor() as executor:
-            comparison_results = list(executor.map(fetch_comparisons, comparison_prompts))
-
-        # Initialize score accumulators and counts
-        total_score_gpt4 = 0
-        total_score_claude3 = 0
-        count_gpt4 = 0
-        count_claude3 = 0
-        print("###")
-        print(f"comparison_result={comparison_results}")
-        print(" ")
-        for i, comparison_result in enumerate(comparison_results):
-            model_evaluating = comparison_prompts[i]['type']
-            model_bot_a = comparison_prompts[i]['model_bot_a']
-            model_bot_b = comparison_prompts[i]['model_bot_b']
-            # Determine the preferred answer based on the comparison result
-            if comparison_result is not None and 'better_answer' in comparison_result:
-                if comparison_result['better_answer'][0] == 'A':
-                    preferred_answer = model_bot_a
-                elif comparison_result['better_answer'][0] == 'B':
-                    preferred_answer = model_bot_b
-                else:
-                    print(f"Unknown? {comparison_result['better_answer']}")
-                    preferred_answer = "Unknown"  # Fallback case, should ideally not happen
-            else:
-                print("####")
-                print("Comparison result is None or 'better_answer' key is missing.")   
-                print(f"comparison_prompts[i]={comparison_prompts[i]}")
-                print(f"comparison_result={comparison_result}")
-                print(f"comparison_results i={i}")
-                print("Comparison result is None or 'better_answer' key is missing.")        
-                print(" ")
-                
-
-            explanation = comparison_result['explanation']
-            score_a = int(comparison_result['score_a'])  # Convert score to integer
-            score_b = int(comparison_result['score_b'])  # Convert score to integer
-            
-            # Insert comparison results into the database
-            insert_comparisons(question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
-
-            # Print comparison results with explanations and scores
-            print(f"#####")
-            print(f"""Comparison result by {model_evaluating}: 
-    Bot A {model_bot_a} (score {score_a}) vs Bot B {model_bot_b} (score {score_b})
-    Preferred answer: {preferred_answer} with explanation: 
-            {explanation}""")
-            # Update score totals and counts based on the model being evaluated
-            if model_bot_a == "GPT-4":
-                total_score_gpt4 += score_a
-                count_gpt4 += 1
-            if model_bot_b == "GPT-4":
-                total_score_gpt4 += score_b
-                count_gpt4 += 1
-            if model_bot_a == "Claude3":
-                total_score_claude3 += score_a
-                count_claude3 += 1
-            if model_bot_b == "Claude3":
-                total_score_claude3 += score_b
-                count_claude3 += 1
-
-# After all comparisons are processed, calculate the average scores
-average_score_gpt4 = total_score_gpt4 / count_gpt4 if count_gpt4 else 0
-average_score_claude3 = total_score_claude3 / count_claude3 if count_claude3 else 0
-
-# Display the average scores
-print("Average Scores:")
-print(f"GPT-4: {average_score_gpt4}")
-print(f"Claude3: {average_score_claude3}")
\ No newline at end of file
+        run_id = None
+        questions = [{"question": user_input, "models": models, "judges": judges, "defer_judging": args.active_sampling}]
+
+    # Answers for the next questions are fetched while the previous ones are being judged
+    scheduler = create_scheduler()
+    if args.dry_run:
+        estimate_run(questions, scheduler)
+        question_lookup.close()
+        raise SystemExit(0)
+    try:
+        if args.batch_mode:
+            run_batch_mode(questions)
+        elif isinstance(scheduler, AsyncPipelineScheduler):
+            asyncio.run(scheduler.run(questions, build_answer_prompts, record_answers, record_comparisons))
+        else:
+            scheduler.run(questions, build_answer_prompts, record_answers, record_comparisons)
+        if args.active_sampling:
+            run_active_judging(answered_items, models, judges, args.active_batch_size)
+        if run_id is not None:
+            record_repeated_rows(run_id)
+    finally:
+        # Commit every queued row, even if the run was interrupted
+        db_writer.close()
+
+    # After all comparisons are processed, calculate and display the average scores
+    print("Average Scores:")
+    for model in models:
+        average_score = score_totals[model] / score_counts[model] if score_counts.get(model) else 0
+        print(f"{model}: {average_score}")
+    if not args.batch_mode:
+        print(f"Throughput: {scheduler.questions_per_minute():.1f} questions/min")
+    cache_stats = response_cache.stats()
+    print(f"Response cache ({cache_stats['mode']}): {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+    for limiter in rate_limiters.values():
+        print(f"{limiter.name} API: {limiter.retries} retries, {limiter.failures} failed calls")
+    print(f"Judge calls saved: {judgment_index.ties} identical-answer ties, {judgment_index.reused} reused judgments")
+    if run_id is not None:
+        # Reference-based accuracy of the answers of this run, computed locally
+        run_question_ids = [row[0] for row in question_lookup.execute("SELECT question_id FROM run_questions WHERE run_id = ?", (run_id,))]
+        accuracy = compute_accuracy(db_name, models, run_question_ids)
+        if accuracy:
+            print_accuracy(accuracy)
+    metrics.print_summary()
+    if args.metrics_prometheus:
+        metrics.write_prometheus(args.metrics_prometheus)
+    metrics.close()
@@ -0,0 +1,89 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+# Stage names recorded in run_stages for each dataset row:
+# - 'answer:<model>' once the answer of that model is stored
+# - 'judge:<evaluator>:<bot a>:<bot b>' once that evaluator judged the answers in that order
+def answer_stage(model):
+    return f"answer:{model}"
+
+
+def judge_stage(model_evaluating, model_bot_a, model_bot_b):
+    return f"judge:{model_evaluating}:{model_bot_a}:{model_bot_b}"
+
+
+# Create the run tracking tables (called from initialize_db)
+def initialize_run_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, dataset TEXT, question_field TEXT, num_questions INTEGER, created_at TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS run_questions (run_id INTEGER, row_index INTEGER, question_id INTEGER, PRIMARY KEY(run_id, row_index), FOREIGN KEY(run_id) REFERENCES runs(id), FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS run_stages (run_id INTEGER, row_index INTEGER, stage TEXT, completed_at TEXT, PRIMARY KEY(run_id, row_index, stage), FOREIGN KEY(run_id) REFERENCES runs(id))''')
+
+
+# Start a new run, or with resume=True continue the latest run of the same dataset and field.
+# created_at identifies the run (the workers of a sharded run share it, so that their runs are
+# merged into one); when it is given, resume continues that run only. Returns the run id.
+def start_run(db_name, dataset, question_field, num_questions, resume=False, created_at=None):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    if resume:
+        if created_at:
+            # A shard database copied from the target also holds the runs of the target
+            c.execute("SELECT id FROM runs WHERE dataset = ? AND question_field = ? AND created_at = ? ORDER BY id DESC LIMIT 1",
+                      (dataset, question_field, created_at))
+        else:
+            c.execute("SELECT id FROM runs WHERE dataset = ? AND question_field = ? ORDER BY id DESC LIMIT 1", (dataset, question_field))
+        row = c.fetchone()
+        if row:
+            run_id = row[0]
+            # A resumed run may be extended to more questions than the original one
+            c.execute("UPDATE runs SET num_questions = MAX(num_questions, ?) WHERE id = ?", (num_questions, run_id))
+            conn.commit()
+            conn.close()
+            return run_id
+        print(f"No previous run found for dataset '{dataset}' and field '{question_field}'. Starting a new run.")
+    c.execute("INSERT INTO runs (dataset, question_field, num_questions, created_at) VALUES (?, ?, ?, ?)",
+              (dataset, question_field, num_questions, created_at or datetime.now(timezone.utc).isoformat()))
+    run_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return run_id
+
+
+# Load what has already been done for a run: {row_index: {"question_id", "stages", "answers"}}
+# "answers" maps each model whose answer stage is complete to its stored answer.
+def load_run_progress(db_name, run_id):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    progress = {}
+    c.execute("SELECT row_index, question_id FROM run_questions WHERE run_id = ?", (run_id,))
+    for row_index, question_id in c.fetchall():
+        progress[row_index] = {"question_id": question_id, "stages": set(), "answers": None}
+    c.execute("SELECT row_index, stage FROM run_stages WHERE run_id = ?", (run_id,))
+    for row_index, stage in c.fetchall():
+        if row_index in progress:
+            progress[row_index]["stages"].add(stage)
+    for row_index, entry in progress.items():
+        c.execute("SELECT model, answer FROM answers WHERE question_id = ?", (entry["question_id"],))
+        entry["answers"] = {model: json.loads(answer) for model, answer in c.fetchall()
+                            if answer_stage(model) in entry["stages"]}
+    conn.close()
+    return progress
+
+
+# Record the question id stored for a dataset row
+def record_run_question(db_writer, run_id, row_index, question_id):
+    db_writer.write("INSERT OR REPLACE INTO run_questions (run_id, row_index, question_id) VALUES (?, ?, ?)",
+                    (run_id, row_index, question_id))
+
+
+# Mark a stage of a dataset row as completed
+def record_stage(db_writer, run_id, row_index, stage):
+    db_writer.write("INSERT OR REPLACE INTO run_stages (run_id, row_index, stage, completed_at) VALUES (?, ?, ?, ?)",
+                    (run_id, row_index, stage, datetime.now(timezone.utc).isoformat()))
+
+
+# Copy the completed stages of a dataset row to another row of the same run (same question)
+def copy_stages(db_writer, run_id, from_row_index, to_row_index):
+    db_writer.write('''INSERT OR REPLACE INTO run_stages (run_id, row_index, stage, completed_at)
+        SELECT run_id, ?, stage, completed_at FROM run_stages WHERE run_id = ? AND row_index = ?''', (to_row_index, run_id, from_row_index))
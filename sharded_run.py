@@ -0,0 +1,311 @@
+import os
+import sys
+import glob
+import json
+import sqlite3
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from migrations import SCHEMA_VERSION, schema_version
+
+# Sharded runs: the rows of a dataset run are split between worker processes (row_index %
+# num_shards == shard_index, see dataset_loader.iter_dataset_rows), each one running the main
+# script with its own SQLite file (COMPARE_MODELS_DB). Workers can run on one machine or on
+# several machines sharing a filesystem. merge_shards then consolidates the shard files into
+# one database, giving the shard questions new ids in the target database.
+# All the workers of a sharded run create their run with the same creation time (RUN_CREATED_AT),
+# which identifies the run: the merge makes one run of the runs of all the shards.
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_model_comparison_analysis.py")
+DEFAULT_DB = "db_compare_models.db"
+DEFAULT_SHARD_DIR = "shards"
+# File of the shard directory recording the identity of the sharded run
+RUN_FILE = "run.json"
+# Provider limits (per minute) shared by all the workers, see rate_limiter.create_provider_limiter
+SHARED_LIMITS = ("OPENAI_REQUESTS_PER_MINUTE", "OPENAI_TOKENS_PER_MINUTE", "ANTHROPIC_REQUESTS_PER_MINUTE", "ANTHROPIC_TOKENS_PER_MINUTE")
+
+
+def shard_db_path(shard_dir, shard_index, num_shards):
+    return os.path.join(shard_dir, f"db_compare_models.shard-{shard_index}-of-{num_shards}.db")
+
+
+# Creation time shared by the workers of a sharded run: the given one, else with resume the one
+# recorded in the shard directory, else a new one. It is recorded in the shard directory.
+def shared_run_created_at(shard_dir, created_at=None, resume=False):
+    path = os.path.join(shard_dir, RUN_FILE)
+    if created_at is None and resume and os.path.exists(path):
+        with open(path, encoding="utf-8") as run_file:
+            created_at = json.load(run_file).get("created_at")
+    created_at = created_at or datetime.now(timezone.utc).isoformat()
+    os.makedirs(shard_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as run_file:
+        json.dump({"created_at": created_at}, run_file)
+    return created_at
+
+
+# Environment of one worker: its database, the identity of the run, and its part of the
+# provider rate limits
+def shard_env(db_path, num_shards, env=None, run_created_at=None):
+    env = dict(os.environ if env is None else env)
+    env["COMPARE_MODELS_DB"] = db_path
+    if run_created_at:
+        env["RUN_CREATED_AT"] = run_created_at
+    for name in SHARED_LIMITS:
+        try:
+            limit = float(env.get(name) or 0)
+        except ValueError:
+            continue
+        if limit > 0:
+            env[name] = str(limit / num_shards)
+    return env
+
+
+# Start a new shard database as a copy of the target database, so that its worker reuses the
+# questions, answers and judgments already stored instead of requesting them again
+def seed_shard(seed_db, db_path):
+    source = sqlite3.connect(seed_db)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+# Run the main script once per shard index, all at once, and wait for them.
+# script_args are the arguments of the main script (--dataset, --field and --num-questions are
+# needed, the workers cannot prompt). The shard databases that do not exist yet are copies of
+# seed_db, when it is given and exists. Returns [(shard_index, exit code, database path)].
+def run_shards(script_args, num_shards, shard_indexes=None, shard_dir=DEFAULT_SHARD_DIR, run_created_at=None, seed_db=None):
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_indexes = range(num_shards) if shard_indexes is None else shard_indexes
+    workers = []
+    for shard_index in shard_indexes:
+        db_path = shard_db_path(shard_dir, shard_index, num_shards)
+        if seed_db and os.path.exists(seed_db) and not os.path.exists(db_path):
+            seed_shard(seed_db, db_path)
+            print(f"Shard {shard_index}/{num_shards} starts from a copy of {seed_db}")
+        log_path = os.path.join(shard_dir, f"shard-{shard_index}-of-{num_shards}.log")
+        log_file = open(log_path, "a", encoding="utf-8")
+        command = [sys.executable, MAIN_SCRIPT, *script_args, "--num-shards", str(num_shards), "--shard-index", str(shard_index)]
+        process = subprocess.Popen(command, env=shard_env(db_path, num_shards, run_created_at=run_created_at), stdout=log_file,
+                                   stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        print(f"Shard {shard_index}/{num_shards} started (pid {process.pid}), log: {log_path}")
+        workers.append((shard_index, process, log_file, db_path))
+    results = []
+    for shard_index, process, log_file, db_path in workers:
+        exit_code = process.wait()
+        log_file.close()
+        print(f"Shard {shard_index}/{num_shards} finished with exit code {exit_code}")
+        results.append((shard_index, exit_code, db_path))
+    return results
+
+
+# Create the tables, indexes, views and triggers of the source database in the target one
+def _copy_schema(conn, source="shard"):
+    rows = conn.execute(f'''SELECT type, sql FROM {source}.sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY type <> 'table', rowid''').fetchall()
+    for _, sql in rows:
+        conn.execute(sql)
+    version = conn.execute(f"PRAGMA {source}.user_version").fetchone()[0]
+    conn.execute(f"PRAGMA user_version = {version}")
+
+
+# Merge one attached shard ("shard") into the main database, in the current transaction.
+# - questions are matched on their content hash; new ones get ids after the largest one
+# - the stored answers are kept: the shard answers are added for the (question, model) without
+#   one, or replace a failed answer. A different shard answer for a stored answer is a conflict:
+#   it is not merged, nor the shard judgments of it (counted in answer_conflicts and
+#   comparison_conflicts), so that the stored judgments keep judging the stored answers
+# - comparisons already present (same question, judge, pair, scores and explanation) are
+#   skipped, so merging a shard twice adds nothing; the summary triggers update the summaries
+# - runs are matched on (dataset, question field, creation time), new ones get new ids: the
+#   runs of the shards of one sharded run become one run
+def _merge_shard(conn):
+    counts = {}
+    conn.execute("DROP TABLE IF EXISTS temp.question_map")
+    conn.execute("CREATE TEMP TABLE question_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+    conn.execute('''INSERT INTO question_map (old_id, new_id)
+        SELECT shard_questions.id, questions.id FROM shard.questions AS shard_questions
+        JOIN main.questions ON questions.content_hash = shard_questions.content_hash''')
+    conn.execute('''UPDATE main.questions SET reference_answer = (
+            SELECT shard_questions.reference_answer FROM shard.questions AS shard_questions JOIN question_map ON question_map.old_id = shard_questions.id
+            WHERE question_map.new_id = questions.id)
+        WHERE reference_answer IS NULL AND id IN (SELECT new_id FROM question_map)''')
+    base_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.questions").fetchone()[0]
+    conn.execute('''INSERT INTO question_map (old_id, new_id)
+        SELECT id, ? + ROW_NUMBER() OVER (ORDER BY id) FROM shard.questions
+        WHERE id NOT IN (SELECT old_id FROM question_map)''', (base_id,))
+    counts["questions"] = conn.execute('''INSERT INTO main.questions (id, question, content_hash, reference_answer)
+        SELECT question_map.new_id, shard_questions.question, shard_questions.content_hash, shard_questions.reference_answer
+        FROM shard.questions AS shard_questions JOIN question_map ON question_map.old_id = shard_questions.id
+        WHERE question_map.new_id > ? ORDER BY question_map.new_id''', (base_id,)).rowcount
+
+    # Latest shard answer of each (question, model), with the answer stored in the target for it
+    conn.execute("DROP TABLE IF EXISTS temp.answer_merge")
+    conn.execute('''CREATE TEMP TABLE answer_merge AS
+        SELECT shard_answers.id AS id, question_map.new_id AS question_id, shard_answers.model AS model, shard_answers.answer AS answer,
+               (SELECT answers.answer FROM main.answers WHERE answers.question_id = question_map.new_id AND answers.model = shard_answers.model
+                ORDER BY answers.answer IS 'null', answers.id LIMIT 1) AS stored_answer
+        FROM shard.answers AS shard_answers JOIN question_map ON question_map.old_id = shard_answers.question_id
+        WHERE shard_answers.id = (SELECT MAX(latest.id) FROM shard.answers AS latest
+                                  WHERE latest.question_id = shard_answers.question_id AND latest.model = shard_answers.model)''')
+    # A different answer of the shard for an answer already stored is not merged, nor the judgments of it
+    conn.execute("DROP TABLE IF EXISTS temp.answer_conflicts")
+    conn.execute('''CREATE TEMP TABLE answer_conflicts AS
+        SELECT question_id, model FROM answer_merge
+        WHERE stored_answer IS NOT NULL AND stored_answer IS NOT 'null' AND answer IS NOT stored_answer''')
+    counts["answer_conflicts"] = conn.execute("SELECT COUNT(*) FROM answer_conflicts").fetchone()[0]
+    # New answers, and successful answers replacing failed ones (failed answers are not judged)
+    conn.execute('''DELETE FROM answer_merge WHERE answer IS stored_answer OR (stored_answer IS NOT NULL AND stored_answer IS NOT 'null')
+        OR (answer IS 'null' AND stored_answer IS NOT NULL)''')
+    conn.execute('''DELETE FROM main.answers WHERE answer IS 'null' AND EXISTS (
+        SELECT 1 FROM answer_merge WHERE answer_merge.question_id = answers.question_id AND answer_merge.model = answers.model)''')
+    counts["answers"] = conn.execute('''INSERT INTO main.answers (question_id, model, answer)
+        SELECT question_id, model, answer FROM answer_merge ORDER BY id''').rowcount
+
+    conn.execute("DROP TABLE IF EXISTS temp.comparison_merge")
+    conn.execute('''CREATE TEMP TABLE comparison_merge AS
+        SELECT shard_comparisons.id AS id, question_map.new_id AS question_id, shard_comparisons.model_evaluating AS model_evaluating,
+               shard_comparisons.preferred_answer AS preferred_answer, shard_comparisons.model_bot_a AS model_bot_a,
+               shard_comparisons.model_bot_b AS model_bot_b, shard_comparisons.score_a AS score_a, shard_comparisons.score_b AS score_b,
+               shard_comparisons.explanation AS explanation, shard_comparisons.judgment_key AS judgment_key
+        FROM shard.comparisons AS shard_comparisons JOIN question_map ON question_map.old_id = shard_comparisons.question_id
+        WHERE NOT EXISTS (SELECT 1 FROM main.comparisons
+                          WHERE comparisons.question_id = question_map.new_id AND comparisons.model_evaluating = shard_comparisons.model_evaluating
+                            AND comparisons.model_bot_a = shard_comparisons.model_bot_a AND comparisons.model_bot_b = shard_comparisons.model_bot_b
+                            AND comparisons.score_a IS shard_comparisons.score_a AND comparisons.score_b IS shard_comparisons.score_b
+                            AND comparisons.explanation IS shard_comparisons.explanation)''')
+    counts["comparison_conflicts"] = conn.execute('''DELETE FROM comparison_merge WHERE EXISTS (
+        SELECT 1 FROM answer_conflicts WHERE answer_conflicts.question_id = comparison_merge.question_id
+          AND answer_conflicts.model IN (comparison_merge.model_bot_a, comparison_merge.model_bot_b))''').rowcount
+    counts["comparisons"] = conn.execute('''INSERT INTO main.comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key)
+        SELECT question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key
+        FROM comparison_merge ORDER BY id''').rowcount
+
+    conn.execute("INSERT OR REPLACE INTO main.models (name, provider, model_id, params) SELECT name, provider, model_id, params FROM shard.models")
+    conn.execute('''INSERT OR REPLACE INTO main.answer_accuracy (question_id, model, predicted, reference, correct)
+        SELECT question_map.new_id, model, predicted, reference, correct
+        FROM shard.answer_accuracy JOIN question_map ON question_map.old_id = answer_accuracy.question_id
+        WHERE NOT EXISTS (SELECT 1 FROM answer_conflicts WHERE answer_conflicts.question_id = question_map.new_id
+                          AND answer_conflicts.model = answer_accuracy.model)''')
+    # Token usage rows already merged (same question, model and time) are skipped
+    conn.execute('''INSERT INTO main.token_usage (question_id, model, stage, input_tokens, output_tokens, truncated_tokens, seconds, cached, created_at, error)
+        SELECT question_map.new_id, model, stage, input_tokens, output_tokens, truncated_tokens, seconds, cached, created_at, error
+        FROM shard.token_usage JOIN question_map ON question_map.old_id = token_usage.question_id
+        WHERE NOT EXISTS (SELECT 1 FROM main.token_usage AS merged WHERE merged.question_id = question_map.new_id
+                          AND merged.model = token_usage.model AND merged.created_at = token_usage.created_at)
+        ORDER BY token_usage.id''')
+
+    counts["runs"] = 0
+    for run_id, dataset, question_field, num_questions, created_at in conn.execute(
+            "SELECT id, dataset, question_field, num_questions, created_at FROM shard.runs ORDER BY id").fetchall():
+        row = conn.execute("SELECT id FROM main.runs WHERE dataset IS ? AND question_field IS ? AND created_at IS ?",
+                           (dataset, question_field, created_at)).fetchone()
+        if row:
+            new_run_id = row[0]
+            conn.execute("UPDATE main.runs SET num_questions = MAX(num_questions, ?) WHERE id = ?", (num_questions, new_run_id))
+        else:
+            new_run_id = conn.execute("INSERT INTO main.runs (dataset, question_field, num_questions, created_at) VALUES (?, ?, ?, ?)",
+                                      (dataset, question_field, num_questions, created_at)).lastrowid
+            counts["runs"] += 1
+        conn.execute('''INSERT OR REPLACE INTO main.run_questions (run_id, row_index, question_id)
+            SELECT ?, row_index, question_map.new_id FROM shard.run_questions
+            JOIN question_map ON question_map.old_id = run_questions.question_id WHERE run_id = ?''', (new_run_id, run_id))
+        conn.execute('''INSERT OR REPLACE INTO main.run_stages (run_id, row_index, stage, completed_at)
+            SELECT ?, row_index, stage, completed_at FROM shard.run_stages WHERE run_id = ?''', (new_run_id, run_id))
+
+    for table in ("question_map", "answer_merge", "answer_conflicts", "comparison_merge"):
+        conn.execute(f"DROP TABLE {table}")
+    return counts
+
+
+# Merge shard databases into the target database (created if needed), one transaction per
+# shard. The shards must be complete: stop their workers first. Returns {shard path: counts}.
+def merge_shards(shard_paths, target_db=DEFAULT_DB):
+    conn = sqlite3.connect(target_db, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    results = {}
+    try:
+        for shard_path in shard_paths:
+            if os.path.abspath(shard_path) == os.path.abspath(target_db):
+                continue
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+            try:
+                shard_version = conn.execute("PRAGMA shard.user_version").fetchone()[0]
+                if shard_version != SCHEMA_VERSION:
+                    raise ValueError(f"{shard_path} is at schema version {shard_version}, expected {SCHEMA_VERSION}: "
+                                     "open it once with the current run_model_comparison_analysis.py (COMPARE_MODELS_DB) to migrate it")
+                has_tables = conn.execute("SELECT COUNT(*) FROM main.sqlite_master WHERE type = 'table' AND name = 'questions'").fetchone()[0]
+                if not has_tables:
+                    conn.execute("BEGIN")
+                    _copy_schema(conn)
+                    conn.execute("COMMIT")
+                elif schema_version(conn) != SCHEMA_VERSION:
+                    raise ValueError(f"{target_db} is at schema version {schema_version(conn)}, expected {SCHEMA_VERSION}: "
+                                     "run run_model_comparison_analysis.py once on it to migrate it")
+                conn.execute("BEGIN")
+                try:
+                    results[shard_path] = _merge_shard(conn)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a dataset evaluation in several worker processes, each with its own SQLite file, and merge the shard files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Start the workers of a sharded run and wait for them")
+    run_parser.add_argument("--workers", type=int, required=True, help="Total number of shards (worker processes over all the machines)")
+    run_parser.add_argument("--shard-indexes", help="Comma-separated shards to run on this machine (default: all)")
+    run_parser.add_argument("--shard-dir", default=DEFAULT_SHARD_DIR, help="Directory of the shard databases and logs, shared between the machines (default: %(default)s)")
+    run_parser.add_argument("--run-created-at", help="Identity (creation time) of the run, shared by the shards of all the machines "
+                            "(default: a new one, or with --resume the one recorded in --shard-dir)")
+    run_parser.add_argument("--merge", action="store_true", help="Merge the shards into --db once all the workers of this machine succeeded")
+    run_parser.add_argument("--db", default=DEFAULT_DB, help="Database the shards are merged into, and copied into the new shards (default: %(default)s)")
+    run_parser.add_argument("--no-seed", action="store_true", help="Start the new shards from an empty database instead of a copy of --db")
+    run_parser.add_argument("script_args", nargs=argparse.REMAINDER, help="Arguments of run_model_comparison_analysis.py, after '--'")
+    merge_parser = subparsers.add_parser("merge", help="Merge shard databases into one database")
+    merge_parser.add_argument("shards", nargs="*", help="Shard databases (default: all the shards in --shard-dir)")
+    merge_parser.add_argument("--shard-dir", default=DEFAULT_SHARD_DIR, help="Directory of the shard databases (default: %(default)s)")
+    merge_parser.add_argument("--db", default=DEFAULT_DB, help="Target database (default: %(default)s)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.command == "run":
+        script_args = args.script_args[1:] if args.script_args[:1] == ["--"] else args.script_args
+        for option in ("--dataset", "--field", "--num-questions"):
+            if option not in script_args:
+                parser.error(f"The workers cannot prompt: give {option} to run_model_comparison_analysis.py after '--'.")
+        if "--num-shards" in script_args or "--shard-index" in script_args:
+            parser.error("--num-shards and --shard-index are set by the launcher, use --workers and --shard-indexes.")
+        if args.workers < 1:
+            parser.error("--workers must be at least 1.")
+        shard_indexes = [int(index) for index in args.shard_indexes.split(",")] if args.shard_indexes else None
+        run_created_at = shared_run_created_at(args.shard_dir, args.run_created_at, resume="--resume" in script_args)
+        print(f"Run created at {run_created_at} (give --run-created-at {run_created_at} to the launchers of the other machines)")
+        results = run_shards(script_args, args.workers, shard_indexes, args.shard_dir, run_created_at, None if args.no_seed else args.db)
+        failed = [shard_index for shard_index, exit_code, _ in results if exit_code != 0]
+        if failed:
+            print(f"Shards {', '.join(map(str, failed))} failed, see their logs. Rerun them with --shard-indexes and --resume.")
+            sys.exit(1)
+        shard_paths = [db_path for _, _, db_path in results]
+    else:
+        shard_paths = args.shards or sorted(glob.glob(os.path.join(args.shard_dir, "db_compare_models.shard-*.db")))
+        if not shard_paths:
+            parser.error(f"No shard database found in {args.shard_dir}.")
+
+    if args.command == "merge" or args.merge:
+        for shard_path, counts in merge_shards(shard_paths, args.db).items():
+            print(f"Merged {shard_path}: {counts['questions']} new questions, {counts['answers']} answers, "
+                  f"{counts['comparisons']} new comparisons, {counts['runs']} new runs")
+            if counts["answer_conflicts"]:
+                print(f"  {counts['answer_conflicts']} answers differ from the stored ones and were not merged, "
+                      f"with their {counts['comparison_conflicts']} judgments")
@@ -0,0 +1,93 @@
+import os
+import sys
+import sqlite3
+import subprocess
+import pytest
+
+# The modules of the project are at the top level of the repository, the mock server in benchmarks/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+from run_tracking import initialize_run_tables
+from aggregates import initialize_summary_tables
+from migrations import apply_migrations
+
+
+# Create a database with the current schema, like initialize_db in run_model_comparison_analysis.py
+# (the main script connects to the APIs when imported)
+def create_db(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS questions (id INTEGER PRIMARY KEY, question TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, question_id INTEGER, model TEXT, answer TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS comparisons (id INTEGER PRIMARY KEY, question_id INTEGER, model_evaluating TEXT, preferred_answer TEXT, model_bot_a TEXT, model_bot_b TEXT, score_a INTEGER, score_b INTEGER, explanation TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY, provider TEXT, model_id TEXT, params TEXT)''')
+    initialize_run_tables(c)
+    initialize_summary_tables(c)
+    conn.commit()
+    apply_migrations(conn)
+    return conn
+
+
+# Factory of databases with the current schema in the test directory: make_db(name) -> (path, connection)
+@pytest.fixture
+def make_db(tmp_path):
+    connections = []
+
+    def make(name="test.db"):
+        path = str(tmp_path / name)
+        conn = create_db(path)
+        connections.append(conn)
+        return path, conn
+
+    yield make
+    for conn in connections:
+        conn.close()
+
+
+# Mock of the OpenAI and Anthropic APIs (benchmarks/mock_llm_server.py)
+@pytest.fixture
+def mock():
+    from mock_llm_server import MockLLMServer
+    server = MockLLMServer(seed=1).start()
+    yield server
+    server.stop()
+
+
+# Runner of the main script against the mock, in a work directory with its own database
+# (test.db) and response cache: run_main(*args, **env) -> completed process
+@pytest.fixture
+def run_main(mock, tmp_path):
+    pytest.importorskip("openai")
+    pytest.importorskip("anthropic")
+    pytest.importorskip("datasets")
+    from run_benchmarks import MAIN_SCRIPT
+    work_dir = tmp_path / "run"
+    work_dir.mkdir()
+
+    def run(*args, **env):
+        run_env = dict(os.environ)
+        run_env.update({
+            "OPENAI_API_KEY": "mock-openai-key",
+            "ANTHROPIC_API_KEY": "mock-anthropic-key",
+            "OPENAI_BASE_URL": mock.openai_base_url,
+            "ANTHROPIC_BASE_URL": mock.anthropic_base_url,
+            "COMPARE_MODELS_DB": str(work_dir / "test.db"),
+            "RESPONSE_CACHE_MODE": "off",
+            "RESPONSE_CACHE_DIR": str(work_dir / "response_cache"),
+        })
+        run_env.update(env)
+        process = subprocess.run([sys.executable, MAIN_SCRIPT, *args], cwd=work_dir, env=run_env, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, text=True, timeout=300)
+        assert process.returncode == 0, process.stdout[-3000:]
+        return process
+
+    run.work_dir = work_dir
+    return run
+
+
+# Local dataset of num_questions word problems: dataset(num_questions) -> --dataset argument
+@pytest.fixture
+def dataset(tmp_path):
+    from run_benchmarks import write_dataset
+    return lambda num_questions: write_dataset(str(tmp_path / f"dataset-{num_questions}"), num_questions)
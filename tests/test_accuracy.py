@@ -0,0 +1,41 @@
+import pytest
+from accuracy import extract_final_number, score_answers
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Explicit markers and boxed values come first
+    ("The answer is 42.", 42),
+    ("Final answer: 1,200 dollars. So we had 3 left.", 1200),
+    ("So 3 + 4 = 7, and the answer is 8.", 8),
+    ("We add 2 and 3. \\boxed{5} So 5 - 1 = 4.", 5),
+    ("\\boxed{\\frac{3}{4}}", 0.75),
+    # After "so", "therefore" or "thus": the value after the last "=", else the last number of the sentence
+    ("So, the total is 3 + 4 = 7.", 7),
+    ("so 5 - 3 = 2", 2),
+    ("Therefore, 12 apples minus 5 eaten leaves 7 apples.", 7),
+    ("So it takes 2 hours and 30 minutes, i.e. 2.5 hours.", 2.5),
+    ("Thus the price is 12.50 per item. Each box holds 6 items.", 12.5),
+    # Without any marker: the last number of the text
+    ("She has 3 cats and 4 dogs, 7 pets in all", 7),
+    ("It is 3/4 of the cake", 0.75),
+    ("The rate went up by 10%", 10),
+    ("No number here", None),
+    (None, None),
+])
+def test_extract_final_number(text, expected):
+    value = extract_final_number(text)
+    if expected is None:
+        assert value is None
+    else:
+        assert value == pytest.approx(expected)
+
+
+def test_reference_solution():
+    solution = ("Jungkook has 6 red balls and 16 yellow balls. To find the total, we add them together: "
+                "6 + 16 = 22. Therefore, Jungkook has 22 balls in total.")
+    assert extract_final_number(solution) == 22
+
+
+def test_score_answers_tolerance_and_missing_values():
+    correct = score_answers([7.0, 2.5, float('nan'), 3.0], [7.00001, 2.5, 1.0, float('nan')])
+    assert correct.tolist() == [True, True, False, False]
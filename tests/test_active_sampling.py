@@ -0,0 +1,98 @@
+import random
+import re
+import sqlite3
+from active_sampling import ActiveJudgeSampler
+
+
+# Winner of a judgment drawn from Bradley-Terry strengths
+def simulated_winner(rng, strengths, model_bot_a, model_bot_b):
+    p = strengths[model_bot_a] / (strengths[model_bot_a] + strengths[model_bot_b])
+    return model_bot_a if rng.random() < p else model_bot_b
+
+
+def add_all_candidates(sampler, questions):
+    for question_id in range(questions):
+        for judge in sampler.judges:
+            for a in sampler.models:
+                for b in sampler.models:
+                    if a != b:
+                        sampler.add_candidate(question_id, judge, a, b)
+
+
+def test_ranking_settles_before_exhaustive_judging():
+    rng = random.Random(0)
+    strengths = {"strong": 9.0, "medium": 3.0, "weak": 1.0}
+    sampler = ActiveJudgeSampler(list(strengths), ["strong", "weak"])
+    add_all_candidates(sampler, 200)
+    exhaustive = 200 * 2 * 6
+    while sampler.has_candidates() and not sampler.is_settled():
+        for question_id, judge, model_bot_a, model_bot_b in sampler.next_judgments(8):
+            sampler.add_result(model_bot_a, model_bot_b, simulated_winner(rng, strengths, model_bot_a, model_bot_b))
+
+    assert sampler.is_settled()
+    assert sampler.judgments < exhaustive / 4
+    ratings = sampler.ratings()
+    assert list(ratings) == ["strong", "medium", "weak"]
+    assert all(interval > 0 for _, interval in ratings.values())
+
+
+def test_not_settled_before_the_minimum_judgments():
+    # 26 wins in a row already separate the confidence intervals
+    sampler = ActiveJudgeSampler(["A", "B"], ["A"], min_judgments=40)
+    for _ in range(39):
+        sampler.add_result("A", "B", "A")
+    assert not sampler.is_settled()
+    sampler.add_result("A", "B", "A")
+    assert sampler.is_settled()
+
+
+def test_judges_and_orders_are_balanced():
+    sampler = ActiveJudgeSampler(["A", "B"], ["A", "B"])
+    add_all_candidates(sampler, 10)
+    picks = sampler.next_judgments(8)
+    assert len(picks) == 8
+    # Each judge and presentation order twice, on questions not picked before
+    keys = [pick[1:] for pick in picks]
+    assert {key: keys.count(key) for key in keys} == {("A", "A", "B"): 2, ("A", "B", "A"): 2, ("B", "A", "B"): 2, ("B", "B", "A"): 2}
+    assert sorted(pick[0] for pick in picks) == [0, 0, 0, 0, 1, 1, 1, 1]
+
+
+def test_the_most_uncertain_pair_is_picked():
+    sampler = ActiveJudgeSampler(["A", "B", "C"], ["A"])
+    for _ in range(30):
+        sampler.add_result("A", "B", "A")
+        sampler.add_result("A", "B", "B")
+    add_all_candidates(sampler, 5)
+    # A and B are well estimated, C was never judged
+    assert all("C" in pick[2:] for pick in sampler.next_judgments(3))
+
+
+def test_no_picks_without_candidates():
+    sampler = ActiveJudgeSampler(["A", "B"], ["A"])
+    sampler.add_candidate(7, "A", "A", "B")
+    assert sampler.next_judgments(3) == [(7, "A", "A", "B")]
+    assert not sampler.has_candidates()
+    assert sampler.next_judgments(3) == []
+
+
+def test_stored_judgments_seed_the_estimates(make_db):
+    db_path, conn = make_db()
+    conn.executemany('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b)
+        VALUES (1, 'A', ?, ?, ?, 80, 70)''', [("A", "A", "B"), ("A", "B", "A"), ("B", "A", "B"), ("A", "A", "Other")])
+    conn.commit()
+    sampler = ActiveJudgeSampler(["A", "B"], ["A"])
+    # The judgment involving a model that is not compared is ignored
+    assert sampler.load_comparisons(db_path) == 3
+    assert sampler.wins == {("A", "B"): 2.0, ("B", "A"): 1.0}
+
+
+def test_active_sampling_run(mock, run_main, dataset):
+    result = run_main("--dataset", dataset(6), "--field", "question", "--num-questions", "6", "--active-sampling", "--active-batch-size", "4")
+    requested = int(re.search(r"Judgments: (\d+) requested \(0 already stored\), out of 24 for exhaustive judging", result.stdout).group(1))
+    assert 0 < requested <= 24
+    # The answers, then the picked judgments only
+    assert mock.stats()["requests"] == 12 + requested
+    conn = sqlite3.connect(str(run_main.work_dir / "test.db"))
+    assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 12
+    assert conn.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0] == requested
+    conn.close()
@@ -0,0 +1,61 @@
+import random
+from aggregates import model_averages, rebuild_summary_tables, score_preference_counts, totals
+
+
+# Summary rows, without the rows left empty by deleted comparisons
+def summaries(conn):
+    return (
+        sorted(row for row in conn.execute("SELECT * FROM comparison_summary") if any(row[3:])),
+        sorted(row for row in conn.execute("SELECT * FROM question_model_scores") if row[3]),
+    )
+
+
+def add_random_comparisons(conn, rng, count):
+    models = ["GPT-4", "Claude3", "Mistral"]
+    for _ in range(count):
+        judge = rng.choice(models)
+        model_bot_a, model_bot_b = rng.sample(models, 2)
+        if rng.random() < 0.1:
+            # Identical answers: a tie without scores
+            score_a = score_b = preferred_answer = None
+        else:
+            score_a, score_b = rng.randint(0, 100), rng.randint(0, 100)
+            preferred_answer = model_bot_a if score_a > score_b or (score_a == score_b and rng.random() < 0.5) else model_bot_b
+        conn.execute('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
+            VALUES (?, ?, ?, ?, ?, ?, ?, '')''', (rng.randint(1, 10), judge, preferred_answer, model_bot_a, model_bot_b, score_a, score_b))
+
+
+def test_triggers_match_the_group_by_summaries(make_db):
+    _, conn = make_db()
+    rng = random.Random(3)
+    add_random_comparisons(conn, rng, 300)
+    conn.execute("DELETE FROM comparisons WHERE id % 7 = 0")
+    add_random_comparisons(conn, rng, 100)
+    conn.commit()
+    maintained = summaries(conn)
+    assert sum(row[3] for row in maintained[0]) == conn.execute("SELECT COUNT(*) FROM comparisons WHERE score_a IS NOT NULL").fetchone()[0]
+    assert sum(row[11] for row in maintained[0]) == conn.execute("SELECT COUNT(*) FROM comparisons WHERE score_a IS NULL").fetchone()[0]
+
+    rebuild_summary_tables(conn.cursor())
+    assert summaries(conn) == maintained
+
+
+def test_chart_queries_match_the_comparisons(make_db):
+    _, conn = make_db()
+    rng = random.Random(5)
+    add_random_comparisons(conn, rng, 200)
+    conn.execute("DELETE FROM comparisons WHERE id % 5 = 0")
+    conn.commit()
+
+    scores = '''SELECT question_id, model_bot_a AS model, score_a AS score FROM comparisons WHERE score_a IS NOT NULL
+        UNION ALL SELECT question_id, model_bot_b, score_b FROM comparisons WHERE score_a IS NOT NULL'''
+    expected = dict(conn.execute(f"SELECT model, AVG(score) FROM ({scores}) GROUP BY model"))
+    assert model_averages(conn).keys() == expected.keys()
+    assert all(abs(model_averages(conn)[model] - expected[model]) < 1e-9 for model in expected)
+    assert totals(conn) == conn.execute("SELECT COUNT(DISTINCT question_id), COUNT(*) FROM comparisons WHERE score_a IS NOT NULL").fetchone()
+
+    counts = score_preference_counts(conn)
+    for model in expected:
+        assert counts[model] == conn.execute('''SELECT COUNT(*) FROM comparisons
+            WHERE (model_bot_a = ? AND score_a > score_b) OR (model_bot_b = ? AND score_b > score_a)''', (model, model)).fetchone()[0]
+    assert counts["Ties"] == conn.execute("SELECT COUNT(*) FROM comparisons WHERE score_a IS NULL OR score_a = score_b").fetchone()[0]
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import pytest
+from batch_mode import BatchRunner, OpenAIBatchProvider, AnthropicBatchProvider
+
+
+def batch_runner(mock, work_dir):
+    openai = pytest.importorskip("openai")
+    anthropic = pytest.importorskip("anthropic")
+    return BatchRunner({
+        "openai": OpenAIBatchProvider(openai.OpenAI(api_key="mock", base_url=mock.openai_base_url, max_retries=0)),
+        "anthropic": AnthropicBatchProvider(anthropic.Anthropic(api_key="mock", base_url=mock.anthropic_base_url, max_retries=0)),
+    }, work_dir=work_dir, poll_interval=0.01)
+
+
+def test_batch_runner_against_the_mock(mock, tmp_path):
+    mock.error_rate = 0.3
+    requests = [("openai", {"model": "gpt", "messages": [{"role": "user", "content": f"question {i}"}]}) for i in range(10)]
+    requests += [("anthropic", {"model": "claude", "max_tokens": 100, "messages": [{"role": "user", "content": f"question {i}"}]}) for i in range(10)]
+    texts = batch_runner(mock, str(tmp_path)).run_stage("answers", requests)
+    stats = mock.stats()
+    assert stats["requests_by_endpoint"] == {"openai_batch": 10, "anthropic_batch": 10}
+    # The failed requests of the batches have no text, the others keep their order
+    assert sum(text is None for text in texts) == stats["errors"] > 0
+    assert all(text is None or text.endswith(".") for text in texts)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_batch_mode_end_to_end(mock, run_main, dataset):
+    run_main("--dataset", dataset(3), "--field", "question", "--num-questions", "3", "--batch-mode", "--batch-poll-seconds", "0.1")
+
+    # Two models: 2 answers per question, then 2 judges x 2 orders of the pair
+    assert mock.stats()["requests_by_endpoint"] == {"openai_batch": 3 + 6, "anthropic_batch": 3 + 6}
+    conn = sqlite3.connect(str(run_main.work_dir / "test.db"))
+    assert conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0] == 3
+    assert conn.execute("SELECT model, COUNT(*) FROM answers GROUP BY model ORDER BY model").fetchall() == [("Claude3", 3), ("GPT-4", 3)]
+    assert conn.execute("SELECT COUNT(*) FROM comparisons WHERE score_a IS NOT NULL AND score_b IS NOT NULL").fetchone()[0] == 12
+    conn.close()
+    assert len(os.listdir(run_main.work_dir / "batch_jobs")) == 4
@@ -0,0 +1,43 @@
+import re
+import json
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+from dashboard import PAGE, DashboardHandler, LiveStats
+
+MODEL = '<img src=x onerror="alert(1)">'
+
+
+def test_page_never_parses_values_as_html():
+    script = PAGE.split("<script>")[1]
+    assert not re.search(r"innerHTML|outerHTML|insertAdjacentHTML|document\.write", script)
+
+
+def test_stats_are_served_as_json(make_db, tmp_path):
+    path, conn = make_db()
+    conn.execute("INSERT INTO questions (question, content_hash) VALUES ('q', 'h')")
+    conn.execute('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
+        VALUES (1, ?, ?, ?, 'Claude3', 80, 60, 'x')''', (MODEL, MODEL, MODEL))
+    conn.execute('''INSERT INTO token_usage (question_id, model, stage, input_tokens, output_tokens, seconds, cached, created_at, error)
+        VALUES (1, ?, 'judge', 10, 5, 1.0, 0, datetime('now'), '</script><script>alert(1)</script>')''', (MODEL,))
+    conn.commit()
+    stats = LiveStats(path)
+    stats.poll()
+
+    handler = type("Handler", (DashboardHandler,), {"live_stats": stats, "snapshot_dir": str(tmp_path)})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/") as response:
+            assert MODEL not in response.read().decode("utf-8")
+        with urllib.request.urlopen(base + "/stats.json") as response:
+            assert response.headers["Content-Type"] == "application/json"
+            snapshot = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+        stats.close()
+    assert [row["model"] for row in snapshot["calls"]] == [MODEL]
+    assert snapshot["calls"][0]["last_error"] == "</script><script>alert(1)</script>"
+    assert {row["model"] for row in snapshot["model_averages"]} == {MODEL, "Claude3"}
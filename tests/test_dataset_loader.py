@@ -0,0 +1,58 @@
+import json
+import os
+import pytest
+
+pytest.importorskip("datasets")
+from dataset_loader import dataset_exists, iter_dataset_examples, iter_dataset_questions, iter_dataset_rows
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    directory = tmp_path / "questions"
+    directory.mkdir()
+    with open(directory / "train.jsonl", "w", encoding="utf-8") as dataset_file:
+        for i in range(20):
+            dataset_file.write(json.dumps({"question": f"question {i}", "answer": i * i}) + "\n")
+    return str(directory)
+
+
+def questions(dataset_dir, **options):
+    return list(iter_dataset_questions(dataset_dir, "question", **options))
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_slice_of_the_rows(dataset_dir, streaming):
+    assert questions(dataset_dir, offset=3, limit=4, streaming=streaming) == [(i, f"question {i}") for i in range(3, 7)]
+    assert len(questions(dataset_dir, offset=15, streaming=streaming)) == 5
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_shards_split_the_rows(dataset_dir, streaming):
+    shards = [questions(dataset_dir, offset=2, limit=12, num_shards=3, shard_index=index, streaming=streaming) for index in range(3)]
+    assert [row_index for row_index, _ in shards[1]] == [4, 7, 10, 13]
+    assert sorted(row for shard in shards for row in shard) == questions(dataset_dir, offset=2, limit=12, streaming=streaming)
+    with pytest.raises(ValueError):
+        questions(dataset_dir, num_shards=3, shard_index=3)
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_shuffled_rows_are_reproducible(dataset_dir, streaming):
+    shuffled = questions(dataset_dir, limit=10, shuffle_seed=7, streaming=streaming)
+    assert shuffled == questions(dataset_dir, limit=10, shuffle_seed=7, streaming=streaming)
+    assert [row_index for row_index, _ in shuffled] == list(range(10))
+    assert [question for _, question in shuffled] != [f"question {i}" for i in range(10)]
+    assert len(set(question for _, question in shuffled)) == 10
+    # A later slice of the same shuffle continues it
+    following = questions(dataset_dir, offset=10, limit=10, shuffle_seed=7, streaming=streaming)
+    assert len({question for _, question in shuffled + following}) == 20
+
+
+def test_examples_with_reference_answers(dataset_dir):
+    assert list(iter_dataset_examples(dataset_dir, "question", "answer", limit=3)) == [(0, "question 0", "0"), (1, "question 1", "1"), (2, "question 2", "4")]
+    assert list(iter_dataset_examples(dataset_dir, "question", "solution", limit=1)) == [(0, "question 0", None)]
+
+
+def test_dataset_exists(dataset_dir, tmp_path):
+    assert dataset_exists(dataset_dir)
+    assert not dataset_exists("")
+    assert not dataset_exists(os.path.join(str(tmp_path), "missing"))
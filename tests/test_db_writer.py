@@ -0,0 +1,76 @@
+import sqlite3
+import pytest
+from db_writer import DatabaseWriter, DatabaseWriteError
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE questions (id INTEGER PRIMARY KEY, question TEXT UNIQUE)")
+    conn.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY, question_id INTEGER, answer TEXT)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    result = conn.execute(sql).fetchall()
+    conn.close()
+    return result
+
+
+def test_failed_batch_is_retried_row_by_row(db_path):
+    writer = DatabaseWriter(db_path, batch_size=100, flush_interval=10)
+    writer.write("INSERT INTO questions (question) VALUES (?)", ("a",))
+    writer.write("INSERT INTO questions (question) VALUES (?)", ("a",))  # duplicate: fails the batch
+    writer.write("INSERT INTO answers (question_id, answer) VALUES (?, ?)", (1, "x"))
+    with pytest.raises(DatabaseWriteError) as error:
+        writer.flush()
+    assert len(error.value.failures) == 1
+    assert rows(db_path, "SELECT question FROM questions") == [("a",)]
+    assert rows(db_path, "SELECT answer FROM answers") == [("x",)]
+    # The failures are raised once
+    writer.flush()
+    writer.close()
+
+
+def test_close_raises_the_failures(db_path):
+    writer = DatabaseWriter(db_path)
+    writer.write("INSERT INTO missing_table (x) VALUES (?)", (1,))
+    with pytest.raises(DatabaseWriteError):
+        writer.close()
+
+
+def test_insert_returns_ids_unique_across_writers(db_path):
+    first = DatabaseWriter(db_path)
+    second = DatabaseWriter(db_path)
+    ids = [first.insert("INSERT INTO questions (question) VALUES (?)", ("q1",)),
+           second.insert("INSERT INTO questions (question) VALUES (?)", ("q2",)),
+           first.insert("INSERT INTO questions (question) VALUES (?)", ("q3",))]
+    assert len(set(ids)) == 3
+    with pytest.raises(sqlite3.IntegrityError):
+        second.insert("INSERT INTO questions (question) VALUES (?)", ("q1",))
+    first.close()
+    second.close()
+    assert sorted(rows(db_path, "SELECT id FROM questions")) == [(row_id,) for row_id in sorted(ids)]
+
+
+def test_insert_writes_the_rows_queued_before_it(db_path):
+    writer = DatabaseWriter(db_path, batch_size=100, flush_interval=10)
+    writer.write("INSERT INTO answers (question_id, answer) VALUES (?, ?)", (1, "before"))
+    writer.insert("INSERT INTO questions (question) VALUES (?)", ("q",))
+    assert rows(db_path, "SELECT answer FROM answers") == [("before",)]
+    writer.close()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_flush_fails_fast_when_the_writer_is_dead(db_path):
+    writer = DatabaseWriter(db_path)
+    writer._queue.put((None, None))  # not a statement: the writer thread dies on it
+    writer._thread.join(5)
+    with pytest.raises(DatabaseWriteError):
+        writer.flush()
+    with pytest.raises(DatabaseWriteError):
+        writer.write("INSERT INTO answers (answer) VALUES (?)", ("x",))
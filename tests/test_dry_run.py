@@ -0,0 +1,49 @@
+import hashlib
+import sqlite3
+
+
+def estimated_calls(output):
+    calls = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 6 and fields[1] in ("answer", "judge"):
+            calls[(fields[0], fields[1])] = int(fields[2])
+        elif fields[:1] == ["total"]:
+            calls["total"] = int(fields[1])
+    return calls
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_dry_run_of_a_new_database_creates_nothing(mock, run_main, dataset):
+    result = run_main("--dataset", dataset(3), "--field", "question", "--num-questions", "3", "--dry-run")
+    assert mock.stats()["requests"] == 0
+    assert not (run_main.work_dir / "test.db").exists()
+    # 2 answers per question, then 2 judges x 2 orders of the pair
+    assert estimated_calls(result.stdout) == {("GPT-4", "answer"): 3, ("Claude3", "answer"): 3, ("GPT-4", "judge"): 6, ("Claude3", "judge"): 6, "total": 18}
+
+
+def test_dry_run_counts_only_the_calls_left(mock, run_main, dataset):
+    questions = dataset(3)
+    run_main("--dataset", questions, "--field", "question", "--num-questions", "3")
+    db_path = str(run_main.work_dir / "test.db")
+    requests = mock.stats()["requests"]
+
+    before = file_hash(db_path)
+    result = run_main("--dataset", questions, "--field", "question", "--num-questions", "3", "--dry-run")
+    assert estimated_calls(result.stdout) == {"total": 0}
+    assert file_hash(db_path) == before
+
+    # A judgment lost: only its call is estimated
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM comparisons WHERE id = (SELECT MAX(id) FROM comparisons WHERE model_evaluating = 'Claude3')")
+    conn.commit()
+    conn.close()
+    before = file_hash(db_path)
+    result = run_main("--dataset", questions, "--field", "question", "--num-questions", "3", "--dry-run")
+    assert estimated_calls(result.stdout) == {("Claude3", "judge"): 1, "total": 1}
+    assert file_hash(db_path) == before
+    assert mock.stats()["requests"] == requests
@@ -0,0 +1,113 @@
+import csv
+import gzip
+import json
+import os
+from export_results import STATE_FILE, TableExporter, export_results, load_export_state
+from migrations import question_hash
+
+
+# Questions with the answers of GPT-4, Claude3 and Mistral, judged by GPT-4 and Claude3 on every
+# ordered pair, each question recorded in a run of the given dataset
+def add_questions(conn, count, dataset="ds"):
+    run_id = conn.execute("INSERT INTO runs (dataset, question_field, num_questions, created_at) VALUES (?, 'question', ?, '2026-01-01')",
+                          (dataset, count)).lastrowid
+    models = ("GPT-4", "Claude3", "Mistral")
+    for row_index in range(count):
+        question = f"{dataset} question {row_index}"
+        question_id = conn.execute("INSERT INTO questions (question, content_hash) VALUES (?, ?)", (question, question_hash(question))).lastrowid
+        conn.execute("INSERT INTO run_questions (run_id, row_index, question_id) VALUES (?, ?, ?)", (run_id, row_index, question_id))
+        for model in models:
+            conn.execute("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", (question_id, model, json.dumps(f"{model} answer")))
+        for judge in ("GPT-4", "Claude3"):
+            for bot_a in models:
+                for bot_b in models:
+                    if bot_a != bot_b:
+                        conn.execute('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
+                            VALUES (?, ?, ?, ?, ?, 80, 70, 'A is better')''', (question_id, judge, bot_a, bot_a, bot_b))
+    conn.commit()
+    return run_id
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_rows_are_streamed_in_chunks(make_db, tmp_path):
+    db_path, conn = make_db()
+    add_questions(conn, 5)
+    fetched = []
+    exporter = TableExporter(db_path, str(tmp_path / "chunked"), chunk_size=2)
+    chunks = exporter._chunks
+    exporter._chunks = lambda cursor: (fetched.append(len(chunk)) or chunk for chunk in chunks(cursor))
+
+    results = exporter.export_tables(["questions", "answers"], workers=2)
+    assert results["questions"][:2] == (5, 5)
+    assert results["answers"][:2] == (15, 15)
+    assert max(fetched) == 2 and sum(fetched) == 20
+    # Same files as a single chunk
+    whole = TableExporter(db_path, str(tmp_path / "whole"), chunk_size=1000).export_tables(["questions", "answers"])
+    for table in ("questions", "answers"):
+        assert read_csv(results[table][2]) == read_csv(whole[table][2])
+    assert read_csv(results["questions"][2])[:2] == [["id", "question", "content_hash", "reference_answer"], ["1", "ds question 0", question_hash("ds question 0"), ""]]
+
+
+def test_jsonl_export_is_gzip_compressed(make_db, tmp_path):
+    db_path, conn = make_db()
+    add_questions(conn, 2)
+    results = export_results(db_path, ["answers"], str(tmp_path), fmt="jsonl", chunk_size=4, compression="gzip")
+    rows, max_id, path = results["answers"]
+    assert path.endswith("answers.jsonl.gz")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        exported = [json.loads(line) for line in f]
+    assert (rows, max_id, len(exported)) == (6, 6, 6)
+    assert exported[0] == {"id": 1, "question_id": 1, "model": "GPT-4", "answer": '"GPT-4 answer"'}
+
+
+def test_incremental_export_writes_only_the_new_rows(make_db, tmp_path):
+    db_path, conn = make_db()
+    add_questions(conn, 2)
+    output_dir = str(tmp_path / "exports")
+    results = export_results(db_path, ["questions", "answers"], output_dir, incremental=True)
+    assert {table: result[:2] for table, result in results.items()} == {"questions": (2, 2), "answers": (6, 6)}
+    assert load_export_state(output_dir) == {"questions": 2, "answers": 6}
+
+    add_questions(conn, 1, dataset="other")
+    results = export_results(db_path, ["questions", "answers"], output_dir, incremental=True)
+    assert results["questions"][0] == 1
+    assert os.path.basename(results["questions"][2]) == "questions.since-2.csv"
+    assert [row[0] for row in read_csv(results["answers"][2])[1:]] == ["7", "8", "9"]
+    assert load_export_state(output_dir) == {"questions": 3, "answers": 9}
+
+    # Nothing new: empty files, the state is kept
+    results = export_results(db_path, ["questions", "answers"], output_dir, incremental=True)
+    assert (results["questions"][0], results["answers"][0]) == (0, 0)
+    with open(os.path.join(output_dir, STATE_FILE), encoding="utf-8") as f:
+        assert json.load(f) == {"questions": 3, "answers": 9}
+
+
+def test_filters(make_db, tmp_path):
+    db_path, conn = make_db()
+    add_questions(conn, 2, dataset="ds")
+    second_run = add_questions(conn, 1, dataset="other")
+
+    def export(table, **filters):
+        output_dir = str(tmp_path / str(len(os.listdir(tmp_path))))
+        path = export_results(db_path, [table], output_dir, filters=filters)[table][2]
+        return read_csv(path)[1:]
+
+    assert [row[0] for row in export("questions", since_id=1)] == ["2", "3"]
+    assert [row[1] for row in export("questions", dataset="other")] == ["other question 0"]
+    assert {row[1] for row in export("answers", since_run=second_run)} == {"3"}
+    assert [row[1] for row in export("runs", dataset="ds")] == ["ds"]
+
+    # Only the answers of the listed models and the judgments by and of them
+    assert {row[2] for row in export("answers", models=["GPT-4", "Claude3"])} == {"GPT-4", "Claude3"}
+    judgments = export("comparisons", models=["GPT-4", "Claude3"])
+    assert len(judgments) == 3 * 2 * 2
+    assert all({row[2], row[4], row[5]} <= {"GPT-4", "Claude3"} for row in judgments)
+    assert len(export("comparisons", models=["GPT-4", "Mistral"], dataset="ds")) == 2 * 2
+    assert len(export("comparison_gpt4_claude3", models=["GPT-4", "Claude3"])) == 3 * 2 * 2
+    conn.executemany("INSERT INTO models (name, provider, model_id, params) VALUES (?, ?, ?, '{}')", [("GPT-4", "openai", "gpt-4"), ("Mistral", "openai", "mistral")])
+    conn.commit()
+    assert [row[0] for row in export("models", models=["GPT-4", "Claude3"])] == ["GPT-4"]
@@ -0,0 +1,64 @@
+import re
+import shutil
+import sqlite3
+from judgment_dedup import JudgmentIndex, answers_identical, is_failed_answer, judgment_key
+from judgment_parser import Judgment
+
+
+def test_judgment_key():
+    key = judgment_key("What is 2+2?", "It is 4", "Four", "GPT-4")
+    assert judgment_key(" What is  2+2?\n", "It is\t4", "Four ", "GPT-4") == key
+    # Both presentation orders and every judge are judged
+    assert judgment_key("What is 2+2?", "Four", "It is 4", "GPT-4") != key
+    assert judgment_key("What is 2+2?", "It is 4", "Four", "Claude3") != key
+    assert judgment_key("What is 3+1?", "It is 4", "Four", "GPT-4") != key
+
+
+def test_identical_and_failed_answers():
+    assert answers_identical("Café  au lait", "Café au lait\n")
+    assert not answers_identical("4", "four")
+    assert is_failed_answer(None) and is_failed_answer("  ")
+    assert not is_failed_answer(0)
+
+
+def test_index_finds_the_stored_judgments(make_db):
+    _, conn = make_db()
+    key = judgment_key("q", "a", "b", "GPT-4")
+    tie_key = judgment_key("q", "a", "a", "GPT-4")
+    conn.executemany('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation, judgment_key)
+        VALUES (1, 'GPT-4', ?, 'GPT-4', 'Claude3', ?, ?, ?, ?)''', [
+        ("Claude3", None, None, "failed", key),
+        ("Claude3", 60, 90, "B is right", key),
+        (None, None, None, "identical", tie_key),
+    ])
+    conn.commit()
+    index = JudgmentIndex(conn)
+    question_id, judgment = index.find(key)
+    assert (question_id, judgment.score_a, judgment.score_b, judgment.better_answer, judgment.explanation) == (1, 60, 90, "B", "B is right")
+    # The tie has no scores: it is not a judgment to reuse
+    assert index.find(tie_key) is None
+    assert index.has_tie(tie_key, 1) and not index.has_tie(tie_key, 2)
+
+    other = judgment_key("q", "b", "a", "GPT-4")
+    assert index.find(other) is None
+    index.add(other, 2, Judgment("A is right", 80, 70, "A"))
+    assert index.find(other)[0] == 2
+
+
+def test_stored_judgments_are_not_requested_again(mock, run_main, dataset, tmp_path):
+    questions = dataset(3)
+    run_main("--dataset", questions, "--field", "question", "--num-questions", "3")
+    assert mock.stats()["requests"] == 3 * (2 + 4)
+
+    # Another dataset with the same questions: a new run reusing the stored answers and judgments
+    copy = str(tmp_path / "same-questions")
+    shutil.copytree(questions, copy)
+    mock.reset_counters()
+    result = run_main("--dataset", copy, "--field", "question", "--num-questions", "3")
+    assert mock.stats()["requests"] == 0
+    assert re.search(r"Judge calls saved: \d+ identical-answer ties, 12 reused judgments", result.stdout)
+    conn = sqlite3.connect(str(run_main.work_dir / "test.db"))
+    assert conn.execute("SELECT COUNT(*), COUNT(DISTINCT judgment_key) FROM comparisons").fetchone() == (12, 12)
+    # Both runs are complete
+    assert conn.execute("SELECT run_id, COUNT(*) FROM run_stages GROUP BY run_id").fetchall() == [(1, 18), (2, 18)]
+    conn.close()
@@ -0,0 +1,121 @@
+import json
+import time
+import pytest
+from judgment_parser import JudgmentParseError, find_json_object, parse_judgment, validate_judgment
+
+
+def judgment(**fields):
+    data = {"explanation": "Both are correct.", "score_a": 80, "score_b": 60, "better_answer": "A"}
+    data.update(fields)
+    return data
+
+
+@pytest.mark.parametrize("response", [
+    json.dumps(judgment()),
+    "Here is my evaluation:\n" + json.dumps(judgment()) + "\nLet me know if you need more details.",
+    "```json\n" + json.dumps(judgment(), indent=2) + "\n```",
+    "Considering {the context} of the question: " + json.dumps(judgment()),
+    json.dumps({"note": "x"}) + " then " + json.dumps(judgment()),
+])
+def test_prose_wrapped_json(response):
+    result = parse_judgment(response)
+    assert (result.score_a, result.score_b, result.better_answer) == (80, 60, "A")
+
+
+def test_braces_inside_strings():
+    data = judgment(explanation='The set {1, 2} is written "{x | x > 0}" and } closes nothing')
+    result = parse_judgment("Verdict: " + json.dumps(data) + " {trailing}")
+    assert result.explanation == data["explanation"]
+
+
+def test_nested_objects_are_kept_whole():
+    value = find_json_object('prefix {"outer": {"inner": "}"}, "score_a": 1} suffix', required_keys=("score_a",))
+    assert value == {"outer": {"inner": "}"}, "score_a": 1}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (r'\frac{1}{2}', '\\frac{1}{2}'),
+    (r'\boxed{7}', '\\boxed{7}'),
+    (r'\sqrt{2}', '\\sqrt{2}'),
+    (r'a\bcd and \f(x)', 'a\\bcd and \f(x)'),
+    (r'\(x\)', '\\(x\\)'),
+    (r'\\frac{1}{2}', '\\frac{1}{2}'),
+    (r'line one\nline two', 'line one\nline two'),
+    (r'3 \times 4 \neq 11', '3 \\times 4 \\neq 11'),
+    (r'\theta \to \nu', '\\theta \\to \\nu'),
+    (r'\left( x \right)', '\\left( x \\right)'),
+    (r'\text{km}\nThe end\tnow', '\\text{km}\nThe end\tnow'),
+])
+def test_latex_backslashes(raw, expected):
+    response = '{"explanation": "The answer is ' + raw + '.", "score_a": 90, "score_b": 70, "better_answer": "A"}'
+    assert parse_judgment(response).explanation == "The answer is " + expected + "."
+
+
+def test_latex_group_outside_the_json():
+    response = r"We get \frac{3}{4} so " + json.dumps(judgment())
+    assert parse_judgment(response).score_a == 80
+
+
+def test_object_nested_in_a_latex_group():
+    response = r"\boxed{ x^{2} " + json.dumps(judgment()) + " }"
+    assert parse_judgment(response).score_a == 80
+
+
+def test_failed_groups_are_not_scanned_again():
+    started = time.perf_counter()
+    value = find_json_object("{" * 5000 + "}" * 5000 + " {x} " * 5000 + json.dumps(judgment()), required_keys=("score_a",))
+    assert value["score_a"] == 80
+    # Rescanning from each failed opening brace takes seconds
+    assert time.perf_counter() - started < 1
+
+
+def test_raw_newlines_inside_strings():
+    response = '{"explanation": "first line\nsecond line", "score_a": 50, "score_b": 40, "better_answer": "A"}'
+    assert parse_judgment(response).explanation == "first line\nsecond line"
+
+
+@pytest.mark.parametrize("value, expected", [("85", 85), ("85/100", 85), (" 72.6 ", 73), (64.4, 64), ("score: 0", 0)])
+def test_string_scores(value, expected):
+    assert parse_judgment(judgment(score_a=value, score_b=50)).score_a == expected
+
+
+@pytest.mark.parametrize("value", ["high", "", None, True, 101, -1, "150"])
+def test_invalid_scores(value):
+    with pytest.raises(JudgmentParseError):
+        validate_judgment(judgment(score_a=value))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("B", "B"), ("b", "B"), ("**A**", "A"), ('"B"', "B"), ("Answer B", "B"), ("answer: A", "A"), ("A. It is clearer.", "A"),
+])
+def test_better_answer_values(value, expected):
+    assert validate_judgment(judgment(better_answer=value, score_a=70, score_b=70)).better_answer == expected
+
+
+@pytest.mark.parametrize("value", ["Both", "Tie", "Neither", "C", "", None, "Answers are equal"])
+def test_invalid_better_answer_falls_back_to_the_scores(value):
+    assert validate_judgment(judgment(better_answer=value, score_a=60, score_b=75)).better_answer == "B"
+    assert validate_judgment(judgment(better_answer=value, score_a=75, score_b=60)).better_answer == "A"
+
+
+@pytest.mark.parametrize("value", ["Both", "Tie", "", None])
+def test_invalid_better_answer_with_tied_scores(value):
+    data = judgment(better_answer=value, score_a=70, score_b=70)
+    if value is None:
+        del data["better_answer"]
+    with pytest.raises(JudgmentParseError):
+        validate_judgment(data)
+
+
+def test_missing_scores_and_no_json():
+    with pytest.raises(JudgmentParseError):
+        parse_judgment('{"explanation": "no scores", "better_answer": "A"}')
+    with pytest.raises(JudgmentParseError):
+        parse_judgment("I prefer answer A.")
+    with pytest.raises(JudgmentParseError):
+        parse_judgment(None)
+
+
+def test_tool_input():
+    result = parse_judgment({"explanation": None, "score_a": 10, "score_b": 90, "better_answer": "B"})
+    assert (result.explanation, result.better_answer) == ("", "B")
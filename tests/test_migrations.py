@@ -0,0 +1,146 @@
+import sqlite3
+import pytest
+import migrations
+from migrations import MIGRATIONS, SCHEMA_VERSION, apply_migrations, question_hash, schema_version
+from run_tracking import initialize_run_tables
+from aggregates import initialize_summary_tables
+
+
+# Database created by the original version of the project (no user_version, the wide
+# comparison_gpt4_claude3 table), with a duplicated question
+def baseline_db(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE questions (id INTEGER PRIMARY KEY, question TEXT)''')
+    c.execute('''CREATE TABLE answers (id INTEGER PRIMARY KEY, question_id INTEGER, model TEXT, answer TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE comparisons (id INTEGER PRIMARY KEY, question_id INTEGER, model_evaluating TEXT, preferred_answer TEXT, model_bot_a TEXT, model_bot_b TEXT, score_a INTEGER, score_b INTEGER, explanation TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.execute('''CREATE TABLE comparison_gpt4_claude3 (id INTEGER PRIMARY KEY, question_id INTEGER, model_evaluating TEXT, preferred_answer TEXT, model_bot_a TEXT, model_bot_b TEXT, score_GPT4 INTEGER, score_Claude3 INTEGER, explanation TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+    c.executemany("INSERT INTO questions (id, question) VALUES (?, ?)", [(1, "What is 2+2?"), (2, "Write a haiku."), (3, "What is 2+2?")])
+    c.executemany("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", [
+        (1, "GPT-4", "4"), (1, "Claude3", "Four"), (2, "GPT-4", "Leaves fall"), (2, "Claude3", "Snow melts"), (3, "GPT-4", "2+2=4"),
+    ])
+    comparisons = [
+        (1, "GPT-4", "Claude3", "GPT-4", "Claude3", 80, 90, "B is clearer"),
+        (1, "Claude3", "GPT-4", "GPT-4", "Claude3", 85, 70, "A is shorter"),
+        (2, "GPT-4", "GPT-4", "Claude3", "GPT-4", 60, 75, "B rhymes"),
+    ]
+    c.executemany("INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", comparisons)
+    # The wide copy of the first two judgments, plus one judgment only stored there
+    c.executemany("INSERT INTO comparison_gpt4_claude3 (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_GPT4, score_Claude3, explanation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        (1, "GPT-4", "Claude3", "GPT-4", "Claude3", 80, 90, "B is clearer"),
+        (1, "Claude3", "GPT-4", "GPT-4", "Claude3", 85, 70, "A is shorter"),
+        (2, "Claude3", "Claude3", "Claude3", "GPT-4", 65, 95, "A is vivid"),
+    ])
+    conn.commit()
+    return conn
+
+
+# What initialize_db does: the tables of the original schema, then the migrations
+def initialize(conn):
+    c = conn.cursor()
+    initialize_run_tables(c)
+    initialize_summary_tables(c)
+    conn.commit()
+    return apply_migrations(conn)
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def dump(conn):
+    tables = ("questions", "answers", "comparisons", "comparison_summary", "question_model_scores", "token_usage")
+    return {table: conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall() for table in tables}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = baseline_db(str(tmp_path / "baseline.db"))
+    yield conn
+    conn.close()
+
+
+def test_baseline_database_is_migrated(conn):
+    assert schema_version(conn) == 0
+    assert initialize(conn) == [version for version, _, _ in MIGRATIONS]
+    assert schema_version(conn) == SCHEMA_VERSION
+
+    assert {"content_hash", "reference_answer"} <= columns(conn, "questions")
+    assert "judgment_key" in columns(conn, "comparisons")
+    assert "identical_ties" in columns(conn, "comparison_summary")
+    assert "error" in columns(conn, "token_usage")
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'comparison_gpt4_claude3'").fetchone() == ("view",)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_answers_question_model", "idx_questions_content_hash", "idx_comparisons_judgment_key"} <= indexes
+
+
+def test_existing_rows_are_preserved(conn):
+    initialize(conn)
+    # The duplicated question is merged into the first one, keeping the answers of the first one
+    assert conn.execute("SELECT id, question, content_hash FROM questions ORDER BY id").fetchall() == [
+        (1, "What is 2+2?", question_hash("What is 2+2?")), (2, "Write a haiku.", question_hash("Write a haiku.")),
+    ]
+    assert conn.execute("SELECT question_id, model, answer FROM answers ORDER BY question_id, model").fetchall() == [
+        (1, "Claude3", "Four"), (1, "GPT-4", "4"), (2, "Claude3", "Snow melts"), (2, "GPT-4", "Leaves fall"),
+    ]
+    # The judgment only stored in the wide table is copied to comparisons, the others are not duplicated
+    assert conn.execute("SELECT question_id, model_evaluating, model_bot_a, score_a, score_b, explanation FROM comparisons ORDER BY id").fetchall() == [
+        (1, "GPT-4", "GPT-4", 80, 90, "B is clearer"),
+        (1, "Claude3", "GPT-4", 85, 70, "A is shorter"),
+        (2, "GPT-4", "Claude3", 60, 75, "B rhymes"),
+        (2, "Claude3", "Claude3", 95, 65, "A is vivid"),
+    ]
+    assert conn.execute("SELECT model_evaluating, score_GPT4, score_Claude3 FROM comparison_gpt4_claude3 ORDER BY id").fetchall() == [
+        ("GPT-4", 80, 90), ("Claude3", 85, 70), ("GPT-4", 75, 60), ("Claude3", 65, 95),
+    ]
+    assert conn.execute("SELECT SUM(judgments), SUM(score_a_total), SUM(score_b_total) FROM comparison_summary").fetchone() == (4, 320, 300)
+    assert conn.execute("SELECT model, score_total, judgments FROM question_model_scores WHERE question_id = 2 ORDER BY model").fetchall() == [
+        ("Claude3", 155, 2), ("GPT-4", 140, 2),
+    ]
+
+
+def test_merged_questions_keep_the_judged_answers(conn):
+    # The answer of the first question stored after the answer of the duplicate (e.g. fetched again by a resumed run)
+    conn.execute("DELETE FROM answers WHERE question_id = 1 AND model = 'GPT-4'")
+    conn.executemany("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", [(1, "GPT-4", "It is 4"), (3, "Mistral", "four")])
+    conn.commit()
+    initialize(conn)
+    assert conn.execute("SELECT model, answer FROM answers WHERE question_id = 1 ORDER BY model").fetchall() == [
+        ("Claude3", "Four"), ("GPT-4", "It is 4"), ("Mistral", "four"),
+    ]
+
+
+def test_migrating_again_changes_nothing(conn):
+    initialize(conn)
+    before = dump(conn)
+    assert initialize(conn) == []
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert dump(conn) == before
+
+
+def test_partially_migrated_database(conn, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:5])
+    assert initialize(conn) == [1, 2, 3, 4, 5]
+    assert "error" not in columns(conn, "token_usage")
+    conn.execute("INSERT INTO token_usage (question_id, model, stage, input_tokens, output_tokens) VALUES (1, 'GPT-4', 'answer', 12, 3)")
+    conn.commit()
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+    assert initialize(conn) == [6, 7]
+    assert conn.execute("SELECT model, input_tokens, error FROM token_usage").fetchall() == [("GPT-4", 12, None)]
+    assert conn.execute("SELECT COUNT(*), COUNT(judgment_key) FROM comparisons").fetchone() == (4, 0)
+
+
+def test_failed_migration_is_rolled_back(conn, monkeypatch):
+    initialize(conn)
+    before = dump(conn)
+
+    def failing(c):
+        c.execute("DELETE FROM answers")
+        raise sqlite3.OperationalError("migration failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [(SCHEMA_VERSION + 1, "failing", failing)])
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations(conn)
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert dump(conn) == before
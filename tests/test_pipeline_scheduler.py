@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from pipeline_scheduler import AsyncPipelineScheduler, PipelineScheduler
+
+
+# Fake API calls recording the calls in flight, overall and by provider (the task 'type')
+class Calls:
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.order = []
+
+    def _enter(self, task):
+        with self.lock:
+            self.order.append((task["stage"], task["question"]))
+            for key in (None, task["type"]):
+                self.in_flight[key] = self.in_flight.get(key, 0) + 1
+                self.max_in_flight[key] = max(self.max_in_flight.get(key, 0), self.in_flight[key])
+
+    def _leave(self, task):
+        with self.lock:
+            for key in (None, task["type"]):
+                self.in_flight[key] -= 1
+
+    def fetch(self, task):
+        self._enter(task)
+        time.sleep(self.seconds)
+        self._leave(task)
+        return f"{task['stage']} {task['type']} {task['question']}"
+
+    async def fetch_async(self, task):
+        self._enter(task)
+        await asyncio.sleep(self.seconds)
+        self._leave(task)
+        return f"{task['stage']} {task['type']} {task['question']}"
+
+
+# Two answers per question, then two comparisons judged by each model
+def answer_tasks(question):
+    return [{"stage": "answer", "type": model, "question": question} for model in ("openai", "anthropic")]
+
+
+class Recorder:
+    def __init__(self):
+        self.answers = {}
+        self.comparisons = {}
+        self.threads = set()
+
+    def on_answers(self, question, tasks, answers):
+        self.threads.add(threading.get_ident())
+        self.answers[question] = answers
+        return [{"stage": "judge", "type": judge, "question": question} for judge in ("openai", "anthropic")]
+
+    def on_comparisons(self, question, tasks, results):
+        self.threads.add(threading.get_ident())
+        self.comparisons[question] = results
+
+
+def test_every_question_is_answered_then_judged():
+    calls, recorder = Calls(), Recorder()
+    scheduler = PipelineScheduler(calls.fetch, calls.fetch, max_workers=4, provider_limits={"anthropic": 1}, report_every=0)
+    assert scheduler.run(range(10), answer_tasks, recorder.on_answers, recorder.on_comparisons) == 10
+
+    assert recorder.answers == {question: [f"answer openai {question}", f"answer anthropic {question}"] for question in range(10)}
+    assert recorder.comparisons == {question: [f"judge openai {question}", f"judge anthropic {question}"] for question in range(10)}
+    assert scheduler.calls_completed == 40
+    # The callbacks run on the thread calling run()
+    assert recorder.threads == {threading.get_ident()}
+    assert calls.max_in_flight[None] <= 4
+    assert calls.max_in_flight["anthropic"] == 1
+    assert calls.max_in_flight["openai"] > 1
+
+
+def test_questions_are_pipelined():
+    calls, recorder = Calls(), Recorder()
+    scheduler = PipelineScheduler(calls.fetch, calls.fetch, max_workers=2, max_pending_questions=3, report_every=0)
+    scheduler.run(range(6), answer_tasks, recorder.on_answers, recorder.on_comparisons)
+    first_judgment = calls.order.index(("judge", 0))
+    # The next questions are answered before the first one is judged, but no more than the pending limit allows
+    assert {question for stage, question in calls.order[:first_judgment] if stage == "answer"} <= {0, 1, 2}
+    assert calls.order.index(("answer", 3)) > first_judgment
+    # The judgments of the questions in flight go before the answers of new questions
+    assert calls.order.index(("judge", 0)) < calls.order.index(("answer", 5))
+
+
+def test_questions_without_calls_are_completed():
+    calls, recorder = Calls(), Recorder()
+    scheduler = PipelineScheduler(calls.fetch, calls.fetch, report_every=0)
+    # Stored answers (no answer task) and nothing left to judge
+    assert scheduler.run(range(3), lambda question: [], lambda question, tasks, answers: [], recorder.on_comparisons) == 3
+    assert recorder.comparisons == {0: [], 1: [], 2: []}
+    assert calls.order == []
+
+
+def test_async_scheduler_limits_the_calls_in_flight():
+    calls, recorder = Calls(), Recorder()
+    scheduler = AsyncPipelineScheduler(calls.fetch_async, calls.fetch_async, max_workers=6, provider_limits={"anthropic": 2},
+                                       max_pending_questions=5, report_every=0)
+    assert asyncio.run(scheduler.run(range(20), answer_tasks, recorder.on_answers, recorder.on_comparisons)) == 20
+
+    assert recorder.answers == {question: [f"answer openai {question}", f"answer anthropic {question}"] for question in range(20)}
+    assert recorder.comparisons == {question: [f"judge openai {question}", f"judge anthropic {question}"] for question in range(20)}
+    assert scheduler.calls_completed == 80
+    assert recorder.threads == {threading.get_ident()}
+    assert calls.max_in_flight[None] <= 6
+    assert calls.max_in_flight["anthropic"] == 2
+    # No more than max_pending_questions questions are started before the first one is done
+    assert calls.order.index(("answer", 5)) > calls.order.index(("judge", 0))
+
+
+def test_async_scheduler_runs_the_calls_concurrently():
+    calls, recorder = Calls(seconds=0.2), Recorder()
+    scheduler = AsyncPipelineScheduler(calls.fetch_async, calls.fetch_async, max_workers=100, report_every=0)
+    started = time.perf_counter()
+    asyncio.run(scheduler.run(range(25), answer_tasks, recorder.on_answers, recorder.on_comparisons))
+    # 100 calls of 0.2 s in two rounds (answers, then judgments), not one after the other
+    assert time.perf_counter() - started < 2
+    assert calls.max_in_flight[None] == 50
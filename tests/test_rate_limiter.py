@@ -0,0 +1,138 @@
+import time
+import asyncio
+import pytest
+from rate_limiter import ProviderLimiter, TokenBucket
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def failing(error):
+    def call():
+        raise error
+    return call
+
+
+def limiter(**options):
+    options = {"max_retries": 0, "base_delay": 0, "failure_threshold": 2, "reset_timeout": 60, **options}
+    return ProviderLimiter("test", **options)
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 404, 422])
+def test_rejected_requests_do_not_open_the_breaker(status_code):
+    provider = limiter()
+    for _ in range(5):
+        with pytest.raises(APIError):
+            provider.call(failing(APIError(status_code)))
+    assert provider.breaker.opened_at is None
+    assert provider.failures == 5
+    assert provider.call(lambda: "ok") == "ok"
+
+
+@pytest.mark.parametrize("error", [APIError(500), APIError(503), TimeoutError(), ConnectionError()])
+def test_unavailable_provider_opens_the_breaker(error):
+    provider = limiter()
+    for _ in range(2):
+        with pytest.raises(type(error)):
+            provider.call(failing(error))
+    assert provider.breaker.opened_at is not None
+
+
+@pytest.mark.parametrize("error", [APIError(429), APIError(503, {"retry-after": "1"})])
+def test_rate_limits_do_not_open_the_breaker(error):
+    provider = limiter(requests_per_minute=6000)
+    for _ in range(5):
+        with pytest.raises(APIError):
+            provider.call(failing(error))
+    assert provider.breaker.opened_at is None
+    assert provider.rate_limited == 5
+
+
+def test_open_breaker_waits_for_the_trial_call():
+    provider = limiter(reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(APIError):
+            provider.call(failing(APIError(500)))
+    started_at = time.monotonic()
+    assert provider.call(lambda: "ok") == "ok"
+    assert time.monotonic() - started_at >= 0.15
+    assert provider.breaker.opened_at is None
+
+
+def test_open_breaker_waits_in_async_calls():
+    provider = limiter(reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(APIError):
+            provider.call(failing(APIError(500)))
+
+    async def call():
+        return "ok"
+
+    async def calls():
+        return await asyncio.gather(*(provider.call_async(call) for _ in range(3)))
+
+    assert asyncio.run(calls()) == ["ok"] * 3
+
+
+def test_rejected_request_resets_the_consecutive_failures():
+    provider = limiter()
+    with pytest.raises(APIError):
+        provider.call(failing(APIError(500)))
+    with pytest.raises(APIError):
+        provider.call(failing(APIError(400)))
+    with pytest.raises(APIError):
+        provider.call(failing(APIError(500)))
+    assert provider.breaker.opened_at is None
+
+
+def test_transient_errors_are_retried():
+    provider = ProviderLimiter("test", max_retries=3, base_delay=0, failure_threshold=10)
+    outcomes = [APIError(502), APIError(503)]
+
+    def call():
+        if outcomes:
+            raise outcomes.pop(0)
+        return "ok"
+
+    assert provider.call(call) == "ok"
+    assert provider.retries == 2
+    assert provider.breaker.failures == 0
+
+
+def test_rate_limits_lower_the_request_rate_and_successes_restore_it():
+    provider = limiter(requests_per_minute=600)
+    for _ in range(2):
+        with pytest.raises(APIError):
+            provider.call(failing(APIError(429)))
+    assert provider.request_bucket.rate_per_second * 60 == pytest.approx(150)
+    provider.request_bucket.tokens = 1000
+    for _ in range(5):
+        provider.call(lambda: "ok")
+    assert provider.request_bucket.rate_per_second * 60 == pytest.approx(300)
+    for _ in range(20):
+        provider.call(lambda: "ok")
+    assert provider.request_bucket.rate_per_second * 60 == pytest.approx(600)
+
+
+def test_rate_limits_without_a_configured_limit():
+    provider = limiter(min_requests_per_minute=60)
+    assert provider.request_bucket is None
+    with pytest.raises(APIError):
+        provider.call(failing(APIError(429)))
+    # A limit is set below the observed rate, and removed once the calls succeed again
+    assert provider.request_bucket is not None
+    assert provider.request_bucket.rate_per_second * 60 >= 60
+    provider.request_bucket.tokens = 1000
+    for _ in range(20):
+        provider.call(lambda: "ok")
+    assert provider.request_bucket is None
+
+
+def test_lowered_rate_spaces_the_calls():
+    bucket = TokenBucket(6000)
+    bucket.set_rate(600)
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import pytest
+from response_cache import CacheMissError, ResponseCache
+
+
+def cache_entries(cache_dir):
+    return sum(len(files) for _, _, files in os.walk(cache_dir))
+
+
+def test_discard_removes_the_entry(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode='on')
+    cache.put({"prompt": "a"}, "response a")
+    cache.put({"prompt": "b"}, "response b")
+    cache.discard({"prompt": "a"})
+    cache.discard({"prompt": "unknown"})
+    assert cache.get({"prompt": "a"}) is None
+    assert cache.get({"prompt": "b"}) == "response b"
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == os.path.getsize(cache._path(cache.make_key({"prompt": "b"})))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode='on')
+    cache.put({"prompt": "a"}, "x" * 100)
+    entry_size = cache.stats()["bytes"]
+    cache.max_bytes = 3 * entry_size
+    cache.put({"prompt": "b"}, "y" * 100)
+    cache.put({"prompt": "c"}, "z" * 100)
+    assert cache.get({"prompt": "a"}) == "x" * 100
+    cache.put({"prompt": "d"}, "w" * 100)
+    # b is the least recently used entry
+    assert cache.stats() == {"mode": "on", "hits": 1, "misses": 0, "evictions": 1, "entries": 3, "bytes": 3 * entry_size}
+    assert cache.get({"prompt": "b"}) is None
+    assert cache_entries(tmp_path) == 3
+
+
+def test_the_order_is_kept_across_runs(tmp_path):
+    cache = ResponseCache(str(tmp_path), mode='on')
+    for index, prompt in enumerate("abc"):
+        cache.put({"prompt": prompt}, prompt * 100)
+        os.utime(cache._path(cache.make_key({"prompt": prompt})), (1000 + index, 1000 + index))
+    os.utime(cache._path(cache.make_key({"prompt": "a"})), (2000, 2000))
+
+    reopened = ResponseCache(str(tmp_path), max_bytes=cache.total_bytes, mode='on')
+    assert reopened.stats()["entries"] == 3
+    reopened.put({"prompt": "d"}, "d" * 100)
+    assert [reopened.get({"prompt": prompt}) is not None for prompt in "abcd"] == [True, False, True, True]
+
+
+def test_cache_modes(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path), mode='sometimes')
+    ResponseCache(str(tmp_path), mode='on').put({"prompt": "a"}, "cached")
+
+    off = ResponseCache(str(tmp_path), mode='off')
+    assert off.get({"prompt": "a"}) is None
+    off.put({"prompt": "b"}, "ignored")
+
+    replay = ResponseCache(str(tmp_path), mode='replay')
+    assert replay.get({"prompt": "a"}) == "cached"
+    replay.put({"prompt": "b"}, "ignored")
+    replay.discard({"prompt": "a"})
+    with pytest.raises(CacheMissError):
+        replay.get({"prompt": "b"})
+    assert replay.stats()["hits"] == 1 and replay.stats()["misses"] == 1
+    assert cache_entries(tmp_path) == 1
+
+
+def test_replayed_run_sends_no_request(mock, run_main, dataset):
+    args = ("--dataset", dataset(2), "--field", "question", "--num-questions", "2")
+    run_main(*args, RESPONSE_CACHE_MODE="on")
+    assert mock.stats()["requests"] == 2 * (2 + 4)
+
+    # The same run on a new database, every response coming from the cache
+    mock.reset_counters()
+    replay_db = str(run_main.work_dir / "replay.db")
+    run_main(*args, RESPONSE_CACHE_MODE="replay", COMPARE_MODELS_DB=replay_db)
+    assert mock.stats()["requests"] == 0
+    rows = '''SELECT question, model_evaluating, model_bot_a, score_a, score_b, explanation FROM comparisons
+        JOIN questions ON questions.id = question_id ORDER BY question, model_evaluating, model_bot_a'''
+    conn = sqlite3.connect(str(run_main.work_dir / "test.db"))
+    replay_conn = sqlite3.connect(replay_db)
+    assert len(replay_conn.execute(rows).fetchall()) == 8
+    assert replay_conn.execute(rows).fetchall() == conn.execute(rows).fetchall()
+    conn.close()
+    replay_conn.close()
+
+
+def test_unparsable_judgments_are_not_cached(mock, run_main, dataset):
+    args = ("--dataset", dataset(2), "--field", "question", "--num-questions", "2", "--resume")
+    mock.unparsable_rate = 1.0
+    run_main(*args, RESPONSE_CACHE_MODE="on")
+    assert mock.stats()["requests"] == 4 + 8
+    # Only the answers are cached
+    assert cache_entries(run_main.work_dir / "response_cache") == 4
+
+    # The skipped judgments are requested again by the next run
+    mock.unparsable_rate = 0.0
+    mock.reset_counters()
+    run_main(*args, RESPONSE_CACHE_MODE="on")
+    assert mock.stats()["requests"] == 8
+    assert cache_entries(run_main.work_dir / "response_cache") == 4 + 8
+    conn = sqlite3.connect(str(run_main.work_dir / "test.db"))
+    assert conn.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0] == 8
+    conn.close()
@@ -0,0 +1,54 @@
+import sqlite3
+from run_tracking import answer_stage, judge_stage
+
+
+def table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("questions", "answers", "comparisons", "runs", "run_questions", "run_stages")}
+    conn.close()
+    return counts
+
+
+def test_resuming_a_completed_run_sends_no_request(mock, run_main, dataset):
+    args = ("--dataset", dataset(3), "--field", "question", "--num-questions", "3")
+    run_main(*args)
+    db_path = str(run_main.work_dir / "test.db")
+    # 2 answers and 2 judges x 2 orders per question
+    assert mock.stats()["requests"] == 3 * (2 + 4)
+    before = table_counts(db_path)
+    assert before["run_stages"] == 3 * (2 + 4)
+
+    mock.reset_counters()
+    run_main(*args, "--resume")
+    assert mock.stats()["requests"] == 0
+    assert table_counts(db_path) == before
+
+
+def test_resume_sends_only_the_calls_left(mock, run_main, dataset):
+    args = ("--dataset", dataset(3), "--field", "question", "--num-questions", "3")
+    run_main(*args)
+    db_path = str(run_main.work_dir / "test.db")
+    before = table_counts(db_path)
+
+    # Interrupted run: a judgment of the last question was not made, and an answer of the first one failed
+    conn = sqlite3.connect(db_path)
+    # The questions are stored in the order their answers complete
+    first, last = (conn.execute("SELECT question_id FROM run_questions WHERE row_index = ?", (row_index,)).fetchone()[0] for row_index in (0, 2))
+    conn.execute("DELETE FROM run_stages WHERE row_index = 2 AND stage = ?", (judge_stage("Claude3", "GPT-4", "Claude3"),))
+    conn.execute("DELETE FROM comparisons WHERE question_id = ? AND model_evaluating = 'Claude3' AND model_bot_a = 'GPT-4'", (last,))
+    conn.execute("DELETE FROM run_stages WHERE row_index = 0 AND (stage = ? OR stage LIKE 'judge:%')", (answer_stage("GPT-4"),))
+    conn.execute("UPDATE answers SET answer = 'null' WHERE question_id = ? AND model = 'GPT-4'", (first,))
+    conn.execute("DELETE FROM comparisons WHERE question_id = ?", (first,))
+    conn.commit()
+    conn.close()
+
+    mock.reset_counters()
+    run_main(*args, "--resume")
+    # The missing judgment, then the failed answer and the 4 judgments of its pair
+    assert mock.stats()["requests"] == 1 + 1 + 4
+    assert table_counts(db_path) == before
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT answer FROM answers WHERE question_id = ? AND model = 'GPT-4'", (first,)).fetchone()[0] != "null"
+    assert conn.execute("SELECT question_id, COUNT(*) FROM comparisons GROUP BY question_id").fetchall() == [(1, 4), (2, 4), (3, 4)]
+    conn.close()
@@ -0,0 +1,82 @@
+import json
+import sqlite3
+from migrations import question_hash
+from run_tracking import start_run
+from sharded_run import merge_shards, seed_shard
+
+
+def add_question(conn, question, answers, judgments=()):
+    question_id = conn.execute("INSERT INTO questions (question, content_hash) VALUES (?, ?)", (question, question_hash(question))).lastrowid
+    for model, answer in answers.items():
+        conn.execute("INSERT INTO answers (question_id, model, answer) VALUES (?, ?, ?)", (question_id, model, json.dumps(answer)))
+    for judge, bot_a, bot_b, score_a, score_b in judgments:
+        conn.execute('''INSERT INTO comparisons (question_id, model_evaluating, preferred_answer, model_bot_a, model_bot_b, score_a, score_b, explanation)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (question_id, judge, bot_a if score_a >= score_b else bot_b, bot_a, bot_b, score_a, score_b, f"{judge} on {question}"))
+    conn.commit()
+    return question_id
+
+
+def all_judgments(judge_scores):
+    return [(judge, "GPT-4", "Claude3", *scores) for judge, scores in judge_scores]
+
+
+def rows(path, sql):
+    conn = sqlite3.connect(path)
+    result = conn.execute(sql).fetchall()
+    conn.close()
+    return result
+
+
+def test_merge_keeps_the_stored_answers_and_their_judgments(make_db):
+    target, conn = make_db("target.db")
+    add_question(conn, "q1", {"GPT-4": "four", "Claude3": "4"}, all_judgments([("GPT-4", (80, 90)), ("Claude3", (70, 95))]))
+    add_question(conn, "q2", {"GPT-4": None, "Claude3": "blue"})
+    shard, shard_conn = make_db("shard.db")
+    # Answered and judged again by the shard, with other answers
+    add_question(shard_conn, "q1", {"GPT-4": "It is four", "Claude3": "4"}, all_judgments([("GPT-4", (60, 60)), ("Claude3", (50, 90))]))
+    # The failed answer of the target is replaced
+    add_question(shard_conn, "q2", {"GPT-4": "sky blue", "Claude3": "blue"}, all_judgments([("GPT-4", (85, 80))]))
+    add_question(shard_conn, "q3", {"GPT-4": "yes", "Claude3": "no"}, all_judgments([("GPT-4", (90, 10))]))
+
+    counts = merge_shards([shard], target)[shard]
+    assert counts["answer_conflicts"] == 1
+    assert counts["comparison_conflicts"] == 2
+    assert counts["answers"] == 3
+    assert counts["comparisons"] == 2
+
+    assert rows(target, "SELECT question, model, answer FROM answers JOIN questions ON questions.id = question_id ORDER BY question, model") == [
+        ("q1", "Claude3", '"4"'), ("q1", "GPT-4", '"four"'),
+        ("q2", "Claude3", '"blue"'), ("q2", "GPT-4", '"sky blue"'),
+        ("q3", "Claude3", '"no"'), ("q3", "GPT-4", '"yes"'),
+    ]
+    assert rows(target, "SELECT question, COUNT(*) FROM comparisons JOIN questions ON questions.id = question_id GROUP BY question ORDER BY question") == [
+        ("q1", 2), ("q2", 1), ("q3", 1),
+    ]
+    assert rows(target, "SELECT explanation FROM comparisons WHERE question_id = 1 ORDER BY id") == [("GPT-4 on q1",), ("Claude3 on q1",)]
+    assert rows(target, "SELECT SUM(judgments) FROM comparison_summary") == [(4,)]
+
+    # Merging again adds nothing
+    counts = merge_shards([shard], target)[shard]
+    assert (counts["questions"], counts["answers"], counts["comparisons"]) == (0, 0, 0)
+    assert rows(target, "SELECT COUNT(*) FROM comparisons") == [(4,)]
+
+
+def test_seeded_shard_merges_only_its_new_work(make_db, tmp_path):
+    target, conn = make_db("target.db")
+    add_question(conn, "q1", {"GPT-4": "four", "Claude3": "4"}, all_judgments([("GPT-4", (80, 90))]))
+    run_id = start_run(target, "ds", "question", 2, created_at="2026-01-01T00:00:00")
+
+    shard = str(tmp_path / "shard.db")
+    seed_shard(target, shard)
+    shard_conn = sqlite3.connect(shard)
+    add_question(shard_conn, "q2", {"GPT-4": "yes", "Claude3": "no"}, all_judgments([("GPT-4", (90, 10))]))
+    shard_conn.close()
+    # The worker of the shard resumes its own run, not the run of the target copied with the seed
+    assert start_run(shard, "ds", "question", 2, resume=True, created_at="2026-02-01T00:00:00") != run_id
+    assert start_run(shard, "ds", "question", 2, resume=True, created_at="2026-01-01T00:00:00") == run_id
+
+    counts = merge_shards([shard], target)[shard]
+    assert counts == {"questions": 1, "answer_conflicts": 0, "answers": 2, "comparison_conflicts": 0, "comparisons": 1, "runs": 1}
+    assert rows(target, "SELECT COUNT(*) FROM answers") == [(4,)]
+    assert rows(target, "SELECT COUNT(*) FROM comparisons") == [(2,)]
+    assert rows(target, "SELECT created_at FROM runs ORDER BY id") == [("2026-01-01T00:00:00",), ("2026-02-01T00:00:00",)]
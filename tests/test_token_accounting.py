@@ -0,0 +1,93 @@
+import pytest
+from db_writer import DatabaseWriter
+from token_accounting import RunEstimate, TokenBudget, Tokenizer, load_usage_history, record_usage, request_input_tokens
+
+
+# Tokenizer without tiktoken: 4 characters per token
+@pytest.fixture
+def estimate():
+    tokenizer = Tokenizer("gpt-4")
+    tokenizer.encoding = None
+    return tokenizer
+
+
+def test_estimated_counts(estimate):
+    assert [estimate.count(text) for text in ("", None, "abc", "abcd", "abcde")] == [0, 0, 1, 1, 2]
+
+
+def test_truncation_keeps_the_beginning_and_the_end(estimate):
+    text = "".join(f"{i:04d}" for i in range(100))
+    assert estimate.truncate(text, 100) == (text, 0)
+    truncated, removed = estimate.truncate(text, 10)
+    assert removed == 90
+    assert truncated == text[:20] + "\n[... 90 tokens truncated ...]\n" + text[-20:]
+    truncated, removed = estimate.truncate(text, 10, policy="head")
+    assert truncated == text[:40] + "\n[... 90 tokens truncated ...]\n"
+
+
+def test_request_input_tokens():
+    tokenizer = Tokenizer("gpt-4")
+    request = {"system": "You are a judge.", "messages": [{"role": "user", "content": "Compare A and B."}],
+               "tools": [{"name": "record_judgment", "input_schema": {"type": "object"}}]}
+    expected = tokenizer.count("You are a judge.") + tokenizer.count("Compare A and B.") + tokenizer.count('[{"name": "record_judgment", "input_schema": {"type": "object"}}]')
+    assert request_input_tokens(request, tokenizer) == expected
+    assert request_input_tokens({"messages": []}, tokenizer) == 0
+
+
+def test_prompt_budget(estimate):
+    prompt = "x" * 400
+    assert TokenBudget().fit_prompt(prompt, estimate) == (prompt, 0, False)
+    assert TokenBudget(max_input_tokens=120).fit_prompt(prompt, estimate, fixed_tokens=20) == (prompt, 0, False)
+    assert TokenBudget(max_input_tokens=50, policy="skip").fit_prompt(prompt, estimate) == (prompt, 0, True)
+    truncated, removed, skipped = TokenBudget(max_input_tokens=50).fit_prompt(prompt, estimate, fixed_tokens=10)
+    assert (removed, skipped) == (60, False)
+    assert truncated.startswith("x" * 80) and truncated.endswith("x" * 80)
+    with pytest.raises(ValueError):
+        TokenBudget(policy="tail")
+
+
+def test_answer_budget_keeps_the_shorter_answer(estimate):
+    short, long = "s" * 40, "l" * 800
+    budget = TokenBudget(max_input_tokens=120)
+    answer_a, answer_b, removed, skipped = budget.fit_answers(short, long, estimate, fixed_tokens=20)
+    assert (answer_a, removed, skipped) == (short, 110, False)
+    assert estimate.count(answer_b.replace("\n[... 110 tokens truncated ...]\n", "")) == 90
+    assert budget.fit_answers(short, short, estimate) == (short, short, 0, False)
+    assert TokenBudget(max_input_tokens=120, policy="skip").fit_answers(short, long, estimate)[3]
+    assert (budget.output_tokens(), TokenBudget(max_answer_tokens=500, max_judgment_tokens=300).output_tokens(True)) == (None, 300)
+
+
+def test_run_estimate_costs_and_duration():
+    estimate = RunEstimate()
+    for _ in range(10):
+        estimate.add_call("GPT-4", "answer", 1000, 400, 5.0, prices=(10.0, 30.0))
+    estimate.add_call("GPT-4", "judge", 2000, 250, 3.0, prices=(10.0, 30.0))
+    calls, input_tokens, output_tokens, cost = estimate.totals()
+    assert (calls, input_tokens, output_tokens) == (11, 12000, 4250)
+    assert cost == pytest.approx((12000 * 10 + 4250 * 30) / 1e6)
+
+    # Calls in flight divide the call time; rate limits bound it from below
+    providers = {"GPT-4": "openai", "Claude3": "anthropic"}
+    assert estimate.duration(providers.get, {"openai": (4, None, None)}) == pytest.approx(53 / 4)
+    assert estimate.duration(providers.get, {"openai": (4, 22, None)}) == pytest.approx(30)
+    assert estimate.duration(providers.get, {"openai": (4, None, 16250)}) == pytest.approx(60)
+
+    # A model without prices has no cost
+    estimate.add_call("Claude3", "answer", 1000, 400, 100.0)
+    assert estimate.totals()[3] is None
+    assert estimate.duration(providers.get, {"openai": (4, None, None), "anthropic": (2, None, None)}) == pytest.approx(50)
+
+
+def test_usage_history(make_db):
+    db_path, conn = make_db()
+    writer = DatabaseWriter(db_path, batch_size=10)
+    record_usage(writer, 1, "GPT-4", "answer", {"input_tokens": 100, "output_tokens": 300, "seconds": 2.0})
+    record_usage(writer, 2, "GPT-4", "answer", {"input_tokens": 100, "output_tokens": 500, "seconds": 4.0})
+    # Cached and failed calls are not part of the averages
+    record_usage(writer, 3, "GPT-4", "answer", {"input_tokens": 100, "output_tokens": 5, "seconds": 0.0, "cached": True})
+    record_usage(writer, 4, "GPT-4", "answer", {"input_tokens": 100, "output_tokens": 0, "seconds": 30.0, "error": "timeout"})
+    record_usage(writer, 1, "Claude3", "judge", {"input_tokens": 900, "output_tokens": 200, "seconds": 1.5, "truncated_tokens": 40})
+    writer.close()
+
+    assert load_usage_history(conn) == {("GPT-4", "answer"): (400, 3.0), ("Claude3", "judge"): (200, 1.5)}
+    assert conn.execute("SELECT truncated_tokens, cached FROM token_usage WHERE model = 'Claude3'").fetchone() == (40, 0)
@@ -0,0 +1,231 @@
+import os
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+# Token accounting of the API calls: every prompt is measured with a local tokenizer before it
+# is sent, prompts above the input budget are truncated (or not sent), replies are limited to
+# the output budget, and the tokens of each call are stored in token_usage.
+# tiktoken is optional: without it, tokens are estimated at 4 characters per token. Claude
+# models have no public local tokenizer, their counts use cl100k_base as an approximation.
+
+TRUNCATION_POLICIES = ('middle', 'head', 'skip')
+# Reply sizes assumed by the dry-run estimate when no call of the model is recorded yet
+DEFAULT_ANSWER_TOKENS = 400
+DEFAULT_JUDGMENT_TOKENS = 250
+# Call latency assumed by the dry-run estimate without recorded calls
+DEFAULT_SECONDS_PER_CALL = 1.0
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 30.0
+
+
+# Counts and truncates text in tokens of one model (tiktoken encoding when available)
+class Tokenizer:
+    def __init__(self, model_id=None):
+        self.encoding = None
+        try:
+            import tiktoken
+        except ImportError:
+            tiktoken = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_id)
+            except (KeyError, TypeError):
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.name = self.encoding.name if self.encoding is not None else "estimate (4 characters per token)"
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _head(self, text, max_tokens):
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    def _tail(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[-max_tokens * 4:]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[-max_tokens:])
+
+    # Shorten text to about max_tokens tokens, keeping its beginning ('head') or its beginning
+    # and end ('middle', where the final answer usually is). Returns (text, removed tokens).
+    def truncate(self, text, max_tokens, policy='middle'):
+        tokens = self.count(text)
+        if text is None or tokens <= max_tokens:
+            return text, 0
+        removed = tokens - max_tokens
+        marker = f"\n[... {removed} tokens truncated ...]\n"
+        if policy == 'head':
+            return self._head(text, max_tokens) + marker, removed
+        return self._head(text, max_tokens - max_tokens // 2) + marker + self._tail(text, max_tokens // 2), removed
+
+
+_tokenizers = {}
+
+
+def get_tokenizer(model_id=None):
+    if model_id not in _tokenizers:
+        _tokenizers[model_id] = Tokenizer(model_id)
+    return _tokenizers[model_id]
+
+
+# Input tokens of a chat request (system prompt, messages and tool definitions)
+def request_input_tokens(request, tokenizer):
+    tokens = tokenizer.count(request.get("system") or "")
+    for message in request.get("messages", []):
+        tokens += tokenizer.count(message["content"])
+    if request.get("tools"):
+        tokens += tokenizer.count(json.dumps(request["tools"]))
+    return tokens
+
+
+# Input and output budgets of the calls (0 means no limit).
+# - max_input_tokens: prompts above it are truncated with the policy, or not sent ('skip');
+#   in the comparison prompts only the answers are shortened, the question is kept
+# - max_answer_tokens / max_judgment_tokens: max_tokens of the answer and judge requests
+class TokenBudget:
+    def __init__(self, max_input_tokens=0, max_answer_tokens=0, max_judgment_tokens=0, policy='middle'):
+        if policy not in TRUNCATION_POLICIES:
+            raise ValueError(f"Unsupported truncation policy '{policy}', expected one of {TRUNCATION_POLICIES}")
+        self.max_input_tokens = max_input_tokens
+        self.max_answer_tokens = max_answer_tokens
+        self.max_judgment_tokens = max_judgment_tokens
+        self.policy = policy
+
+    def output_tokens(self, reply_with_JSON=False):
+        return (self.max_judgment_tokens if reply_with_JSON else self.max_answer_tokens) or None
+
+    # Fit a prompt (plus fixed_tokens of system prompt) into the input budget.
+    # Returns (prompt, truncated tokens, over budget): over budget with the 'skip' policy.
+    def fit_prompt(self, prompt, tokenizer, fixed_tokens=0):
+        if not self.max_input_tokens:
+            return prompt, 0, False
+        available = self.max_input_tokens - fixed_tokens
+        if tokenizer.count(prompt) <= available:
+            return prompt, 0, False
+        if self.policy == 'skip':
+            return prompt, 0, True
+        prompt, removed = tokenizer.truncate(prompt, max(available, 0), self.policy)
+        return prompt, removed, False
+
+    # Fit two answers into what the input budget leaves after fixed_tokens (system prompt,
+    # question and instructions), giving each answer at least half of it.
+    # Returns (answer A, answer B, truncated tokens, over budget).
+    def fit_answers(self, answer_a, answer_b, tokenizer, fixed_tokens=0):
+        if not self.max_input_tokens:
+            return answer_a, answer_b, 0, False
+        available = max(self.max_input_tokens - fixed_tokens, 0)
+        tokens_a = tokenizer.count(answer_a)
+        tokens_b = tokenizer.count(answer_b)
+        if tokens_a + tokens_b <= available:
+            return answer_a, answer_b, 0, False
+        if self.policy == 'skip':
+            return answer_a, answer_b, 0, True
+        # The shorter answer is kept whole when it fits in half of the budget
+        budget_a = max(available // 2, available - tokens_b)
+        budget_b = max(available // 2, available - tokens_a)
+        answer_a, removed_a = tokenizer.truncate(answer_a, budget_a, self.policy)
+        answer_b, removed_b = tokenizer.truncate(answer_b, budget_b, self.policy)
+        return answer_a, answer_b, removed_a + removed_b, False
+
+
+def _get_int(name, default=0):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid value for {name}. Using default value of {default}.")
+        return default
+
+
+# Build the budget from the environment (.env file): MAX_INPUT_TOKENS, MAX_ANSWER_TOKENS,
+# MAX_JUDGMENT_TOKENS and TRUNCATION_POLICY (middle, head or skip)
+def create_token_budget():
+    return TokenBudget(
+        max_input_tokens=_get_int('MAX_INPUT_TOKENS'),
+        max_answer_tokens=_get_int('MAX_ANSWER_TOKENS'),
+        max_judgment_tokens=_get_int('MAX_JUDGMENT_TOKENS'),
+        policy=os.getenv('TRUNCATION_POLICY', 'middle').strip().lower(),
+    )
+
+
+# Create the token usage table (called from the migrations)
+def initialize_token_usage_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS token_usage (id INTEGER PRIMARY KEY, question_id INTEGER, model TEXT, stage TEXT, input_tokens INTEGER, output_tokens INTEGER, truncated_tokens INTEGER, seconds REAL, cached INTEGER, created_at TEXT, FOREIGN KEY(question_id) REFERENCES questions(id))''')
+
+
+# Store the usage of one call (usage as filled by the main script: input_tokens,
+# output_tokens, truncated_tokens, seconds, cached, and error for the failed calls)
+def record_usage(db_writer, question_id, model, stage, usage):
+    db_writer.write("INSERT INTO token_usage (question_id, model, stage, input_tokens, output_tokens, truncated_tokens, seconds, cached, created_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (question_id, model, stage, usage.get("input_tokens"), usage.get("output_tokens"), usage.get("truncated_tokens", 0),
+                     usage.get("seconds"), int(usage.get("cached", False)), datetime.now(timezone.utc).isoformat(), usage.get("error")))
+
+
+# Average output tokens and seconds of the calls made (not cached) by each model and stage:
+# {(model, stage): (output tokens, seconds)}
+def load_usage_history(conn):
+    try:
+        rows = conn.execute('''SELECT model, stage, AVG(output_tokens), AVG(seconds) FROM token_usage
+            WHERE cached = 0 AND output_tokens IS NOT NULL AND error IS NULL GROUP BY model, stage''').fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    return {(model, stage): (output_tokens, seconds) for model, stage, output_tokens, seconds in rows}
+
+
+# Dry-run estimate of a run, accumulated call by call with add_call, then summarized per
+# model and stage. prices are (input, output) in dollars per million tokens, or None.
+class RunEstimate:
+    def __init__(self):
+        self.rows = {}  # (model, stage) -> [calls, input tokens, output tokens, seconds, cost or None]
+
+    def add_call(self, model, stage, input_tokens, output_tokens, seconds, prices=None):
+        row = self.rows.setdefault((model, stage), [0, 0, 0, 0.0, 0.0 if prices else None])
+        row[0] += 1
+        row[1] += input_tokens
+        row[2] += output_tokens
+        row[3] += seconds
+        if prices and row[4] is not None:
+            row[4] += (input_tokens * prices[0] + output_tokens * prices[1]) / 1000000
+
+    def totals(self):
+        calls = sum(row[0] for row in self.rows.values())
+        input_tokens = sum(row[1] for row in self.rows.values())
+        output_tokens = sum(row[2] for row in self.rows.values())
+        costs = [row[4] for row in self.rows.values()]
+        cost = None if any(value is None for value in costs) else sum(costs)
+        return calls, input_tokens, output_tokens, cost
+
+    # Duration of the run: for each provider, the call time divided by its calls in flight, or
+    # the time its rate limits need for the calls and tokens, whichever is longer; providers
+    # run in parallel. limits: {provider: (calls in flight, requests/min or None, tokens/min or None)}
+    def duration(self, provider_of, limits):
+        per_provider = {}
+        for (model, _), (calls, input_tokens, output_tokens, seconds, _) in self.rows.items():
+            totals = per_provider.setdefault(provider_of(model), [0, 0, 0.0])
+            totals[0] += calls
+            totals[1] += input_tokens + output_tokens
+            totals[2] += seconds
+        durations = []
+        for provider, (calls, tokens, seconds) in per_provider.items():
+            in_flight, requests_per_minute, tokens_per_minute = limits.get(provider, (1, None, None))
+            duration = seconds / max(in_flight, 1)
+            if requests_per_minute:
+                duration = max(duration, 60 * calls / requests_per_minute)
+            if tokens_per_minute:
+                duration = max(duration, 60 * tokens / tokens_per_minute)
+            durations.append(duration)
+        return max(durations, default=0.0)
+
+    def print_summary(self, duration=None):
+        print(f"{'model':<16}{'stage':<8}{'calls':>8}{'input tokens':>14}{'output tokens':>15}{'cost ($)':>11}")
+        for (model, stage), (calls, input_tokens, output_tokens, _, cost) in self.rows.items():
+            print(f"{model:<16}{stage:<8}{calls:>8}{input_tokens:>14}{output_tokens:>15}{'n/a' if cost is None else f'{cost:.2f}':>11}")
+        calls, input_tokens, output_tokens, cost = self.totals()
+        print(f"{'total':<24}{calls:>8}{input_tokens:>14}{output_tokens:>15}{'n/a' if cost is None else f'{cost:.2f}':>11}")
+        if duration is not None:
+            print(f"Estimated duration: {duration / 60:.1f} min")